@@ -0,0 +1,61 @@
+"""Measure Gpg.decrypt_many throughput on a store encrypted to a throwaway key
+
+Run from the repo root: python -m benchmarks.bench_decrypt_many --entries 1000
+"""
+import argparse
+import shutil
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import (
+    create_gpg_home,
+    create_store,
+    encrypt_file,
+    stop_gpg_agent,
+)
+from sb_pass.gpg import DEFAULT_BATCH_WORKERS, DecryptError, Gpg
+
+
+def measure(gpg: Gpg, paths: list[Path], workers: int) -> None:
+    start = time.perf_counter()
+    failed = sum(
+        isinstance(x, DecryptError) for _, x in gpg.decrypt_many(paths, workers=workers)
+    )
+    elapsed = time.perf_counter() - start
+    print(
+        f"workers {workers:2d}  {len(paths) / elapsed:8.1f} files/s  "
+        f"{elapsed:6.2f} s  {failed} failed"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--binary", default=shutil.which("gpg"))
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=sorted({1, 2, DEFAULT_BATCH_WORKERS})
+    )
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="gpg_bench_") as tmp:
+        gpg_home = create_gpg_home(Path(tmp) / "gnupg", args.binary)
+        try:
+            # Every entry gets the same ciphertext, which is all decrypting needs
+            template = encrypt_file(
+                gpg_home, Path(tmp) / "entry.gpg", "hunter2\nuser: me\n", args.binary
+            ).read_bytes()
+            root = create_store(Path(tmp) / "store", args.entries)
+            paths = sorted(root.rglob("*.gpg"))
+            for path in paths:
+                path.write_bytes(template)
+
+            gpg = Gpg(str(gpg_home), args.binary)
+            for workers in args.workers:
+                measure(gpg, paths, workers)
+        finally:
+            stop_gpg_agent(gpg_home)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Compare decrypt latency in process against the persistent worker process
+
+Run from the repo root: python -m benchmarks.bench_gpg_worker --decrypts 50
+"""
+import argparse
+import shutil
+import statistics
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import create_gpg_home, encrypt_file, stop_gpg_agent
+from sb_pass.gpg import Gpg
+
+
+def measure(name: str, gpg: Gpg, path: Path, decrypts: int) -> None:
+    gpg.decrypt_key(path)  # warm up gpg-agent and the worker
+    timings = []
+    for _ in range(decrypts):
+        start = time.perf_counter()
+        gpg.decrypt_key(path)
+        timings.append((time.perf_counter() - start) * 1000)
+    quantiles = statistics.quantiles(timings, n=20)
+    print(
+        f"{name:<12} mean {statistics.mean(timings):7.2f} ms  "
+        f"p50 {quantiles[9]:7.2f} ms  p95 {quantiles[18]:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--decrypts", type=int, default=50)
+    parser.add_argument("--binary", default=shutil.which("gpg"))
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="gpg_bench_") as tmp:
+        gpg_home = create_gpg_home(Path(tmp) / "gnupg", args.binary)
+        path = encrypt_file(gpg_home, Path(tmp) / "entry.gpg", "hunter2\n", args.binary)
+        try:
+            start = time.perf_counter()
+            worker_gpg = Gpg(str(gpg_home), args.binary, use_worker=True)
+            print(
+                f"{'worker start':<12} {(time.perf_counter() - start) * 1000:7.2f} ms"
+            )
+            measure("in process", Gpg(str(gpg_home), args.binary), path, args.decrypts)
+            measure("worker", worker_gpg, path, args.decrypts)
+            worker_gpg.close()
+        finally:
+            stop_gpg_agent(gpg_home)
+
+
+if __name__ == "__main__":
+    main()
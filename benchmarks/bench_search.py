@@ -0,0 +1,53 @@
+"""Measure building, querying and updating the search index
+
+Run from the repo root: python -m benchmarks.bench_search --entries 50000
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.synthetic import random_names
+from sb_pass.model.search import SearchIndex
+
+
+def timed(name: str, func, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:<32} {elapsed * 1000:10.3f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=50_000)
+    args = parser.parse_args()
+
+    names = random_names(args.entries)
+    index = timed("build", lambda: SearchIndex(names))
+    tracemalloc.start()
+    measured = SearchIndex(names)
+    print(f"{'memory':<32} {tracemalloc.get_traced_memory()[0] / 2**20:10.1f} MiB")
+    tracemalloc.stop()
+    del measured
+
+    word = next(x for x in names[len(names) // 2 :] if "/" in x).split("/")[0]
+    queries = {
+        "selective word": word,
+        "word prefix": word[:3],
+        "two terms": f"{word} {names[0][:3]}",
+        "short term": word[:2],
+        "fuzzy (typo)": word[:2] + word[3:] if len(word) > 4 else word + "x",
+        "no match": "zzzzqqq",
+    }
+    for label, query in queries.items():
+        results = timed(f"search {label!r}", lambda: index.search(query), repeat=20)
+        print(f"{'':<32} {query!r} -> {len(results)} results")
+
+    added = [f"new/entry{i}" for i in range(100)]
+    timed("update (+100 / -100)", lambda: index.update(added, names[:100]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Measure how long the app takes to import and build its menu
+
+rumps, objc and Foundation are replaced by the stand-ins in tests/stubs, so this
+runs anywhere and only measures the app's own work. Each run is a fresh
+interpreter started with -X importtime.
+
+Run from the repo root: python -m benchmarks.bench_startup --entries 5000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import create_store
+
+REPO = Path(__file__).resolve().parent.parent
+STUBS = REPO / "tests" / "stubs"
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app, config
+imported = time.perf_counter()
+app.Status("bench")
+built = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "menu_ms": (built - imported) * 1000,
+    "modules": sorted(sys.modules),
+    "probed_gpg": config._default_gpg_binary_path.cache_info().currsize > 0,
+}))
+"""
+
+
+def run_startup(home: Path) -> tuple[dict, dict[str, int]]:
+    """Start the app in a new interpreter, returning its timings and import times"""
+    env = dict(
+        os.environ,
+        HOME=str(home),
+        SB_PASS_APP_SUPPORT=str(home / "support"),
+        PYTHONPATH=os.pathsep.join([str(STUBS), str(REPO / "sb_pass")]),
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode:
+        raise RuntimeError(f"Startup failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(proc.stderr)
+
+
+def parse_importtime(output: str) -> dict[str, int]:
+    """Return the cumulative import time in microseconds of each module"""
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="startup_bench_") as tmp:
+        home = Path(tmp)
+        create_store(home / ".password-store", args.entries)
+        runs = [run_startup(home) for _ in range(args.runs)]
+
+    for key in ["import_ms", "menu_ms"]:
+        values = [x[0][key] for x in runs]
+        print(
+            f"{key:<10} median {statistics.median(values):7.1f}  min {min(values):7.1f}"
+        )
+    print("slowest imports (cumulative, last run):")
+    times = runs[-1][1]
+    for name in sorted(times, key=times.get, reverse=True)[: args.top]:
+        print(f"  {times[name] / 1000:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compare a cold start full scan against loading and revalidating a saved index
+
+Run from the repo root: python -m benchmarks.bench_store_cache --entries 50000
+"""
+import argparse
+import os
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import create_store
+from sb_pass.model import store
+
+
+def timed(name: str, func):
+    start = time.perf_counter()
+    result = func()
+    print(f"{name:<24} {(time.perf_counter() - start) * 1000:10.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=50_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="store_home_") as tmp:
+        root = create_store(Path(tmp) / "store", args.entries, args.fanout, args.depth)
+        index_path = Path(tmp) / "store_index.bin"
+        # Backdate the directories so the saved mtimes are trusted
+        for directory, _, _ in os.walk(root):
+            os.utime(directory, ns=(0, 0))
+        print(f"Store with {args.entries} entries at {root}")
+
+        index = timed("full scan (no cache)", lambda: store.scan_store(root))
+        timed("save index", lambda: store.save_index(index, index_path))
+        print(f"{'index size':<24} {index_path.stat().st_size / 1024:10.1f} KiB")
+        loaded = timed(
+            "load index (menu shown)", lambda: store.load_index(index_path, root)
+        )
+        timed("revalidate in background", lambda: store.refresh_store(loaded))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Compare the previous glob based store walk against store.scan_store
+
+Run from the repo root: python -m benchmarks.bench_store_index --entries 40000
+"""
+import argparse
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import create_store
+from sb_pass.model import store
+
+
+def legacy_walk(root: Path) -> list:
+    """The glob/is_dir/is_file walk previously used by Status._create_gpg_key_entries"""
+
+    def keep(path: Path) -> bool:
+        if path.is_dir() and not path.name.startswith("."):
+            return True
+        if path.is_file() and path.suffix == ".gpg":
+            return True
+        return False
+
+    entries = sorted(
+        [x for x in root.glob("*") if keep(x)], key=lambda x: (x.is_dir(), x)
+    )
+    menu = []
+    for path in entries:
+        if path.is_file():
+            menu.append((path.stem, path))
+        elif path.is_dir():
+            menu.append([path.name, legacy_walk(path)])
+    return menu
+
+
+@contextmanager
+def count_calls(counts: Counter):
+    """Count calls to the os functions that hit the filesystem"""
+    originals = {name: getattr(os, name) for name in ("stat", "lstat", "scandir")}
+
+    def wrap(name, func):
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    for name, func in originals.items():
+        setattr(os, name, wrap(name, func))
+    try:
+        yield counts
+    finally:
+        for name, func in originals.items():
+            setattr(os, name, func)
+
+
+def run(name: str, func, root: Path) -> None:
+    counts = Counter()
+    with count_calls(counts):
+        start = time.perf_counter()
+        func(root)
+        elapsed = time.perf_counter() - start
+    calls = ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+    print(f"{name:<12} {elapsed * 1000:10.1f} ms   {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=40_000)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    with TemporaryDirectory(prefix="store_home_") as tmp:
+        root = create_store(Path(tmp), args.entries, args.fanout, args.depth)
+        print(f"Store with {args.entries} entries at {root}")
+        run("legacy", legacy_walk, root)
+        run("scan_store", store.scan_store, root)
+
+        # Backdate the directories so the refresh trusts their mtimes
+        for directory, _, _ in os.walk(root):
+            os.utime(directory, ns=(0, 0))
+        index = store.scan_store(root)
+        (root / "dir0_0" / "added.gpg").touch()
+        run("refresh", lambda _: store.refresh_store(index), root)
+
+
+if __name__ == "__main__":
+    main()
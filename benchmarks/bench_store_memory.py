@@ -0,0 +1,45 @@
+"""Measure the memory held by the store index with tracemalloc
+
+Run from the repo root: python -m benchmarks.bench_store_memory --entries 10000 50000
+"""
+import argparse
+import gc
+import tracemalloc
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from benchmarks.synthetic import create_store
+from sb_pass.model import store
+
+
+def measure(root: Path, label: str, build) -> None:
+    gc.collect()
+    tracemalloc.start()
+    node = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    entries = len(node)
+    print(
+        f"{label:<6} {entries:7d} entries  {current / 2**20:7.1f} MiB  "
+        f"{current / entries:6.0f} B/entry  (peak {peak / 2**20:.1f} MiB)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--entries", type=int, nargs="+", default=[10_000, 50_000, 200_000]
+    )
+    args = parser.parse_args()
+
+    for entries in args.entries:
+        with TemporaryDirectory(prefix="store_bench_") as tmp:
+            root = create_store(Path(tmp) / "store", entries)
+            measure(root, "scan", lambda: store.scan_store(root))
+            index = Path(tmp) / "store_index.bin"
+            store.save_index(store.scan_store(root), index)
+            measure(root, "load", lambda: store.load_index(index, root))
+
+
+if __name__ == "__main__":
+    main()
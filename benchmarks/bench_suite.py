@@ -0,0 +1,158 @@
+"""pytest-benchmark suite for indexing, menus, recents, search and decrypts
+
+Run from the repo root, saving results as JSON to compare across commits:
+
+    python -m pytest benchmarks/bench_suite.py --benchmark-json=bench.json
+    pytest-benchmark compare old.json bench.json
+
+See benchmarks/conftest.py for the size settings.
+"""
+import threading
+
+import pytest
+
+from benchmarks.synthetic import random_names
+from sb_pass.model import menu, recents, search, store
+
+
+def test_scan_store(benchmark, bench_store, bench_entries):
+    root = benchmark(store.scan_store, bench_store)
+
+    assert len(root) == bench_entries
+    assert all(x.recipients is not None for x in root.entries)
+
+
+def test_refresh_unchanged_store(benchmark, bench_store):
+    root = store.scan_store(bench_store)
+
+    assert benchmark(store.refresh_store, root) == []
+
+
+def test_load_index(benchmark, bench_store, tmp_path):
+    index = tmp_path / "store_index.bin"
+    store.save_index(store.scan_store(bench_store), index)
+
+    assert benchmark(store.load_index, index, bench_store) is not None
+
+
+def test_save_index(benchmark, bench_store, tmp_path):
+    root = store.scan_store(bench_store)
+
+    benchmark(store.save_index, root, tmp_path / "store_index.bin")
+
+
+def test_menu_model_apply(benchmark, bench_store):
+    """Turn a refresh's changes into menu operations with every menu opened"""
+    root = store.scan_store(bench_store)
+    model = menu.MenuModel(max_materialized=len(list(_dirs(root))))
+    for directory in _dirs(root):
+        model.opened(directory)
+    changes = [
+        store.StoreChange(directory, entry, False)
+        for directory in _dirs(root)
+        for entry in directory.entries[:1]
+    ]
+
+    ops = benchmark(lambda: model.apply(changes) + model.apply(_readded(changes)))
+
+    assert len(ops) == 2 * len(changes)
+
+
+def test_build_menu(benchmark, stub_app, bench_store):
+    """Build the main menu and open every submenu, with rumps stubbed out"""
+    app = stub_app.Status("bench")
+    _wait_for_background_threads()
+    root = app._stores[0].root
+
+    def build():
+        app.create_menu()
+        _wait_for_background_threads()
+        password_store = app._stores[0]
+        app._store_menus[password_store.path].materialize()
+        for directory in _dirs(password_store.root):
+            app._store_menus[directory.path].materialize()
+
+    # Stores are loaded, saved and search indexed on a thread pool
+    benchmark.pedantic(build, setup=_wait_for_background_threads, rounds=5)
+    _wait_for_background_threads()
+    assert len(root) == len(app._stores[0].root)
+
+
+def test_recents_add(benchmark, tmp_path):
+    names = random_names(1000)
+    lru = recents.Recents(tmp_path / "recents.json", max_items=10, save_delay=3600)
+
+    def add_all():
+        for name in names:
+            lru.add(name)
+
+    benchmark(add_all)
+    lru.flush()
+    assert len(lru) == 10
+
+
+def test_recents_save(benchmark, tmp_path):
+    lru = recents.Recents(tmp_path / "recents.json", max_items=100, save_delay=3600)
+    for name in random_names(100):
+        lru.add(name)
+
+    benchmark(lru.save)
+    lru.flush()
+
+
+def test_search_build(benchmark, bench_entries):
+    names = random_names(bench_entries)
+
+    index = benchmark(search.SearchIndex, names)
+
+    assert len(index) == bench_entries
+
+
+@pytest.mark.parametrize("query", ["git", "ab cd", "xqzv"])
+def test_search_query(benchmark, bench_entries, query):
+    index = search.SearchIndex(random_names(bench_entries))
+
+    benchmark(index.search, query)
+
+
+def test_decrypt_single(benchmark, gpg_home, gpg_binary, encrypted_paths):
+    from sb_pass.gpg import Gpg
+
+    gpg = Gpg(str(gpg_home), gpg_binary)
+
+    assert benchmark(gpg.decrypt_key, encrypted_paths[0]) == "hunter2\nuser: me\n"
+
+
+def test_decrypt_many(benchmark, gpg_home, gpg_binary, encrypted_paths):
+    from sb_pass.gpg import DecryptError, Gpg
+
+    gpg = Gpg(str(gpg_home), gpg_binary)
+
+    results = benchmark.pedantic(
+        lambda: list(gpg.decrypt_many(encrypted_paths)), rounds=3, warmup_rounds=1
+    )
+
+    assert not any(isinstance(x, DecryptError) for _, x in results)
+    benchmark.extra_info["files"] = len(encrypted_paths)
+
+
+def _dirs(root: store.StoreDir):
+    """Yield every directory below root"""
+    pending = list(root.dirs)
+    while pending:
+        directory = pending.pop()
+        yield directory
+        pending.extend(directory.dirs)
+
+
+def _readded(changes: list[store.StoreChange]) -> list[store.StoreChange]:
+    return [store.StoreChange(x.parent, x.node, True) for x in changes]
+
+
+def _wait_for_background_threads() -> None:
+    """Let the store loads, index saves and search builds of create_menu finish"""
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and (
+            thread.daemon or thread.name.startswith("store-loader")
+        ):
+            thread.join(timeout=30)
@@ -0,0 +1,77 @@
+"""Fixtures for the pytest-benchmark suite in bench_suite.py
+
+Sizes are set with environment variables so runs stay comparable:
+SB_PASS_BENCH_ENTRIES (default 10000) and SB_PASS_BENCH_DECRYPTS (default 100).
+"""
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from benchmarks.fixtures import gpg_binary, gpg_home  # noqa: F401
+from benchmarks.synthetic import create_store, encrypt_file, settle
+
+REPO = Path(__file__).resolve().parent.parent
+# The recipient of every entry in bench_store
+BENCH_KEY_ID = "0123456789ABCDEF"
+
+
+@pytest.fixture(scope="session")
+def bench_entries() -> int:
+    return int(os.environ.get("SB_PASS_BENCH_ENTRIES", 10_000))
+
+
+@pytest.fixture(scope="session")
+def bench_decrypts() -> int:
+    return int(os.environ.get("SB_PASS_BENCH_DECRYPTS", 100))
+
+
+@pytest.fixture(scope="session")
+def bench_store(tmp_path_factory, bench_entries) -> Path:
+    """Return a synthetic store with hidden directories and non .gpg noise"""
+    root = create_store(
+        tmp_path_factory.mktemp("bench") / "store",
+        bench_entries,
+        hidden_dirs=bench_entries // 100,
+        noise_files=bench_entries // 10,
+        key_ids=(BENCH_KEY_ID,),
+    )
+    settle(root)
+    return root
+
+
+@pytest.fixture(scope="session")
+def encrypted_paths(tmp_path_factory, gpg_home, gpg_binary, bench_decrypts):
+    """Return bench_decrypts files encrypted to the throwaway key"""
+    root = tmp_path_factory.mktemp("bench_encrypted")
+    # Every entry gets the same ciphertext, which is all decrypting needs
+    template = encrypt_file(
+        gpg_home, root / "template.gpg", "hunter2\nuser: me\n", gpg_binary
+    ).read_bytes()
+    paths = []
+    for i in range(bench_decrypts):
+        path = root / f"entry{i}.gpg"
+        path.write_bytes(template)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture(scope="session")
+def stub_app(tmp_path_factory, bench_store):
+    """Return the app module imported against the rumps stand-ins in tests/stubs
+
+    The app's config points at bench_store. This replaces rumps for the rest of the
+    session, which is why it's only used by the benchmarks.
+    """
+    support = tmp_path_factory.mktemp("bench_support")
+    (support / "sb_pass").mkdir()
+    (support / "sb_pass" / "config.json").write_text(
+        json.dumps({"store_home": str(bench_store)})
+    )
+    os.environ["SB_PASS_APP_SUPPORT"] = str(support)
+    sys.path[:0] = [str(REPO / "tests" / "stubs"), str(REPO / "sb_pass")]
+    import app
+
+    return app
@@ -0,0 +1,23 @@
+"""gpg fixtures shared by the benchmarks and the tests, imported by both conftests"""
+import shutil
+
+import pytest
+
+from benchmarks.synthetic import create_gpg_home, stop_gpg_agent
+
+
+@pytest.fixture(scope="session")
+def gpg_binary() -> str:
+    """Return the path of the gpg binary, skipping if it isn't installed"""
+    binary = shutil.which("gpg")
+    if binary is None:
+        pytest.skip("gpg is not installed")
+    return binary
+
+
+@pytest.fixture(scope="session")
+def gpg_home(gpg_binary, tmp_path_factory) -> str:
+    """Return a GNUPGHOME holding a throwaway key without a passphrase"""
+    home = create_gpg_home(tmp_path_factory.mktemp("gnupg"), gpg_binary)
+    yield str(home)
+    stop_gpg_agent(home)
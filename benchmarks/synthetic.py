@@ -0,0 +1,115 @@
+"""Helpers for generating synthetic password stores for benchmarks"""
+import os
+import random
+import string
+import subprocess
+from pathlib import Path
+
+GPG_RECIPIENT = "bench@example.com"
+
+
+def create_store(
+    root: Path,
+    entries: int,
+    fanout: int = 10,
+    depth: int = 3,
+    hidden_dirs: int = 0,
+    noise_files: int = 0,
+    key_ids: tuple[str, ...] = (),
+) -> Path:
+    """Create a store of `entries` .gpg files spread over nested directories
+
+    The files are empty, or if key_ids are given hold just the packets naming them
+    as recipients. hidden_dirs hidden directories (like .git) holding .gpg files and
+    noise_files files without the .gpg suffix are added as well, none of which
+    should be indexed.
+    """
+    dirs = [root]
+    for level in range(depth):
+        dirs += [
+            d / f"dir{level}_{i}"
+            for d in dirs
+            if len(d.parts) - len(root.parts) == level
+            for i in range(fanout)
+        ]
+    for directory in dirs:
+        directory.mkdir(parents=True, exist_ok=True)
+    data = session_key_packets(key_ids) if key_ids else b""
+    for i in range(entries):
+        (dirs[i % len(dirs)] / f"entry{i}.gpg").write_bytes(data)
+    for i in range(hidden_dirs):
+        hidden = dirs[i % len(dirs)] / f".hidden{i}"
+        hidden.mkdir()
+        (hidden / "secret.gpg").touch()
+    for i in range(noise_files):
+        (dirs[i % len(dirs)] / f"notes{i}.txt").touch()
+    return root
+
+
+def settle(root: Path) -> None:
+    """Backdate directory and .gpg-id mtimes under root, outside the racy window
+
+    Refreshes then trust them as unchanged, so a later change is always seen.
+    """
+    for path in [root, *root.rglob("*")]:
+        if (path.is_dir() or path.name == ".gpg-id") and ".git" not in path.parts:
+            os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+
+def session_key_packets(key_ids: tuple[str, ...], key_size: int = 256) -> bytes:
+    """Return the start of a message encrypted to key_ids with RSA keys
+
+    Each public key encrypted session key packet is the size of one for a
+    key_size byte key, followed by the header of the encrypted data.
+    """
+    data = b""
+    for key_id in key_ids:
+        body = bytes([3]) + bytes.fromhex(key_id) + bytes([1]) + bytes(key_size + 2)
+        data += bytes([0xC1, 0xC0 + ((len(body) - 192) >> 8), (len(body) - 192) & 0xFF])
+        data += body
+    # Symmetrically encrypted integrity protected data, truncated
+    return data + bytes([0xD2, 2, 1, 0])
+
+
+def random_names(count: int, seed: int = 0, vocabulary: int = 2000) -> list[str]:
+    """Return count store relative entry names built from a random vocabulary"""
+    rand = random.Random(seed)
+    letters = string.ascii_lowercase
+    words = [
+        "".join(rand.choices(letters, k=rand.randint(3, 9))) for _ in range(vocabulary)
+    ]
+    names = set()
+    while len(names) < count:
+        depth = rand.randint(1, 3)
+        names.add("/".join(rand.choice(words) for _ in range(depth)) + str(len(names)))
+    return sorted(names)
+
+
+def create_gpg_home(path: Path, binary: str = "gpg") -> Path:
+    """Create a GNUPGHOME at path holding a throwaway key without a passphrase"""
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    subprocess.run(
+        [binary, "--homedir", path, "--batch", "--passphrase", ""]
+        + ["--quick-gen-key", GPG_RECIPIENT, "future-default", "default", "never"],
+        check=True,
+        capture_output=True,
+    )
+    return path
+
+
+def stop_gpg_agent(gpg_home: Path) -> None:
+    """Stop the gpg-agent started for a throwaway GNUPGHOME"""
+    subprocess.run(["gpgconf", "--homedir", gpg_home, "--kill", "gpg-agent"])
+
+
+def encrypt_file(gpg_home: Path, path: Path, text: str, binary: str = "gpg") -> Path:
+    """Encrypt text to the throwaway key, writing it to path"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    subprocess.run(
+        [binary, "--homedir", gpg_home, "--batch", "--yes", "--trust-model", "always"]
+        + ["-r", GPG_RECIPIENT, "-o", path, "-e"],
+        input=text.encode(),
+        check=True,
+        capture_output=True,
+    )
+    return path
@@ -0,0 +1,175 @@
+"""Command line access to the password store, optionally through a warm daemon"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from .config import Config
+from .daemon import (
+    Client,
+    Daemon,
+    RequestError,
+    Service,
+    default_config_path,
+    default_socket_path,
+)
+from .model import search
+
+log = logging.getLogger(__name__)
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m sb_pass",
+        description="List, search and decrypt pass entries. Requests are served by "
+        "the daemon if it's running and handled in this process otherwise, except "
+        "reencrypt, which always runs in this process.",
+    )
+    parser.add_argument(
+        "--config", type=Path, default=None, help="config.json to read settings from"
+    )
+    parser.add_argument(
+        "--socket", type=Path, default=None, help="Unix socket of the daemon"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("daemon", help="serve requests on the socket until stopped")
+    commands.add_parser("stop", help="stop the running daemon")
+    list_parser = commands.add_parser("list", help="print entry names")
+    list_parser.add_argument("prefix", nargs="?", default="")
+    search_parser = commands.add_parser("search", help="print the best matches")
+    search_parser.add_argument("query")
+    search_parser.add_argument(
+        "-n", "--limit", type=int, default=search.DEFAULT_LIMIT
+    )
+    show_parser = commands.add_parser("show", help="print a decrypted entry")
+    show_parser.add_argument("name")
+    show_parser.add_argument("field", nargs="?", help="only print this field")
+    copy_parser = commands.add_parser("copy", help="copy an entry's password")
+    copy_parser.add_argument("name")
+    copy_parser.add_argument("field", nargs="?", help="copy this field instead")
+    reencrypt_parser = commands.add_parser(
+        "reencrypt",
+        help="encrypt entries again to their .gpg-id, e.g. after changing keys",
+    )
+    reencrypt_parser.add_argument(
+        "-n", "--dry-run", action="store_true", help="only print what would change"
+    )
+    reencrypt_parser.add_argument(
+        "-j", "--workers", type=int, default=None, help="gpg processes to run at once"
+    )
+    return parser
+
+
+def _request(args: argparse.Namespace) -> dict:
+    """Return the daemon request for the parsed command line"""
+    request = {"command": args.command}
+    for key in ("prefix", "query", "limit", "name", "field"):
+        if hasattr(args, key):
+            request[key] = getattr(args, key)
+    return request
+
+
+def _serve(args: argparse.Namespace, service: Service) -> int:
+    try:
+        server = Daemon(service, args.socket)
+    except OSError as exc:
+        print(exc, file=sys.stderr)
+        service.close()
+        return 1
+    with server:
+        log.info("Serving on %s", args.socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def _reencrypt(args: argparse.Namespace, service: Service) -> int:
+    """Re-encrypt every store in this process, as it can take a while"""
+    plans = service.reencrypt_plan()
+    total = sum(len(jobs) for _, jobs in plans)
+    if args.dry_run:
+        for password_store, jobs in plans:
+            prefix = "" if len(plans) == 1 else password_store.name + "/"
+            for job in jobs:
+                print(prefix + job.name)
+        return 0
+    if not total:
+        print("Every entry is already encrypted to its .gpg-id", file=sys.stderr)
+        return 0
+
+    failed = 0
+    for password_store, jobs in plans:
+        if not jobs:
+            continue
+
+        def report(progress, name=password_store.name):
+            print(f"{name}: {progress}", file=sys.stderr)
+
+        try:
+            progress = service.reencrypt(password_store, jobs, args.workers, report)
+        except KeyboardInterrupt:
+            print("Interrupted, run reencrypt again to finish", file=sys.stderr)
+            return 130
+        failed += progress.failed
+    return 1 if failed else 0
+
+
+def _print(result) -> None:
+    if isinstance(result, list):
+        for line in result:
+            print(line)
+    elif result is not None:
+        print(result, end="" if result.endswith("\n") else "\n")
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+    level = logging.INFO if args.command == "daemon" else logging.WARNING
+    logging.basicConfig(level=level, format="%(message)s")
+    args.socket = args.socket or default_socket_path()
+    config_path = args.config or default_config_path()
+    config = Config(config_path)
+
+    if args.command == "daemon":
+        # Start from the store indexes the app caches next to config.json
+        return _serve(args, Service(config, config_path.parent))
+    if args.command == "reencrypt":
+        service = Service(config, config_path.parent, use_worker=False)
+        try:
+            return _reencrypt(args, service)
+        finally:
+            service.close()
+
+    request = _request(args)
+    try:
+        client = Client(args.socket)
+    except OSError:
+        client = None
+
+    try:
+        if client is not None:
+            with client:
+                result = client.request(**request)
+        elif args.command == "stop":
+            print("The daemon isn't running", file=sys.stderr)
+            return 1
+        else:
+            # A single request isn't worth starting a gpg worker for
+            service = Service(config, config_path.parent, use_worker=False)
+            try:
+                result = service.handle(request)
+            finally:
+                service.close()
+    except (RequestError, OSError, ValueError) as exc:
+        # ValueError is a reply that isn't valid JSON
+        print(exc, file=sys.stderr)
+        return 1
+
+    _print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
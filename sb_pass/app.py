@@ -1,29 +1,110 @@
+import functools
 import logging
+import os
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import TYPE_CHECKING
 
+import dispatch
 import gui
-import pyperclip
+import metrics
+import prefetch
 import rumps
+import secret_cache
+import watcher
 from config import Config
-from gpg import Gpg
+from model import menu as menu_model
+from model import pgp, recents, reencrypt, store, stores
+from model.entry import PASSWORD, PassEntry
+
+if TYPE_CHECKING:
+    from gpg import Gpg
 
 logging.basicConfig(stream=sys.stdout, level=logging.INFO)
 log = logging.getLogger(__name__)
 
 APP_NAME = "sb_pass"
 MAX_ATTEMPTS = 3
-MAX_RECENTS = 10
+MAX_CONCURRENT_DECRYPTS = 2
+METRICS_EXPORT_INTERVAL = 10
+MAX_STORE_LOADERS = 4
+# Stores that load within this long are shown straight away, the rest once loaded
+STORE_LOAD_WAIT = 0.5
+REENCRYPT_TITLE = "Re-encrypt Store…"
+REENCRYPT_PLANNING_TITLE = "Checking Entries to Re-encrypt…"
 
 
 class Status(rumps.App):
     def __init__(self, name, title=None, icon=None, template=None, menu=None):
         super().__init__(name, title, icon, template, menu, quit_button=None)
-        config_path = Path(rumps.application_support(APP_NAME)) / "config.json"
-        self._config = Config(config_path)
-        self._recents = gui.RecentMenuItem("Recents", max_recents=MAX_RECENTS)
-        self.create_menu(Path(self._config.store_home))
-        self._gpg: Gpg | None = None
+        metrics.configure_from_env()
+        app_support = Path(rumps.application_support(APP_NAME))
+        self._app_support = app_support
+        self._metrics_timer = rumps.Timer(self._export_metrics, METRICS_EXPORT_INTERVAL)
+        if metrics.enabled():
+            self._metrics_timer.start()
+        self._config = Config(app_support / "config.json")
+        self._recents = recents.Recents(
+            app_support / "recents.json", max_items=self._config.max_recent_items
+        )
+        self._recents_menu = gui.RecentMenuItem("Recents")
+        self._copy_field_menu = rumps.MenuItem("Copy Field")
+        self._copy_field_menu.add(rumps.MenuItem("None"))
+        self._stores: list[stores.PasswordStore] = []
+        self._watchers: list[watcher.StoreWatcher] = []
+        # Secret keys are listed once a store menu is first opened, not at startup
+        self._secret_keys_requested = False
+        self.create_menu()
+        self._restart_watcher()
+        self._store_changes_timer = rumps.Timer(self._apply_pending_store_changes, 1)
+        self._store_changes_timer.start()
+        self._gpg_lock = threading.Lock()
+        # Clients by (gpg home, gpg binary), as stores can use different keys
+        self._gpgs: dict[tuple[str, str], Gpg] = {}
+        self._decrypts: dispatch.DecryptDispatcher | None = None
+        self._decrypts_timer = rumps.Timer(self._poll_decrypts, 0.1)
+        # Set while re-encrypting, to stop it starting any more entries
+        self._reencrypt_stop: threading.Event | None = None
+        # True while the entries to re-encrypt are looked for in the background
+        self._reencrypt_planning = False
+        # Written by the planning thread, read by _poll_reencrypt_plans
+        self._reencrypt_plans: list | None = None
+        self._reencrypt_plans_timer = rumps.Timer(self._poll_reencrypt_plans, 0.1)
+        # Written by the re-encrypting thread, read by _poll_reencrypt
+        self._reencrypt_progress: reencrypt.Progress | None = None
+        self._reencrypt_results: list | None = None
+        self._reencrypt_timer = rumps.Timer(
+            self._poll_reencrypt, reencrypt.PROGRESS_INTERVAL
+        )
+        self._secrets = secret_cache.SecretCache(
+            ttl=self._config.secret_cache_ttl,
+            max_entries=self._config.secret_cache_size,
+        )
+        self._prefetcher = prefetch.Prefetcher(
+            self._prefetch_decrypt, self._secrets, self._config.prefetch_recents
+        )
+        self._subscribe_to_config()
+
+    def _subscribe_to_config(self) -> None:
+        """Apply setting changes, whether made from the menu or in config.json"""
+        config = self._config
+        config.subscribe(config.GPG_HOME, self._gpg_home_changed)
+        config.subscribe(config.GPG_BINARY_PATH, self._gpg_binary_path_changed)
+        config.subscribe(config.STORE_HOME, self._stores_changed)
+        config.subscribe(config.STORES, self._stores_changed)
+        config.subscribe(config.WATCH_STORE, self._watch_store_changed)
+        config.subscribe(config.MAX_RECENT_ITEMS, self._max_recent_items_changed)
+        config.subscribe(config.DECRYPT_TIMEOUT, self._decrypt_timeout_changed)
+        config.subscribe(
+            config.SECRET_CACHE_TTL, lambda value: setattr(self._secrets, "ttl", value)
+        )
+        config.subscribe(
+            config.SECRET_CACHE_SIZE,
+            lambda value: setattr(self._secrets, "max_entries", value),
+        )
+        config.subscribe(config.PREFETCH_RECENTS, self._prefetch_recents_changed)
 
     def _configure_gpg(self) -> bool:
         """Configure GPG class, returning True if correctly configured"""
@@ -41,27 +122,119 @@ class Status(rumps.App):
             gpg_home_path = self._get_gpg_home_path_from_user()
             self._config.gpg_home = gpg_home_path
 
-        self._gpg = Gpg(gpg_home_path=gpg_home_path, binary_path=binary_path)
+        self._decrypts = dispatch.DecryptDispatcher(
+            self._decrypt_key,
+            max_workers=MAX_CONCURRENT_DECRYPTS,
+            timeout=self._config.decrypt_timeout,
+            abort=self._abort_decrypt,
+        )
         return True
 
-    def create_menu(self, root: Path) -> list[gui.PathMenuItem]:
+    def _gpg_settings(
+        self, password_store: stores.PasswordStore | None
+    ) -> tuple[str, str]:
+        """Return the gpg home and binary a store's entries are decrypted with"""
+        gpg_home = self._config.gpg_home
+        binary_path = self._config.gpg_binary_path
+        if password_store is not None:
+            gpg_home = password_store.gpg_home or gpg_home
+            binary_path = password_store.gpg_binary_path or binary_path
+        return gpg_home, binary_path
+
+    def _gpg_for(self, path: Path) -> "Gpg":
+        """Return the gpg client for the store holding path, creating it if needed"""
+        password_store = stores.store_for_path(self._stores, path)
+        gpg_home, binary_path = self._gpg_settings(password_store)
+
+        from gpg import Gpg
+
+        with self._gpg_lock:
+            gpg = self._gpgs.get((gpg_home, binary_path))
+            if gpg is None:
+                gpg = self._gpgs[gpg_home, binary_path] = Gpg(
+                    gpg_home_path=gpg_home,
+                    binary_path=binary_path,
+                    use_worker=self._config.use_gpg_worker,
+                )
+        return gpg
+
+    def _abort_decrypt(self, thread_id: int) -> None:
+        """Kill the gpg decrypting on thread_id, whichever client started it"""
+        with self._gpg_lock:
+            gpgs = list(self._gpgs.values())
+        for gpg in gpgs:
+            if gpg.abort(thread_id):
+                return
+
+    def _close_gpgs(self) -> None:
+        """Stop every gpg client so the next decrypt creates one with new settings"""
+        with self._gpg_lock:
+            gpgs, self._gpgs = self._gpgs, {}
+        for gpg in gpgs.values():
+            gpg.close()
+
+    def create_menu(self) -> None:
         """Create the main menu"""
-        _quit = rumps.MenuItem("Quit", rumps.quit_application)
+        _quit = rumps.MenuItem("Quit", self._quit_callback)
         _reload_menu = rumps.MenuItem("Refresh Password Store", self._reload_menu)
+        _search = rumps.MenuItem("Search…", self._search_callback)
+        _cancel = rumps.MenuItem("Cancel Pending Decrypts", self._cancel_decrypts)
         self.menu.clear()
-        self._recents.reset()
+        self._stores = [
+            stores.PasswordStore(
+                x.name,
+                x.path,
+                stores.index_path(self._app_support, x.path),
+                gpg_home=x.gpg_home,
+                gpg_binary_path=x.gpg_binary_path,
+            )
+            for x in self._config.stores
+        ]
+        self._store_menus: dict[str, gui.LazyMenuItem] = {}
+        self._sync_recents_menu()
         options = self._create_options_entries()
-        gpg_keys = self._create_gpg_key_entries(root)
+        self._search_results = rumps.MenuItem("Search Results")
+        self._search_results.add(rumps.MenuItem("None"))
+        self._load_stores()
+        store_menus = [self._create_root_menu(x) for x in self._stores]
         self.menu = [
-            self._recents,
+            self._recents_menu,
+            self._copy_field_menu,
             {"Options": options},
             _reload_menu,
+            _cancel,
             None,
-            {"Passwords": gpg_keys},
+            _search,
+            self._search_results,
+            *store_menus,
             None,
             _quit,
         ]
 
+    def _load_stores(self) -> None:
+        """Load every store on a thread pool, waiting briefly for the fast ones"""
+        from concurrent.futures import ThreadPoolExecutor, wait
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(len(self._stores), MAX_STORE_LOADERS),
+            thread_name_prefix="store-loader",
+        )
+        futures = [executor.submit(self._load_store, x) for x in self._stores]
+        executor.shutdown(wait=False)
+        wait(futures, timeout=STORE_LOAD_WAIT)
+
+    def _load_store(self, password_store: stores.PasswordStore) -> None:
+        """Load a store's index, then bring it up to date and build its search index"""
+        with metrics.span("store.load"):
+            cached = password_store.load()
+        password_store.pending.put(None)
+        # A cached index is shown straight away and then checked for changes
+        if cached:
+            self._store_changed(password_store)
+        else:
+            password_store.save_index()
+        password_store.build_search_index()
+
     def _create_options_entries(self) -> list[rumps.MenuItem]:
         """Return the menu options"""
         return [
@@ -75,40 +248,340 @@ class Status(rumps.App):
                 "Set Pass Store Directory",
                 callback=self._set_pass_store_dir_callback,
             ),
+            self._create_watch_store_entry(),
+            self._create_reencrypt_entry(),
+            None,
+            self._create_toggle(
+                "Collect Diagnostics", metrics.enabled(), self._toggle_metrics_callback
+            ),
+            self._create_toggle(
+                "Profile UI Thread", metrics.profiling(), self._toggle_profile_callback
+            ),
         ]
 
-    def _create_gpg_key_entries(self, root: Path) -> list[gui.PathMenuItem]:
-        """Recursively create the menus and submenus from .gpg and directories"""
-        entries = self._get_gpg_key_paths(root)
-        menu = []
-        for path in entries:
-            if path.is_file():
-                menu.append(
-                    gui.PathMenuItem(path.stem, path, self._gpg_key_clicked_callback)
-                )
-            elif path.is_dir():
-                submenu = self._create_gpg_key_entries(path)
-                menu.append([path.name, submenu])
+    def _create_toggle(self, title: str, state: bool, callback) -> rumps.MenuItem:
+        """Return a menu item showing a check mark while state is on"""
+        item = rumps.MenuItem(title, callback=callback)
+        item.state = int(state)
+        return item
+
+    def _create_watch_store_entry(self) -> rumps.MenuItem:
+        """Return the toggle for watching the password store for changes"""
+        item = self._watch_store_item = rumps.MenuItem(
+            "Watch Password Store", callback=self._toggle_watch_store_callback
+        )
+        item.state = int(self._config.watch_store)
+        return item
+
+    def _create_reencrypt_entry(self) -> rumps.MenuItem:
+        """Return the item re-encrypting entries to their .gpg-id, or stopping it"""
+        self._reencrypt_item = rumps.MenuItem(
+            REENCRYPT_TITLE, callback=self._reencrypt_callback
+        )
+        return self._reencrypt_item
+
+    def _create_root_menu(
+        self, password_store: stores.PasswordStore
+    ) -> gui.LazyMenuItem:
+        """Create the menu of a store, which shows a placeholder until it's loaded"""
+
+        def populate() -> list[rumps.MenuItem]:
+            with password_store.lock:
+                if password_store.root is None:
+                    return [rumps.MenuItem(gui.LOADING)]
+                return self._create_gpg_key_entries(password_store, password_store.root)
+
+        def opened(_) -> None:
+            with password_store.lock:
+                if password_store.root is not None:
+                    self._store_menu_opened(password_store, password_store.root)
+
+        menu = gui.LazyMenuItem(password_store.name, populate, opened)
+        self._store_menus[password_store.path] = menu
+        return menu
+
+    def _create_store_menu(
+        self, password_store: stores.PasswordStore, root: store.StoreDir
+    ) -> gui.LazyMenuItem:
+        """Create a menu for a store directory whose items are built when opened"""
+
+        def populate() -> list[rumps.MenuItem]:
+            with password_store.lock:
+                return self._create_gpg_key_entries(password_store, root)
+
+        def opened(_) -> None:
+            with password_store.lock:
+                self._store_menu_opened(password_store, root)
+
+        menu = gui.LazyMenuItem(root.name, populate, opened)
+        self._store_menus[root.path] = menu
         return menu
 
-    def _get_gpg_key_paths(self, root: Path) -> list[Path]:
-        """Return list of GPG paths within root"""
-        entries = [x for x in root.glob("*") if self._menu_filter(x)]
-        return sorted(entries, key=lambda x: (x.is_dir(), x))
+    @metrics.timed("menu.create_entries")
+    def _create_gpg_key_entries(
+        self, password_store: stores.PasswordStore, root: store.StoreDir
+    ) -> list[rumps.MenuItem]:
+        """Create the entries and (unpopulated) submenus of a store directory"""
+        return [
+            self._create_menu_item(password_store, x)
+            for x in menu_model.menu_children(root)
+        ]
+
+    def _create_menu_item(
+        self,
+        password_store: stores.PasswordStore,
+        node: store.StoreDir | store.StoreEntry,
+    ) -> rumps.MenuItem:
+        """Create the menu item for an entry or the submenu for a directory"""
+        if isinstance(node, store.StoreDir):
+            return self._create_store_menu(password_store, node)
+        return self._create_gpg_key_entry(password_store, node)
+
+    def _store_menu_opened(
+        self, password_store: stores.PasswordStore, root: store.StoreDir
+    ) -> None:
+        """Track the menu as most recently used, dropping the items of the oldest.
+        The store's lock must be held"""
+        self._render_menu_ops(password_store, password_store.menu_model.opened(root))
+        if not self._secret_keys_requested:
+            self._secret_keys_requested = True
+            self._run_in_background(self._read_secret_keys)
+
+    def _create_gpg_key_entry(
+        self, password_store: stores.PasswordStore, entry: store.StoreEntry
+    ) -> gui.PathMenuItem:
+        """Create the menu item for a single .gpg entry, disabled if it can't be
+        decrypted with any of the secret keys. The store's lock must be held"""
+        callback = self._gpg_key_clicked_callback
+        if not password_store.can_decrypt(entry):
+            callback = None
+        return gui.PathMenuItem(entry.name, Path(entry.path), callback)
+
+    def _read_secret_keys(self) -> None:
+        """List the secret keys of each store's gpg home, to mark what they can't open
+
+        The menus are rebuilt with them by `_apply_pending_store_changes`.
+        """
+        from gpg import list_secret_keys
 
-    def _menu_filter(self, path: Path) -> bool:
-        """Return True if we want to keep the path"""
-        if path.is_dir() and not path.name.startswith("."):
-            return True
-        if path.is_file() and path.suffix == ".gpg":
-            return True
-        return False
+        key_ids = {}
+        for password_store in list(self._stores):
+            settings = gpg_home, binary_path = self._gpg_settings(password_store)
+            if settings not in key_ids:
+                keygrips = None
+                # Don't create the home, or run something else, before it's set up
+                if Path(binary_path).is_file() and Path(gpg_home).is_dir():
+                    keygrips = list_secret_keys(binary_path, gpg_home)
+                key_ids[settings] = None if keygrips is None else frozenset(keygrips)
+            with password_store.lock:
+                password_store.set_secret_key_ids(key_ids[settings])
+        log.info("Listed the secret keys of %d gpg homes", len(key_ids))
+
+    def _forget_secret_keys(self) -> None:
+        """Unmark every entry, listing the secret keys again on the next menu open"""
+        self._secret_keys_requested = False
+        for password_store in self._stores:
+            with password_store.lock:
+                password_store.set_secret_key_ids(None)
 
     def _reload_menu(self, _) -> None:
-        """Reload the menu. Refetches password store"""
-        # TODO: See if we can only refresh the passwords menu instead of everything
-        self.create_menu(Path(self._config.store_home))
-        log.info("Reloaded Menus")
+        """Refresh every store in the background, patching the menus with what changed
+
+        The changes are queued for `_apply_pending_store_changes`, like the
+        watcher's, so the UI never waits for a slow store to be read. Secret keys
+        already listed are listed again, so entries greyed out before a key was
+        imported become clickable.
+        """
+        if self._secret_keys_requested:
+            self._run_in_background(self._read_secret_keys)
+        for password_store in self._stores:
+            threading.Thread(
+                target=self._reload_store,
+                args=(password_store,),
+                name="store-refresh",
+                daemon=True,
+            ).start()
+
+    def _reload_store(self, password_store: stores.PasswordStore) -> None:
+        """Refresh a store for a menu reload, timing the whole background pass"""
+        with metrics.span("menu.reload"):
+            self._store_changed(password_store)
+
+    def _restart_watcher(self) -> None:
+        """Start or stop watching the password stores to match the config"""
+        for store_watcher in self._watchers:
+            store_watcher.stop(wait=False)
+        self._watchers = []
+
+        if self._config.watch_store:
+            for password_store in self._stores:
+                store_watcher = watcher.StoreWatcher(
+                    password_store.path,
+                    functools.partial(self._store_changed, password_store),
+                )
+                store_watcher.start()
+                self._watchers.append(store_watcher)
+
+    def _store_changed(self, password_store: stores.PasswordStore) -> None:
+        """Refresh a store's index off the UI thread, queueing changes for the menu"""
+        changes = self._refresh_store(password_store)
+        if changes:
+            password_store.save_index()
+        log.info(
+            "Refreshed %s in background with %d changes", password_store, len(changes)
+        )
+
+    @metrics.timed("store.refresh")
+    def _refresh_store(
+        self, password_store: stores.PasswordStore
+    ) -> list[store.StoreChange]:
+        """Refresh a store and its search index, queueing the changes for the menu"""
+        changes = password_store.refresh(queue_changes=True)
+        metrics.count("store.changes", len(changes))
+        return changes
+
+    def _search_callback(self, _) -> None:
+        """Search the stores and list the matching entries under Search Results"""
+        query = gui.get_search_query()
+        if not query:
+            return
+
+        matches = [
+            (
+                self._recent_name(password_store, name),
+                Path(store.entry_path(password_store.path, name)),
+            )
+            for password_store, name in stores.search(self._stores, query)
+        ]
+
+        self._search_results.clear()
+        for title, path in matches:
+            self._search_results.add(
+                gui.PathMenuItem(title, path, self._gpg_key_clicked_callback)
+            )
+        if not matches:
+            self._search_results.add(rumps.MenuItem("No matches"))
+        log.info("Found %d matches for search", len(matches))
+
+    def _recent_name(self, password_store: stores.PasswordStore, name: str) -> str:
+        """Return how an entry is named in Recents and search results
+
+        With several stores the store's name is prepended, e.g. "team/web/github".
+        """
+        if len(self._stores) == 1:
+            return name
+        return f"{password_store.name}/{name}"
+
+    def _recent_path(self, name: str) -> Path | None:
+        """Return the path of the entry named by _recent_name, if its store exists"""
+        if len(self._stores) == 1:
+            return Path(store.entry_path(self._stores[0].path, name))
+        for password_store in self._stores:
+            prefix = password_store.name + "/"
+            if name.startswith(prefix):
+                return Path(store.entry_path(password_store.path, name[len(prefix) :]))
+        return None
+
+    def _run_in_background(self, func) -> None:
+        """Run func in a daemon thread so it doesn't block the UI"""
+        threading.Thread(target=func, name=func.__name__, daemon=True).start()
+
+    def _apply_pending_store_changes(self, _) -> None:
+        """Apply loads and changes queued in the background on the UI thread"""
+        self._secrets.expire()
+        self._config.reload_if_changed()
+        for password_store in self._stores:
+            # Don't block the UI on a refresh in progress, just try again next tick
+            if not password_store.lock.acquire(blocking=False):
+                continue
+            try:
+                self._apply_queued_store_changes(password_store)
+            finally:
+                password_store.lock.release()
+
+    def _apply_queued_store_changes(self, password_store: stores.PasswordStore) -> None:
+        """Apply a store's queued loads and changes. The store's lock must be held"""
+        for changes in password_store.drain_pending():
+            if changes is None:
+                self._store_loaded(password_store)
+            else:
+                self._apply_store_changes(password_store, changes)
+        if password_store.secret_keys_changed:
+            password_store.secret_keys_changed = False
+            # Rebuilt as they're next opened, to mark entries with the new keys
+            self._render_menu_ops(password_store, password_store.menu_model.clear())
+
+    def _store_loaded(self, password_store: stores.PasswordStore) -> None:
+        """Replace the placeholder shown if the menu was opened while loading"""
+        menu = self._store_menus.get(password_store.path)
+        if menu is not None and not password_store.menu_model.is_materialized(
+            password_store.path
+        ):
+            menu.dematerialize()
+
+    def _apply_store_changes(
+        self, password_store: stores.PasswordStore, changes: list[store.StoreChange]
+    ) -> None:
+        """Patch a store's submenus with the changes from a refresh"""
+        for change in changes:
+            if not change.added:
+                self._secrets.invalidate(change.node.path)
+                self._remove_recents_below(password_store, change.node)
+        self._render_menu_ops(password_store, password_store.menu_model.apply(changes))
+
+    def _render_menu_ops(
+        self, password_store: stores.PasswordStore, ops: list[menu_model.MenuOp]
+    ) -> None:
+        """Make the menu changes decided by the menu model"""
+        for op in ops:
+            menu = self._store_menus.get(op.menu)
+            if isinstance(op, menu_model.Dematerialize):
+                if menu is not None:
+                    menu.dematerialize()
+                self._forget_store_menus_below(op.menu)
+            elif isinstance(op, menu_model.Remove):
+                del menu[op.node.name]
+                if isinstance(op.node, store.StoreDir):
+                    self._store_menus.pop(op.node.path, None)
+                    self._forget_store_menus_below(op.node.path)
+            elif op.before is not None:
+                menu.insert_before(
+                    op.before, self._create_menu_item(password_store, op.node)
+                )
+            else:
+                menu.add(self._create_menu_item(password_store, op.node))
+
+    def _remove_recents_below(
+        self,
+        password_store: stores.PasswordStore,
+        node: store.StoreDir | store.StoreEntry,
+    ) -> None:
+        """Drop a removed entry, or the entries of a removed directory, from Recents"""
+        if isinstance(node, store.StoreDir):
+            name = os.path.relpath(node.path, password_store.path)
+        else:
+            name = store.entry_name(password_store.path, node.path)
+        count = len(self._recents)
+        self._recents.discard(self._recent_name(password_store, name))
+        if len(self._recents) != count:
+            self._sync_recents_menu()
+
+    def _sync_recents_menu(self) -> None:
+        """Rebuild the Recents menu from the recents list in one update"""
+        items = []
+        for name in self._recents:
+            path = self._recent_path(name)
+            if path is not None:
+                items.append(
+                    gui.PathMenuItem(name, path, self._gpg_key_clicked_callback)
+                )
+        self._recents_menu.set_recents(items)
+
+    def _forget_store_menus_below(self, path: str) -> None:
+        """Stop tracking the menus of every directory below path"""
+        prefix = path + os.sep
+        for key in [x for x in self._store_menus if x.startswith(prefix)]:
+            del self._store_menus[key]
 
     def _set_gpg_home_path_callback(self, _) -> None:
         """Set the gpg home path from user input"""
@@ -117,7 +590,11 @@ class Status(rumps.App):
             return
 
         self._config.gpg_home = path
-        self._gpg.set_gpg_home_path(gpg_home_path=self._config.gpg_home)
+
+    def _gpg_home_changed(self, path: str) -> None:
+        """Recreate the gpg clients with the new home directory"""
+        self._close_gpgs()
+        self._forget_secret_keys()
 
     def _get_gpg_home_path_from_user(self) -> str:
         """Show prompt to get the gpg home path"""
@@ -137,8 +614,11 @@ class Status(rumps.App):
             return
 
         self._config.gpg_binary_path = path
-        if self._gpg:
-            self._gpg.set_gpg_binary_path(path=self._config.gpg_binary_path)
+
+    def _gpg_binary_path_changed(self, path: str) -> None:
+        """Recreate the gpg clients with the new binary"""
+        self._close_gpgs()
+        self._forget_secret_keys()
 
     def _get_gpg_binary_path_from_user(self) -> str:
         """Show prompt to get the GPG Binary path"""
@@ -168,8 +648,43 @@ class Status(rumps.App):
             return
 
         self._config.store_home = path
-        log.info("Set pass dir to %s", self._config.store_home)
-        self.create_menu(Path(self._config.store_home))
+
+    def _stores_changed(self, _) -> None:
+        """Rebuild everything that depends on the password store locations"""
+        log.info("Set password stores to %s", self._config.stores)
+        self._prefetcher.stop()
+        self._secrets.clear()
+        self._recents.clear()
+        self._set_copy_fields(None, None)
+        self._close_gpgs()
+        self._secret_keys_requested = False
+        self.create_menu()
+        self._restart_watcher()
+
+    def _toggle_watch_store_callback(self, _) -> None:
+        """Toggle watching the password store for changes"""
+        self._config.watch_store = not self._config.watch_store
+
+    def _watch_store_changed(self, enabled: bool) -> None:
+        """Start or stop the watcher and update the menu toggle"""
+        self._watch_store_item.state = int(enabled)
+        self._restart_watcher()
+
+    def _max_recent_items_changed(self, count: int) -> None:
+        """Resize the recents list"""
+        self._recents.max_items = count
+        self._sync_recents_menu()
+
+    def _prefetch_recents_changed(self, count: int) -> None:
+        """Prefetch a different number of recents from the next decrypt on"""
+        self._prefetcher.limit = count
+        if not count:
+            self._prefetcher.stop()
+
+    def _decrypt_timeout_changed(self, timeout: float) -> None:
+        """Apply the new timeout to decrypts submitted from now on"""
+        if self._decrypts is not None:
+            self._decrypts.timeout = timeout
 
     def _get_pass_store_dir_from_user_input(self) -> str:
         """Show prommpt to get the password store directory"""
@@ -184,34 +699,365 @@ class Status(rumps.App):
         """Callback when gpg key entry is clicked"""
         # Prefer user get to choose GPG/Create dir if it doesn't exist b/c otherwise
         # GPG will create it automatically w/ a bunch of GPG stuff
-        if not self._gpg:
-            log.info("NO _gpg")
+        if self._decrypts is None:
+            log.info("gpg is not configured yet")
             if not self._configure_gpg():
                 return
 
-        for attempt_num in range(MAX_ATTEMPTS):
-            resp = gui.get_user_passphrase(sender.path, attempt_num + 1, MAX_ATTEMPTS)
-            if resp.clicked == gui.CANCEL:
-                return
+        self._open_entry(sender)
 
-            password = self._gpg.decrypt_key(sender.path, resp.text)
-            if not password:
-                log.warning("Invalid Passphrase for %s", sender.path)
-                continue
+    def _copy_field_callback(self, sender: gui.FieldMenuItem) -> None:
+        """Decrypt the entry again and copy one of its fields"""
+        if self._decrypts is None and not self._configure_gpg():
+            return
+        self._open_entry(sender, field=sender.field)
+
+    def _show_entry_callback(self, sender: gui.PathMenuItem) -> None:
+        """Decrypt the entry again and show all of it"""
+        if self._decrypts is None and not self._configure_gpg():
+            return
+        self._open_entry(sender, clicked=gui.SHOW)
+
+    def _open_entry(
+        self, sender: gui.PathMenuItem, field: str = PASSWORD, clicked: int = gui.OK
+    ) -> None:
+        """Decrypt in the background, asking for the passphrase only if it's needed
+
+        Whether it is is found out off the UI thread, and reported back by
+        `_decrypt_finished` as a LOCKED result.
+        """
+        self._submit_decrypt(sender, clicked, None, 1, field)
 
-            if resp.clicked == gui.OK:
-                pyperclip.copy(password.split()[0])
+    def _key_state(self, path: Path) -> str:
+        """Return whether path can be decrypted without asking for a passphrase
 
-            elif resp.clicked == gui.SHOW:
-                gui.show_full_pass_contents(sender.title, password)
+        This reads path and runs gpg, so it mustn't be called on the UI thread.
+        """
+        from gpg import KEY_UNKNOWN
 
+        key_ids = pgp.recipient_key_ids(path)
+        if key_ids is None:
+            return KEY_UNKNOWN
+        known = [x for x in key_ids if x != pgp.WILDCARD_KEY_ID]
+        with metrics.span("gpg.key_state"):
+            key_state = self._gpg_for(path).key_state(
+                known, hidden=len(known) < len(key_ids)
+            )
+        metrics.count(f"gpg.key_state.{key_state}")
+        return key_state
+
+    def _request_decrypt(
+        self, sender: gui.PathMenuItem, attempt_num: int, field: str = PASSWORD
+    ) -> None:
+        """Ask for the passphrase and decrypt in the background"""
+        resp = gui.get_user_passphrase(sender.path, attempt_num, MAX_ATTEMPTS)
+        if resp.clicked == gui.CANCEL:
+            return
+        if resp.clicked not in (gui.OK, gui.SHOW):
+            log.warning("Unhandled response: %s", resp.clicked)
+            return
+        self._submit_decrypt(sender, resp.clicked, resp.text, attempt_num, field)
+
+    def _submit_decrypt(
+        self,
+        sender: gui.PathMenuItem,
+        clicked: int,
+        passphrase: str | None,
+        attempt_num: int,
+        field: str,
+    ) -> None:
+        """Decrypt in the background, calling `_decrypt_finished` when done"""
+        on_done = functools.partial(
+            self._decrypt_finished, sender, clicked, attempt_num, field
+        )
+        try:
+            self._decrypts.submit(sender.path, passphrase, on_done)
+        except dispatch.DispatchFull:
+            log.warning("Too many pending decrypts, ignoring %s", sender.path)
+            return
+        self._decrypts_timer.start()
+
+    def _decrypt_finished(
+        self,
+        sender: gui.PathMenuItem,
+        clicked: int,
+        attempt_num: int,
+        field: str,
+        result: dispatch.DecryptResult,
+    ) -> None:
+        """Copy the field or show the decrypted entry, or retry on a bad passphrase"""
+        from gpg import KEY_MISSING
+
+        metrics.count(f"decrypt.{result.status}")
+        if result.status == dispatch.CANCELLED:
+            return
+
+        if result.status == dispatch.LOCKED:
+            if result.error == KEY_MISSING:
+                gui.show_message_with_ok_button(
+                    f"{sender.title} is not encrypted to any of your secret keys.",
+                    title="No Secret Key",
+                )
             else:
-                log.warning("Unhandled response: %s", resp.clicked)
-                return
+                self._request_decrypt(sender, attempt_num, field)
+            return
 
-            self._recents.add_recent(sender)
+        if result.status == dispatch.TIMEOUT:
+            gui.show_message_with_ok_button(
+                f"Decrypting {sender.title} did not finish within "
+                f"{self._config.decrypt_timeout:g} seconds.",
+                title="Decrypt Timed Out",
+            )
             return
 
+        if result.status != dispatch.OK:
+            log.warning("Invalid Passphrase for %s", sender.path)
+            if attempt_num < MAX_ATTEMPTS:
+                self._request_decrypt(sender, attempt_num + 1, field)
+            return
+
+        entry = PassEntry(result.plaintext)
+        title = sender.title
+        password_store = stores.store_for_path(self._stores, sender.path)
+        if password_store is not None:
+            name = store.entry_name(password_store.path, sender.path)
+            title = self._recent_name(password_store, name)
+            self._recents.add(title)
+            self._sync_recents_menu()
+        if clicked == gui.OK:
+            import pyperclip
+
+            pyperclip.copy(entry.get(field) or "")
+        else:
+            gui.show_full_pass_contents(title, result.plaintext)
+        self._set_copy_fields(title, sender.path, entry)
+        # The agent is unlocked now, so decrypt what's likely to be opened next
+        recent_paths = (self._recent_path(x) for x in self._recents)
+        self._prefetcher.start(x for x in recent_paths if x is not None)
+
+    def _set_copy_fields(
+        self, title: str | None, path: Path | None, entry: PassEntry | None = None
+    ) -> None:
+        """List the field names of the last decrypted entry under Copy Field
+
+        Only the names are kept; copying one decrypts the entry again.
+        """
+        self._copy_field_menu.clear()
+        if entry is None:
+            self._copy_field_menu.add(rumps.MenuItem("None"))
+            return
+        self._copy_field_menu.add(rumps.MenuItem(f"Fields of {title}"))
+        for field in entry.field_names():
+            self._copy_field_menu.add(
+                gui.FieldMenuItem(field, path, self._copy_field_callback)
+            )
+        self._copy_field_menu.add(
+            gui.PathMenuItem("Show Entry", path, self._show_entry_callback)
+        )
+
+    def _decrypt_key(self, path: Path, passphrase: str | None) -> str:
+        """Decrypt path, using the secret cache if it holds a fresh copy
+
+        Without a passphrase, `dispatch.Locked` is raised with the key state unless
+        gpg-agent can decrypt without one. Runs on the dispatcher's threads.
+        """
+        from gpg import KEY_UNLOCKED
+
+        plaintext = self._secrets.get(path)
+        metrics.count("secret_cache.miss" if plaintext is None else "secret_cache.hit")
+        if plaintext is None:
+            if passphrase is None:
+                key_state = self._key_state(path)
+                if key_state != KEY_UNLOCKED:
+                    raise dispatch.Locked(key_state)
+            plaintext = self._gpg_for(path).decrypt_key(path, passphrase)
+            self._secrets.put(path, plaintext)
+        return plaintext
+
+    def _prefetch_decrypt(self, path: Path) -> str:
+        """Decrypt path for the prefetcher without ever prompting for a passphrase"""
+        metrics.count("prefetch.decrypt")
+        return self._gpg_for(path).decrypt_cached(path)
+
+    def _poll_decrypts(self, timer: rumps.Timer) -> None:
+        """Deliver finished decrypts on the UI thread, stopping when none are left"""
+        self._decrypts.poll()
+        if not self._decrypts.pending:
+            timer.stop()
+
+    def _quit_callback(self, _) -> None:
+        """Write anything still pending to disk and quit"""
+        self._prefetcher.stop()
+        self._config.flush()
+        self._recents.flush()
+        if metrics.enabled():
+            self._export_metrics()
+        self._save_profile()
+        rumps.quit_application()
+
+    def _toggle_metrics_callback(self, sender: rumps.MenuItem) -> None:
+        """Start or stop collecting timings, exporting them when stopped"""
+        metrics.enable(not metrics.enabled())
+        sender.state = int(metrics.enabled())
+        if metrics.enabled():
+            self._metrics_timer.start()
+        else:
+            self._metrics_timer.stop()
+            self._export_metrics()
+
+    def _export_metrics(self, _=None) -> None:
+        """Write the collected timings next to config.json"""
+        try:
+            metrics.export(self._app_support)
+        except OSError as exc:
+            log.warning("Unable to export metrics: %s", exc)
+
+    def _toggle_profile_callback(self, sender: rumps.MenuItem) -> None:
+        """Start or stop profiling the UI thread, saving the profile when stopped"""
+        if metrics.profiling():
+            self._save_profile()
+        else:
+            metrics.start_profile()
+        sender.state = int(metrics.profiling())
+
+    def _save_profile(self) -> None:
+        """Save the running profile, if any, next to config.json"""
+        if metrics.profiling():
+            name = time.strftime("profile-%Y%m%d-%H%M%S.pstats")
+            metrics.stop_profile(self._app_support / name)
+
+    def _reencrypt_callback(self, _) -> None:
+        """Re-encrypt the entries not encrypted to their .gpg-id, or stop doing so"""
+        if self._reencrypt_planning:
+            return
+        if self._reencrypt_stop is not None:
+            if gui.confirm(
+                "Stop re-encrypting? Entries already done stay re-encrypted, and "
+                "running it again carries on with the rest.",
+                "Re-encrypt Store",
+                ok="Stop",
+            ):
+                self._reencrypt_stop.set()
+            return
+        if self._decrypts is None and not self._configure_gpg():
+            return
+
+        self._reencrypt_planning = True
+        self._reencrypt_plans = None
+        self._reencrypt_item.title = REENCRYPT_PLANNING_TITLE
+        password_stores = list(self._stores)
+
+        def plan_stores() -> None:
+            plans = []
+            try:
+                for password_store in password_stores:
+                    # Picks up .gpg-id edits when the store isn't being watched
+                    password_store.refresh(queue_changes=True)
+                    gpg = self._gpg_for(Path(password_store.path, store.GPG_ID_FILE))
+                    jobs = self._plan_store(password_store, gpg)
+                    if jobs:
+                        plans.append((password_store, gpg, jobs))
+            finally:
+                self._reencrypt_plans = plans
+
+        self._run_in_background(plan_stores)
+        self._reencrypt_plans_timer.start()
+
+    def _plan_store(
+        self, password_store: stores.PasswordStore, gpg: "Gpg"
+    ) -> list[reencrypt.Job]:
+        """Return the store's entries to re-encrypt, running gpg without the lock
+
+        Each .gpg-id line runs gpg --list-keys, which can take seconds, and the UI
+        thread waits on the lock to show the store.
+        """
+        key_ids: dict[str, frozenset[str] | None] = {}
+        while True:
+            with password_store.lock:
+                if password_store.root is None:
+                    return []
+                missing = reencrypt.gpg_id_lines(password_store.root) - key_ids.keys()
+                if not missing:
+                    return reencrypt.plan(password_store.root, key_ids.get)
+            key_ids.update((x, gpg.encryption_key_ids(x)) for x in missing)
+
+    def _poll_reencrypt_plans(self, timer: rumps.Timer) -> None:
+        """Ask to re-encrypt the entries found, once they've all been looked for"""
+        plans = self._reencrypt_plans
+        if plans is None:
+            return
+
+        timer.stop()
+        self._reencrypt_planning = False
+        self._reencrypt_plans = None
+        self._reencrypt_item.title = REENCRYPT_TITLE
+        total = sum(len(jobs) for _, _, jobs in plans)
+        if not total:
+            gui.show_message_with_ok_button(
+                "Every entry is already encrypted to its .gpg-id.", "Re-encrypt Store"
+            )
+            return
+        if not gui.confirm(
+            f"{total} entries aren't encrypted to the keys in their .gpg-id. "
+            "Re-encrypt them now?",
+            "Re-encrypt Store",
+            ok="Re-encrypt",
+        ):
+            return
+
+        stop = self._reencrypt_stop = threading.Event()
+        self._reencrypt_progress = None
+        self._reencrypt_results = None
+
+        def reencrypt_stores() -> None:
+            results = []
+            try:
+                for password_store, gpg, jobs in plans:
+                    if stop.is_set():
+                        break
+                    progress = reencrypt.run(
+                        jobs, gpg.reencrypt_many, self._reencrypt_progressed, stop
+                    )
+                    results.append((password_store, progress))
+                    # Reads back the new recipients and updates the menus
+                    self._store_changed(password_store)
+            finally:
+                # Even on failure, so _poll_reencrypt stops and resets the menu item
+                self._reencrypt_results = results
+
+        self._run_in_background(reencrypt_stores)
+        self._reencrypt_timer.start()
+
+    def _reencrypt_progressed(self, progress: reencrypt.Progress) -> None:
+        """Record how far the store being re-encrypted has got, for the UI thread"""
+        self._reencrypt_progress = progress
+
+    def _poll_reencrypt(self, timer: rumps.Timer) -> None:
+        """Show how far re-encrypting has got, and a summary once it's finished"""
+        results = self._reencrypt_results
+        if results is None:
+            progress = self._reencrypt_progress
+            if progress is not None:
+                handled = progress.done + progress.failed
+                self._reencrypt_item.title = (
+                    f"Stop Re-encrypting ({handled}/{progress.total})"
+                )
+            return
+
+        timer.stop()
+        self._reencrypt_stop = None
+        self._reencrypt_item.title = REENCRYPT_TITLE
+        summary = "\n".join(f"{x.name}: {progress}" for x, progress in results)
+        log.info("Re-encrypted stores: %s", summary.replace("\n", "; "))
+        if any(progress.failed for _, progress in results):
+            summary += "\n\nSee the log for what failed."
+        gui.show_message_with_ok_button(summary, "Re-encrypt Store")
+
+    def _cancel_decrypts(self, _) -> None:
+        """Cancel any decrypts that are still running"""
+        if self._decrypts is not None:
+            self._decrypts.cancel_all()
+
 
 def main():
     app = Status("🔐")
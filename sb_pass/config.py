@@ -1,17 +1,65 @@
+import functools
 import json
 import logging
 import os
 import shutil
+import threading
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+
+try:
+    from . import metrics
+except ImportError:
+    # Imported as a top level module by the app, which runs from within sb_pass
+    import metrics
 
 log = logging.getLogger(__name__)
 
-_WHICH_GPG = shutil.which("gpg")
 _DEFAULT_GPG_HOME = os.path.expanduser("~/.gnupg")
 _DEFAULT_STORE_HOME = os.path.expanduser("~/.password-store")
-_DEFAULT_GPG_BINARY_PATH = "" if _WHICH_GPG is None else _WHICH_GPG
 _DEFAULT_MAX_RECENT_ITEMS = 10
+_DEFAULT_WATCH_STORE = False
+_DEFAULT_USE_GPG_WORKER = False
+_DEFAULT_DECRYPT_TIMEOUT = 60.0
+_DEFAULT_SECRET_CACHE_TTL = 0.0
+_DEFAULT_SECRET_CACHE_SIZE = 16
+_DEFAULT_PREFETCH_RECENTS = 0
+_DEFAULT_STORE_NAME = "Passwords"
+DEFAULT_SAVE_DELAY = 1.0
+
+
+@functools.cache
+def _default_gpg_binary_path() -> str:
+    """Return the gpg on PATH, searched for the first time it's needed"""
+    which_gpg = shutil.which("gpg")
+    return "" if which_gpg is None else which_gpg
+
+
+def _unique_name(name: str, taken: set[str]) -> str:
+    """Return name, numbered if it's already taken, and add it to taken"""
+    unique = name
+    number = 2
+    while unique in taken:
+        unique = f"{name} {number}"
+        number += 1
+    if unique != name:
+        log.warning("Store name %r is used more than once, showing %r", name, unique)
+    taken.add(unique)
+    return unique
+
+
+@dataclass(frozen=True, slots=True)
+class StoreConfig:
+    """A password store to show, with the gpg settings used to decrypt it
+
+    gpg_home and gpg_binary_path are None when the global settings apply.
+    """
+
+    name: str
+    path: str
+    gpg_home: str | None = None
+    gpg_binary_path: str | None = None
 
 
 class Config:
@@ -19,20 +67,80 @@ class Config:
     GPG_BINARY_PATH = "gpg_binary_path"
     STORE_HOME = "store_home"
     MAX_RECENT_ITEMS = "max_recent_items"
+    WATCH_STORE = "watch_store"
+    USE_GPG_WORKER = "use_gpg_worker"
+    DECRYPT_TIMEOUT = "decrypt_timeout"
+    SECRET_CACHE_TTL = "secret_cache_ttl"
+    SECRET_CACHE_SIZE = "secret_cache_size"
+    PREFETCH_RECENTS = "prefetch_recents"
+    STORES = "stores"
 
-    def __init__(self, path: Path) -> None:
+    def __init__(self, path: Path, save_delay: float = DEFAULT_SAVE_DELAY) -> None:
         self._settings_path = path
+        self._save_delay = save_delay
+        self._lock = threading.RLock()
+        self._save_timer: threading.Timer | None = None
+        self._subscribers: dict[str, list[Callable[[Any], None]]] = {}
+        self._mtime_ns: int | None = None
+        # The mtime of a settings file that couldn't be parsed, so it's only tried once
+        self._unreadable_mtime_ns: int | None = None
+        self._settings: dict = {}
         self._settings = self.reload_settings()
 
     def reload_settings(self) -> dict:
-        """Return current settings content if it exists"""
-        if not self._settings_path.exists():
-            log.info("No custom settings found at %s", self._settings_path)
-            return {}
+        """Return current settings content if it exists, writing pending changes first
 
-        with open(self._settings_path) as fin:
-            log.info("Loading custom settings from %s", self._settings_path)
-            return json.load(fin)
+        If the file can't be parsed, e.g. while another program is writing it, the
+        settings already loaded are returned instead.
+        """
+        self.flush()
+        mtime_ns, settings = self._read_settings()
+        if settings is None:
+            return dict(self._settings)
+        self._mtime_ns = mtime_ns
+        return settings
+
+    def reload_if_changed(self) -> bool:
+        """Reload settings edited on disk, returning True if they were reloaded"""
+        with self._lock:
+            if self._save_timer is not None:
+                # Our pending write wins over the external edit
+                return False
+            try:
+                mtime_ns = os.stat(self._settings_path).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns == self._mtime_ns or (
+                mtime_ns is not None and mtime_ns == self._unreadable_mtime_ns
+            ):
+                return False
+
+            log.info("Settings %s changed on disk, reloading", self._settings_path)
+            mtime_ns, settings = self._read_settings()
+            if settings is None:
+                # Keep what we have until the file is readable again
+                self._unreadable_mtime_ns = mtime_ns
+                return False
+            self._mtime_ns = mtime_ns
+            old, self._settings = self._settings, settings
+        # Subscribers see external edits the same way as assignments
+        for name in old.keys() | self._settings.keys():
+            if old.get(name) != self._settings.get(name):
+                self._notify(name)
+        return True
+
+    def subscribe(self, name: str, callback: Callable[[Any], None]) -> None:
+        """Call callback with the new value whenever setting name changes"""
+        self._subscribers.setdefault(name, []).append(callback)
+
+    def flush(self) -> None:
+        """Write pending changes to storage now"""
+        with self._lock:
+            if self._save_timer is None:
+                return
+            self._save_timer.cancel()
+            self._save_timer = None
+            self._save_settings()
 
     @property
     def store_home(self) -> str:
@@ -44,12 +152,92 @@ class Config:
 
     @property
     def max_recent_items(self) -> int:
-        return self._settings.get("max_recent_items", _DEFAULT_MAX_RECENT_ITEMS)
+        return self._settings.get(self.MAX_RECENT_ITEMS, _DEFAULT_MAX_RECENT_ITEMS)
 
     @max_recent_items.setter
     def max_recent_items(self, value: int) -> None:
         self._store_setting(self.MAX_RECENT_ITEMS, value)
 
+    @property
+    def watch_store(self) -> bool:
+        return self._settings.get(self.WATCH_STORE, _DEFAULT_WATCH_STORE)
+
+    @watch_store.setter
+    def watch_store(self, value: bool) -> None:
+        self._store_setting(self.WATCH_STORE, value)
+
+    @property
+    def use_gpg_worker(self) -> bool:
+        return self._settings.get(self.USE_GPG_WORKER, _DEFAULT_USE_GPG_WORKER)
+
+    @use_gpg_worker.setter
+    def use_gpg_worker(self, value: bool) -> None:
+        self._store_setting(self.USE_GPG_WORKER, value)
+
+    @property
+    def decrypt_timeout(self) -> float:
+        return self._settings.get(self.DECRYPT_TIMEOUT, _DEFAULT_DECRYPT_TIMEOUT)
+
+    @decrypt_timeout.setter
+    def decrypt_timeout(self, value: float) -> None:
+        self._store_setting(self.DECRYPT_TIMEOUT, value)
+
+    @property
+    def secret_cache_ttl(self) -> float:
+        return self._settings.get(self.SECRET_CACHE_TTL, _DEFAULT_SECRET_CACHE_TTL)
+
+    @secret_cache_ttl.setter
+    def secret_cache_ttl(self, value: float) -> None:
+        self._store_setting(self.SECRET_CACHE_TTL, value)
+
+    @property
+    def secret_cache_size(self) -> int:
+        return self._settings.get(self.SECRET_CACHE_SIZE, _DEFAULT_SECRET_CACHE_SIZE)
+
+    @secret_cache_size.setter
+    def secret_cache_size(self, value: int) -> None:
+        self._store_setting(self.SECRET_CACHE_SIZE, value)
+
+    @property
+    def prefetch_recents(self) -> int:
+        return self._settings.get(self.PREFETCH_RECENTS, _DEFAULT_PREFETCH_RECENTS)
+
+    @prefetch_recents.setter
+    def prefetch_recents(self, value: int) -> None:
+        self._store_setting(self.PREFETCH_RECENTS, value)
+
+    @property
+    def stores(self) -> list[StoreConfig]:
+        """Return the configured stores, or just store_home if there are none"""
+        stores = []
+        names: set[str] = set()
+        for item in self._settings.get(self.STORES) or []:
+            try:
+                path = os.path.expanduser(item["path"])
+                gpg_home = item.get(self.GPG_HOME)
+                name = item.get("name") or os.path.basename(path.rstrip("/"))
+                # Names prefix entry names in recents, which are split on "/"
+                if "/" in name:
+                    raise ValueError(name)
+                stores.append(
+                    StoreConfig(
+                        name=_unique_name(name, names),
+                        path=path,
+                        gpg_home=gpg_home and os.path.expanduser(gpg_home),
+                        gpg_binary_path=item.get(self.GPG_BINARY_PATH),
+                    )
+                )
+            except (TypeError, KeyError, AttributeError, ValueError):
+                log.warning("Ignoring invalid store %r", item)
+        return stores or [StoreConfig(_DEFAULT_STORE_NAME, self.store_home)]
+
+    @stores.setter
+    def stores(self, value: list[StoreConfig]) -> None:
+        self._store_setting(
+            self.STORES,
+            [{k: v for k, v in asdict(x).items() if v is not None} for x in value],
+        )
+
     @property
     def gpg_home(self) -> str:
         return self._settings.get(self.GPG_HOME, _DEFAULT_GPG_HOME)
@@ -60,20 +248,71 @@ class Config:
 
     @property
     def gpg_binary_path(self) -> str:
-        return self._settings.get(self.GPG_BINARY_PATH, _DEFAULT_GPG_BINARY_PATH)
+        if self.GPG_BINARY_PATH in self._settings:
+            return self._settings[self.GPG_BINARY_PATH]
+        return _default_gpg_binary_path()
 
     @gpg_binary_path.setter
     def gpg_binary_path(self, value: str) -> None:
         self._store_setting(self.GPG_BINARY_PATH, value)
 
     def _store_setting(self, name: str, value: Any) -> None:
-        """Store a setting and commit it to the backend"""
-        self._settings[name] = value
-        log.info("Updated %s to %s", name, value)
-        self._save_settings()
+        """Store a setting, schedule writing it and notify subscribers"""
+        with self._lock:
+            changed = self._settings.get(name) != value
+            self._settings[name] = value
+            log.info("Updated %s to %s", name, value)
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self._save_delay, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+        if changed:
+            self._notify(name)
+
+    def _notify(self, name: str) -> None:
+        """Call the subscribers of setting name with its current value"""
+        prop = getattr(type(self), name, None)
+        value = (
+            prop.fget(self) if isinstance(prop, property) else self._settings.get(name)
+        )
+        for callback in self._subscribers.get(name, []):
+            try:
+                callback(value)
+            except Exception:
+                log.exception("Subscriber for %s failed", name)
+
+    def _read_settings(self) -> tuple[int | None, dict | None]:
+        """Return the settings file's mtime and contents, None if it can't be parsed"""
+        try:
+            mtime_ns = os.stat(self._settings_path).st_mtime_ns
+        except OSError:
+            log.info("No custom settings found at %s", self._settings_path)
+            return None, {}
+
+        try:
+            with open(self._settings_path) as fin:
+                log.info("Loading custom settings from %s", self._settings_path)
+                settings = json.load(fin)
+        except (OSError, ValueError) as exc:
+            log.warning("Ignoring unreadable settings %s: %s", self._settings_path, exc)
+            return mtime_ns, None
+        if not isinstance(settings, dict):
+            log.warning("Ignoring invalid settings in %s", self._settings_path)
+            return mtime_ns, None
+        return mtime_ns, settings
 
+    @metrics.timed("config.save")
     def _save_settings(self) -> None:
-        """Write current settings to storage"""
-        with open(self._settings_path, "w") as fout:
-            json.dump(self._settings, fout)
+        """Atomically write current settings to storage"""
+        tmp_path = self._settings_path.with_name(self._settings_path.name + ".tmp")
+        try:
+            with open(tmp_path, "w") as fout:
+                json.dump(self._settings, fout)
+                fout.flush()
+                os.fsync(fout.fileno())
+            os.replace(tmp_path, self._settings_path)
+            self._mtime_ns = os.stat(self._settings_path).st_mtime_ns
+        except OSError as exc:
+            log.warning("Unable to write settings to %s: %s", self._settings_path, exc)
+            return
         log.info("Wrote settings to %s", self._settings_path)
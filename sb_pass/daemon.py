@@ -0,0 +1,354 @@
+import errno
+import functools
+import json
+import logging
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from .config import Config
+from .model import reencrypt, search, store, stores
+from .model.entry import PASSWORD, PassEntry
+
+log = logging.getLogger(__name__)
+
+APP_NAME = "sb_pass"
+# Scripts calling in a loop reuse the index refreshed within this many seconds
+DEFAULT_REFRESH_INTERVAL = 1.0
+# Longest request line the daemon reads. Replies, e.g. list, can be any length
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+class RequestError(Exception):
+    """A request that can't be served, reported back to the client"""
+
+
+def default_config_path() -> Path:
+    """Return the config.json shared with the status bar app"""
+    if sys.platform == "darwin":
+        support = Path("~/Library/Application Support").expanduser()
+    else:
+        support = Path(os.environ.get("XDG_CONFIG_HOME", "~/.config")).expanduser()
+    return support / APP_NAME / "config.json"
+
+
+def default_socket_path() -> Path:
+    """Return the per user socket path, in a directory only the user can access"""
+    runtime = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime) / f"{APP_NAME}-{os.getuid()}" / "daemon.sock"
+
+
+class Service:
+    """Answers list, search, show and copy from warm store indexes and gpg clients
+
+    With several stores configured, names are prefixed with the store's name as in
+    the app's Recents, e.g. "team/web/github".
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        index_dir: Path,
+        refresh_interval: float = DEFAULT_REFRESH_INTERVAL,
+        use_worker: bool = True,
+    ) -> None:
+        self._config = config
+        self._index_dir = index_dir
+        self._refresh_interval = refresh_interval
+        self._use_worker = use_worker
+        self._lock = threading.Lock()
+        self._gpgs = {}
+        self._load_stores()
+
+    def handle(self, request: dict) -> Any:
+        """Return the result of request, raising RequestError if it's invalid"""
+        command = request.get("command")
+        if command == "ping":
+            return "pong"
+        if command == "list":
+            return self.list_names(request.get("prefix", ""))
+        if command == "search":
+            return self.search(
+                _required(request, "query"), request.get("limit", search.DEFAULT_LIMIT)
+            )
+        if command == "show":
+            return self.show(_required(request, "name"), request.get("field"))
+        if command == "copy":
+            return self.copy(
+                _required(request, "name"), request.get("field") or PASSWORD
+            )
+        raise RequestError(f"Unknown command {command!r}")
+
+    def list_names(self, prefix: str = "") -> list[str]:
+        """Return the sorted names of the entries starting with prefix"""
+        with self._lock:
+            self._refresh()
+            names = (
+                self._name(x, name)
+                for x in self._stores
+                for name in store.entry_names(x.root)
+            )
+            return sorted(x for x in names if x.startswith(prefix))
+
+    def search(self, query: str, limit: int = search.DEFAULT_LIMIT) -> list[str]:
+        """Return the names best matching query"""
+        with self._lock:
+            self._refresh()
+            return [
+                self._name(x, name)
+                for x, name in stores.search(self._stores, query, limit)
+            ]
+
+    def show(self, name: str, field: str | None = None) -> str:
+        """Return the decrypted contents of entry name, or just one field of it"""
+        with self._lock:
+            self._refresh()
+            password_store, entry = self._resolve(name)
+            gpg = self._get_gpg(password_store)
+        plaintext = gpg.decrypt_key(store.entry_path(password_store.path, entry))
+        if not plaintext:
+            raise RequestError(f"Unable to decrypt {name}")
+        if field is None:
+            return plaintext
+        value = PassEntry(plaintext).get(field)
+        if value is None:
+            raise RequestError(f"{name} has no {field}")
+        return value
+
+    def copy(self, name: str, field: str = PASSWORD) -> None:
+        """Copy a field, by default the password, of entry name to the clipboard"""
+        value = self.show(name, field)
+        import pyperclip
+
+        try:
+            pyperclip.copy(value)
+        except pyperclip.PyperclipException as exc:
+            raise RequestError(f"Unable to copy: {exc}") from exc
+
+    def reencrypt_plan(self) -> list[tuple[stores.PasswordStore, list[reencrypt.Job]]]:
+        """Return the entries of each store that aren't encrypted to their .gpg-id"""
+        plans = []
+        with self._lock:
+            for password_store in self._stores:
+                gpg = self._get_gpg(password_store)
+                password_store.refresh()
+                with password_store.lock:
+                    jobs = reencrypt.plan(password_store.root, gpg.encryption_key_ids)
+                plans.append((password_store, jobs))
+        return plans
+
+    def reencrypt(
+        self,
+        password_store: stores.PasswordStore,
+        jobs: list[reencrypt.Job],
+        workers: int | None = None,
+        on_progress: Callable[[reencrypt.Progress], None] | None = None,
+        stop: threading.Event | None = None,
+    ) -> reencrypt.Progress:
+        """Encrypt jobs again to their .gpg-id, then record their new recipients"""
+        from .gpg import DEFAULT_BATCH_WORKERS
+
+        with self._lock:
+            gpg = self._get_gpg(password_store)
+        progress = reencrypt.run(
+            jobs,
+            functools.partial(
+                gpg.reencrypt_many, workers=workers or DEFAULT_BATCH_WORKERS
+            ),
+            on_progress,
+            stop,
+        )
+        password_store.refresh()
+        password_store.save_index()
+        return progress
+
+    def close(self) -> None:
+        """Stop the gpg workers that were started"""
+        for gpg in self._gpgs.values():
+            gpg.close()
+        self._gpgs.clear()
+
+    def _load_stores(self) -> None:
+        """Load every configured store, reusing the app's cached indexes"""
+        self._settings = self._config.stores
+        self._stores = [
+            stores.PasswordStore(
+                x.name,
+                x.path,
+                stores.index_path(self._index_dir, x.path),
+                gpg_home=x.gpg_home,
+                gpg_binary_path=x.gpg_binary_path,
+            )
+            for x in self._settings
+        ]
+        for password_store in self._stores:
+            # The app's index may be from long ago, so check it before serving it
+            if password_store.load():
+                password_store.refresh()
+        self._refreshed = time.monotonic()
+
+    def _refresh(self) -> None:
+        """Bring the indexes up to date unless they were refreshed very recently"""
+        if time.monotonic() - self._refreshed < self._refresh_interval:
+            return
+        self._config.reload_if_changed()
+        if self._config.stores != self._settings:
+            self.close()
+            self._load_stores()
+            return
+        for password_store in self._stores:
+            password_store.refresh()
+        self._refreshed = time.monotonic()
+
+    def _name(self, password_store: stores.PasswordStore, name: str) -> str:
+        """Return the name an entry is known by to clients"""
+        if len(self._stores) == 1:
+            return name
+        return f"{password_store.name}/{name}"
+
+    def _resolve(self, name: str) -> tuple[stores.PasswordStore, str]:
+        """Return the store and store relative name of an entry known by name"""
+        for password_store in self._stores:
+            prefix = "" if len(self._stores) == 1 else password_store.name + "/"
+            entry = name[len(prefix) :]
+            if name.startswith(prefix) and entry in password_store:
+                return password_store, entry
+        raise RequestError(f"No such entry: {name}")
+
+    def _get_gpg(self, password_store: stores.PasswordStore):
+        """Return the gpg client for a store, starting it and its worker on first use"""
+        gpg_home = password_store.gpg_home or self._config.gpg_home
+        binary_path = password_store.gpg_binary_path or self._config.gpg_binary_path
+        gpg = self._gpgs.get((gpg_home, binary_path))
+        if gpg is None:
+            from .gpg import Gpg
+
+            gpg = self._gpgs[gpg_home, binary_path] = Gpg(
+                gpg_home, binary_path, use_worker=self._use_worker
+            )
+        return gpg
+
+
+def _required(request: dict, key: str) -> Any:
+    """Return request[key], raising RequestError if it's missing"""
+    if key not in request:
+        raise RequestError(f"Missing {key!r}")
+    return request[key]
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serve newline delimited JSON requests until the client disconnects"""
+
+    def handle(self) -> None:
+        while True:
+            line = self.rfile.readline(MAX_REQUEST_SIZE + 1)
+            if not line:
+                return
+            if len(line) > MAX_REQUEST_SIZE:
+                # The rest of the line can't be told apart from the next request
+                self._reply({"ok": False, "error": "Request too large"})
+                return
+            self._reply(self.server.respond(line))
+
+    def _reply(self, response: dict) -> None:
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        self.wfile.flush()
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve a Service on a Unix domain socket only the current user can reach"""
+
+    daemon_threads = True
+
+    def __init__(self, service: Service, path: Path) -> None:
+        self.service = service
+        self.path = path
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.chmod(path.parent, 0o700)
+        if path.exists():
+            # Only take over the socket of a daemon that has gone away
+            if _is_served(path):
+                raise OSError(errno.EADDRINUSE, f"A daemon is already serving {path}")
+            path.unlink()
+        super().__init__(os.fspath(path), _Handler)
+        os.chmod(path, 0o600)
+
+    def respond(self, line: bytes) -> dict:
+        """Return the response to one raw request line"""
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("Requests must be JSON objects")
+            if request.get("command") == "stop":
+                threading.Thread(target=self.shutdown, daemon=True).start()
+                return {"ok": True, "result": None}
+            return {"ok": True, "result": self.service.handle(request)}
+        except (RequestError, ValueError) as exc:
+            return {"ok": False, "error": str(exc)}
+        except Exception as exc:
+            log.exception("Request failed")
+            return {"ok": False, "error": f"Internal error: {exc}"}
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.service.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _is_served(path: Path) -> bool:
+    """Return True if something accepts connections on the socket at path"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(1.0)
+        try:
+            sock.connect(os.fspath(path))
+        except TimeoutError:
+            # A listener too busy to accept is still a listener
+            return True
+        except OSError:
+            return False
+    return True
+
+
+class Client:
+    """Sends requests to a running daemon"""
+
+    def __init__(self, path: Path, timeout: float = 30.0) -> None:
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.connect(os.fspath(path))
+        except OSError:
+            self._sock.close()
+            raise
+        self._file = self._sock.makefile("rwb")
+
+    def request(self, command: str, **kwargs) -> Any:
+        """Return the result of command, raising RequestError if it failed"""
+        self._file.write(json.dumps({"command": command, **kwargs}).encode() + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line.endswith(b"\n"):
+            raise RequestError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RequestError(response["error"])
+        return response["result"]
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,229 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+DEFAULT_TIMEOUT = 60.0
+
+OK = "ok"
+FAILED = "failed"
+TIMEOUT = "timeout"
+CANCELLED = "cancelled"
+LOCKED = "locked"
+
+
+class DispatchFull(Exception):
+    """Raised when too many decrypts are already pending"""
+
+
+class Locked(Exception):
+    """Raised by a decrypt that needs a passphrase it wasn't given
+
+    It's reported as a LOCKED result with the exception's message as the error.
+    """
+
+
+@dataclass(slots=True)
+class DecryptResult:
+    """Outcome of a decrypt request, with plaintext only when status is OK"""
+
+    path: Path
+    status: str
+    plaintext: str | None = None
+    error: str | None = None
+
+
+class DecryptRequest:
+    """Handle for a submitted decrypt, which can be cancelled until it completes"""
+
+    def __init__(
+        self,
+        path: Path,
+        on_done: Callable[[DecryptResult], None],
+        deadline: float,
+    ) -> None:
+        self.path = path
+        self.deadline = deadline
+        self._on_done = on_done
+        self._finished = False
+        # Ident of the thread decrypting, while it is
+        self._thread: int | None = None
+        # Set when the request finished while its thread was still decrypting
+        self._abandoned = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def _finish(self, result: DecryptResult) -> None:
+        """Deliver result to the callback"""
+        try:
+            self._on_done(result)
+        except Exception:
+            log.exception("Decrypt callback failed for %s", self.path)
+
+
+class DecryptDispatcher:
+    """Run decrypts on a bounded set of threads, delivering results from `poll`
+
+    `submit`, `cancel` and `poll` are called from the UI thread, and `poll` is where
+    completed, timed out and cancelled requests have their callbacks run, so the
+    callbacks may use the GUI. A decrypt that times out or is cancelled while it's
+    running is passed to `abort`, with the ident of its thread, to stop gpg. Its
+    thread is replaced straight away, so a hung gpg can't hold up other decrypts,
+    and exits once the decrypt returns.
+    """
+
+    def __init__(
+        self,
+        decrypt: Callable[[Path, str | None], str],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        timeout: float = DEFAULT_TIMEOUT,
+        abort: Callable[[int], None] | None = None,
+    ) -> None:
+        self._decrypt = decrypt
+        self._abort = abort
+        self._max_workers = max_workers
+        self._max_pending = max_pending
+        self.timeout = timeout
+        self._pending: list[DecryptRequest] = []
+        self._jobs: queue.SimpleQueue[
+            tuple[DecryptRequest, str | None] | None
+        ] = queue.SimpleQueue()
+        self._done: queue.SimpleQueue[
+            tuple[DecryptRequest, DecryptResult]
+        ] = queue.SimpleQueue()
+        # Guards each request's thread and abandoned flag
+        self._lock = threading.Lock()
+        self._workers_started = 0
+        self._shut_down = False
+
+    @property
+    def pending(self) -> int:
+        """Return the number of requests whose callbacks haven't run yet"""
+        return len(self._pending)
+
+    def submit(
+        self,
+        path: Path,
+        passphrase: str | None,
+        on_done: Callable[[DecryptResult], None],
+    ) -> DecryptRequest:
+        """Queue a decrypt of path, calling on_done from a later `poll`"""
+        if self._shut_down:
+            raise RuntimeError("Cannot submit decrypts after shutdown")
+        if len(self._pending) >= self._max_pending:
+            raise DispatchFull(f"{len(self._pending)} decrypts already pending")
+
+        request = DecryptRequest(path, on_done, time.monotonic() + self.timeout)
+        self._pending.append(request)
+        self._jobs.put((request, passphrase))
+        # Like a thread pool, threads are only started as requests need them
+        if self._workers_started < self._max_workers:
+            self._workers_started += 1
+            self._start_worker()
+        return request
+
+    def cancel(self, request: DecryptRequest) -> None:
+        """Cancel request, which is reported as CANCELLED on the next poll"""
+        self._done.put((request, DecryptResult(request.path, CANCELLED)))
+
+    def cancel_all(self) -> None:
+        """Cancel every pending request"""
+        for request in list(self._pending):
+            self.cancel(request)
+
+    def poll(self) -> int:
+        """Run the callbacks of finished and timed out requests, returning the count"""
+        delivered = 0
+        while not self._done.empty():
+            request, result = self._done.get_nowait()
+            delivered += self._deliver(request, result)
+
+        now = time.monotonic()
+        for request in [x for x in self._pending if x.deadline <= now]:
+            log.warning("Decrypting %s timed out", request.path)
+            error = f"Timed out after {self.timeout:g}s"
+            delivered += self._deliver(
+                request, DecryptResult(request.path, TIMEOUT, error=error)
+            )
+        return delivered
+
+    def shutdown(self) -> None:
+        """Cancel everything pending and stop accepting requests"""
+        self.cancel_all()
+        self.poll()
+        self._shut_down = True
+        for _ in range(self._workers_started):
+            self._jobs.put(None)
+
+    def _deliver(self, request: DecryptRequest, result: DecryptResult) -> int:
+        """Finish request with result if it's still pending, returning 1 if it was"""
+        with self._lock:
+            if request._finished:
+                return 0
+            request._finished = True
+            thread = request._thread
+            request._abandoned = thread is not None
+        self._pending.remove(request)
+        if thread is not None:
+            self._abandon(request, thread)
+        request._finish(result)
+        return 1
+
+    def _abandon(self, request: DecryptRequest, thread: int) -> None:
+        """Stop the decrypt still running for request and replace its thread"""
+        log.warning("Abandoning decrypt of %s", request.path)
+        if self._abort is not None:
+            try:
+                self._abort(thread)
+            except Exception:
+                log.exception("Unable to abort decrypting %s", request.path)
+        if not self._shut_down:
+            self._start_worker()
+
+    def _start_worker(self) -> None:
+        threading.Thread(target=self._work, name="decrypt", daemon=True).start()
+
+    def _work(self) -> None:
+        """Run queued decrypts until shut down, or until this thread is replaced"""
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            request, passphrase = job
+            with self._lock:
+                if request._finished:
+                    continue
+                request._thread = threading.get_ident()
+
+            result = self._run(request, passphrase)
+            with self._lock:
+                request._thread = None
+                abandoned = request._abandoned
+            if abandoned:
+                # Another thread has taken this one's place
+                return
+            self._done.put((request, result))
+
+    def _run(self, request: DecryptRequest, passphrase: str | None) -> DecryptResult:
+        """Decrypt on a worker thread, returning the result for the UI thread"""
+        try:
+            plaintext = self._decrypt(request.path, passphrase)
+        except Locked as exc:
+            return DecryptResult(request.path, LOCKED, error=str(exc))
+        except Exception as exc:
+            if not request.finished:
+                log.exception("Decrypting %s failed", request.path)
+            return DecryptResult(request.path, FAILED, error=str(exc))
+        if plaintext:
+            return DecryptResult(request.path, OK, plaintext=plaintext)
+        return DecryptResult(request.path, FAILED, error="Decrypt failed")
@@ -1,23 +1,467 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from multiprocessing.connection import Connection
 from pathlib import Path
+from typing import Callable, Iterable, Iterator, TypeVar
 
 import gnupg
 
+try:
+    from . import metrics
+except ImportError:
+    # Imported as a top level module by the app, which runs from within sb_pass
+    import metrics
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_BATCH_WORKERS = min(8, os.cpu_count() or 1)
+# Make gpg fail rather than show pinentry when the agent hasn't cached a passphrase
+NO_PROMPT_ARGS = ("--pinentry-mode", "error")
+AGENT_TIMEOUT = 5.0
+# The options pass encrypts entries with
+PASS_ENCRYPT_ARGS = ("--quiet", "--yes", "--compress-algo=none", "--no-encrypt-to")
+# Key validity that gpg won't encrypt to: invalid, disabled, revoked or expired
+_UNUSABLE_VALIDITY = "idre"
+
+# What `Gpg.key_state` found out about the keys an entry is encrypted to
+KEY_UNLOCKED = "unlocked"
+KEY_LOCKED = "locked"
+KEY_MISSING = "missing"
+KEY_UNKNOWN = "unknown"
+
+
+class DecryptError(Exception):
+    """A file in a batch that couldn't be decrypted"""
+
+
+class ReencryptError(Exception):
+    """A file in a batch that couldn't be encrypted again"""
+
+
+class WorkerError(Exception):
+    """Raised when the decrypt worker can't complete a request"""
+
+
+class DecryptKilled(WorkerError):
+    """Raised for a decrypt that `Gpg.abort` killed"""
+
+
+class _GPG(gnupg.GPG):
+    """gnupg.GPG that remembers the gpg process each thread is running"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._processes: dict[int, subprocess.Popen] = {}
+        self._processes_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def kill(self, thread_id: int) -> bool:
+        """Kill the gpg process thread_id is running, returning whether there was one"""
+        with self._processes_lock:
+            process = self._processes.pop(thread_id, None)
+        if process is None or process.poll() is not None:
+            return False
+        process.kill()
+        return True
+
+    def _open_subprocess(self, *args, **kwargs) -> subprocess.Popen:
+        process = super()._open_subprocess(*args, **kwargs)
+        with self._processes_lock:
+            self._processes[threading.get_ident()] = process
+        return process
+
+    def _collect_output(self, process, *args, **kwargs):
+        try:
+            return super()._collect_output(process, *args, **kwargs)
+        finally:
+            with self._processes_lock:
+                if self._processes.get(threading.get_ident()) is process:
+                    del self._processes[threading.get_ident()]
+
+
+class DecryptWorker:
+    """A long lived process that decrypts files sent to it over a pipe
+
+    The process keeps a single gnupg.GPG client, so the (potentially large) UI
+    process never forks gpg itself and the client isn't recreated per decrypt.
+    """
 
-class Gpg:
     def __init__(self, gpg_home_path: str, binary_path: str, use_agent=True) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_worker_main,
+            args=(child_conn, gpg_home_path, binary_path, use_agent),
+            name="gpg-worker",
+            daemon=True,
+        )
+        self._process.start()
+        # Only the child should hold its end, so we see EOF if it exits
+        child_conn.close()
+        self._lock = threading.Lock()
+        # Guards which thread's request the worker is running, and killed
+        self._state_lock = threading.Lock()
+        self._thread: int | None = None
+        self.killed = False
+
+    def is_alive(self) -> bool:
+        return self._process.is_alive()
+
+    def decrypt(self, path: Path, passphrase=None, extra_args=None) -> str:
+        """Decrypt path in the worker process, raising WorkerError on failure
+
+        DecryptKilled is raised if `kill` stopped this decrypt.
+        """
+        with self._lock:
+            with self._state_lock:
+                if self.killed:
+                    raise WorkerError("gpg worker was killed")
+                self._thread = threading.get_ident()
+            try:
+                self._conn.send((str(path), passphrase, extra_args))
+                ok, result = self._conn.recv()
+            except (EOFError, OSError) as exc:
+                if self.killed:
+                    raise DecryptKilled("Decrypt was stopped") from exc
+                raise WorkerError(f"gpg worker is not running: {exc!r}") from exc
+            finally:
+                with self._state_lock:
+                    self._thread = None
+        if not ok:
+            raise WorkerError(result)
+        return result
+
+    def kill(self, thread_id: int) -> bool:
+        """Kill the worker and its gpg if it's decrypting for thread_id
+
+        Returns whether it was. A killed worker refuses further requests.
+        """
+        with self._state_lock:
+            if self._thread != thread_id:
+                return False
+            self.killed = True
+            try:
+                # The worker leads its own process group, which holds its gpg
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except OSError:
+                self._process.kill()
+        return True
+
+    def stop(self) -> None:
+        """Ask the worker to exit, terminating it if it doesn't"""
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self._conn.close()
+        self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+def _worker_main(
+    conn: Connection, gpg_home_path: str, binary_path: str, use_agent: bool
+) -> None:
+    """Serve decrypt requests from conn until it's closed or sent None"""
+    os.setpgid(0, 0)
+    gpg = gnupg.GPG(gnupghome=gpg_home_path, use_agent=use_agent, gpgbinary=binary_path)
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+
+        path, passphrase, extra_args = request
+        kwargs = {"fileobj_or_path": path}
+        if passphrase:
+            kwargs["passphrase"] = passphrase
+        if extra_args:
+            kwargs["extra_args"] = list(extra_args)
+        try:
+            conn.send((True, str(gpg.decrypt_file(**kwargs))))
+        except Exception as exc:
+            conn.send((False, repr(exc)))
+
+
+def list_secret_keys(binary_path: str, gpg_home_path: str) -> dict[str, str] | None:
+    """Return the keygrip of every secret key and subkey by key ID, None on error
+
+    This runs gpg directly, so it needs neither a Gpg nor its decrypt worker.
+    """
+    output = _run_tool(
+        binary_path,
+        "--homedir",
+        gpg_home_path,
+        "--batch",
+        "--with-colons",
+        "--with-keygrip",
+        "--list-secret-keys",
+    )
+    if output is None:
+        return None
+    keygrips = {}
+    key_id = None
+    for line in output.splitlines():
+        fields = line.split(":")
+        if fields[0] in ("sec", "ssb") and len(fields) > 4:
+            key_id = fields[4]
+        elif fields[0] == "grp" and key_id is not None and len(fields) > 9:
+            keygrips[key_id] = fields[9]
+            key_id = None
+    return keygrips
+
+
+def _map_bounded(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+    max_pending: int | None,
+    thread_name_prefix: str,
+) -> Iterator[tuple[T, R]]:
+    """Yield (item, func(item)) as they finish, running func on a thread pool
+
+    At most max_pending (default twice the workers) items are started but not yet
+    yielded. The first item is run on its own, before any others start.
+    """
+    max_pending = max(1, max_pending or 2 * workers)
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        return
+    yield first, func(first)
+
+    executor = ThreadPoolExecutor(workers, thread_name_prefix=thread_name_prefix)
+    pending: dict[Future, T] = {}
+    try:
+        while True:
+            for item in items:
+                pending[executor.submit(func, item)] = item
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_tool(*args: str) -> str | None:
+    """Return the output of a gpg tool, or None if it couldn't be run or failed"""
+    try:
+        proc = subprocess.run(
+            args, capture_output=True, text=True, timeout=AGENT_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        log.warning("Unable to run %s: %s", args[0], exc)
+        return None
+    if proc.returncode:
+        log.warning("%s failed: %s", args[0], proc.stderr.strip())
+        return None
+    return proc.stdout
+
+
+class Gpg:
+    def __init__(
+        self, gpg_home_path: str, binary_path: str, use_agent=True, use_worker=False
+    ) -> None:
         self._use_agent = use_agent
+        self._use_worker = use_worker
         self._gpg_home_path = gpg_home_path
         self._gpg_binary_path = binary_path
         self._gpg = None
+        self._worker: DecryptWorker | None = None
+        self._worker_lock = threading.Lock()
+        self._worker_failed = False
+        # Secret key IDs to keygrips, loaded on the first `key_state`
+        self._keygrips: dict[str, str] | None = None
         self._create_gpg()
 
+    @metrics.timed("gpg.decrypt")
     def decrypt_key(self, path: Path, passphase=None) -> str:
         """Decrypt gpg file using optional passphrase"""
+        return self._decrypt(path, passphase)
+
+    def decrypt_cached(self, path: Path) -> str:
+        """Decrypt path only if gpg-agent has the passphrase cached, never prompting
+
+        Returns an empty string if it doesn't, as for any failed decrypt.
+        """
+        return self._decrypt(path, None, NO_PROMPT_ARGS)
+
+    def key_state(self, key_ids: Iterable[str], hidden: bool = False) -> str:
+        """Return whether gpg-agent can decrypt for one of key_ids without a prompt
+
+        KEY_UNLOCKED if the agent has the passphrase of one of the secret keys
+        cached, or one needs none, KEY_LOCKED if a passphrase is needed and
+        KEY_MISSING if none of the keys are in the keyring. KEY_UNKNOWN if the
+        agent can't be asked, or none of the keys match but hidden says there are
+        other recipients whose key IDs aren't known.
+        """
+        key_ids = [x.upper() for x in key_ids]
+        grips = self._grips_for(key_ids) if key_ids else None
+        if grips is None:
+            return KEY_UNKNOWN
+        if not grips:
+            return KEY_UNKNOWN if hidden else KEY_MISSING
+
+        keyinfo = self._agent_keyinfo(grips)
+        if keyinfo is None:
+            return KEY_UNKNOWN
+        # protection "C" is a key stored in the clear, without a passphrase
+        if any(x == "1" or protection == "C" for x, protection in keyinfo.values()):
+            return KEY_UNLOCKED
+        return KEY_LOCKED
+
+    def _grips_for(self, key_ids: list[str]) -> list[str] | None:
+        """Return the keygrips of the secret keys among key_ids, None on error"""
+        if self._keygrips is None:
+            self._keygrips = self._list_keygrips()
+        elif not any(x in self._keygrips for x in key_ids):
+            # The key may have been imported since the keygrips were listed
+            self._keygrips = self._list_keygrips()
+        if self._keygrips is None:
+            return None
+        return [self._keygrips[x] for x in key_ids if x in self._keygrips]
+
+    def _list_keygrips(self) -> dict[str, str] | None:
+        """Return the keygrip of every secret key and subkey by key ID, None on error"""
+        return list_secret_keys(self._gpg_binary_path, self._gpg_home_path)
+
+    def _agent_keyinfo(self, grips: list[str]) -> dict[str, tuple[str, str]] | None:
+        """Return the agent's (cached, protection) flags by keygrip, None on error"""
+        connect_agent = os.path.join(
+            os.path.dirname(self._gpg_binary_path), "gpg-connect-agent"
+        )
+        if not os.path.isfile(connect_agent):
+            connect_agent = shutil.which("gpg-connect-agent")
+            if connect_agent is None:
+                return None
+
+        # --no-autostart as an agent that isn't running has nothing cached
+        commands = [f"KEYINFO {x}" for x in grips]
+        output = _run_tool(
+            connect_agent,
+            "--homedir",
+            self._gpg_home_path,
+            "--no-autostart",
+            *commands,
+            "/bye",
+        )
+        if output is None:
+            return None
+        keyinfo = {}
+        for line in output.splitlines():
+            # S KEYINFO <keygrip> <type> <serialno> <idstr> <cached> <protection> ...
+            fields = line.split()
+            if fields[:2] == ["S", "KEYINFO"] and len(fields) > 7:
+                keyinfo[fields[2]] = (fields[6], fields[7])
+        return keyinfo
+
+    def _decrypt(self, path: Path, passphrase=None, extra_args=None) -> str:
+        """Decrypt path in the worker if there is one, otherwise in process"""
+        worker = self._get_worker()
+        while worker is not None:
+            try:
+                return worker.decrypt(path, passphrase, extra_args)
+            except DecryptKilled:
+                raise
+            except WorkerError as exc:
+                if worker.killed:
+                    # Killed for another decrypt before this one was sent
+                    worker = self._get_worker()
+                    continue
+                log.warning("gpg worker failed, decrypting in process: %s", exc)
+                self._worker_failed = True
+                self._stop_worker()
+                break
+
         kwargs = {"fileobj_or_path": str(path)}
-        if passphase:
-            kwargs["passphrase"] = passphase
+        if passphrase:
+            kwargs["passphrase"] = passphrase
+        if extra_args:
+            kwargs["extra_args"] = list(extra_args)
         return str(self._gpg.decrypt_file(**kwargs))
 
+    def decrypt_many(
+        self,
+        paths: Iterable[Path],
+        passphrase=None,
+        workers: int = DEFAULT_BATCH_WORKERS,
+        max_pending: int | None = None,
+    ) -> Iterator[tuple[Path, str | DecryptError]]:
+        """Decrypt paths in parallel, yielding (path, plaintext or error) as they finish
+
+        At most max_pending (default twice the workers) decrypts are started but not
+        yet yielded, so only that many plaintexts are held at once. The first path is
+        decrypted on its own so the agent is unlocked once rather than prompting from
+        every worker.
+        """
+        return _map_bounded(
+            lambda path: self._decrypt_one(path, passphrase),
+            paths,
+            workers,
+            max_pending,
+            "decrypt-many",
+        )
+
+    def reencrypt_many(
+        self,
+        jobs: Iterable[tuple[Path, tuple[str, ...]]],
+        workers: int = DEFAULT_BATCH_WORKERS,
+        max_pending: int | None = None,
+    ) -> Iterator[tuple[tuple[Path, tuple[str, ...]], ReencryptError | None]]:
+        """Encrypt each (path, recipients) again in parallel, yielding errors or None
+
+        Each file is decrypted by one gpg process piped straight into another
+        encrypting it, as pass does, so the plaintext never passes through Python.
+        The result is written next to the file and renamed over it, so a file is
+        either untouched or completely re-encrypted, even if this is interrupted.
+        As for decrypt_many the first job runs alone so the agent prompts once.
+        """
+        return _map_bounded(
+            lambda job: self._reencrypt_one(*job),
+            jobs,
+            workers,
+            max_pending,
+            "reencrypt-many",
+        )
+
+    def encryption_key_ids(self, recipient: str) -> frozenset[str] | None:
+        """Return the key IDs gpg may encrypt to for recipient, e.g. from a .gpg-id
+
+        None if gpg can't be run or knows no usable key for recipient.
+        """
+        output = _run_tool(
+            self._gpg_binary_path,
+            "--homedir",
+            self._gpg_home_path,
+            "--batch",
+            "--with-colons",
+            "--list-keys",
+            "--",
+            recipient,
+        )
+        key_ids = set()
+        for line in (output or "").splitlines():
+            fields = line.split(":")
+            if fields[0] not in ("pub", "sub") or len(fields) < 12:
+                continue
+            if "e" in fields[11] and fields[1] not in _UNUSABLE_VALIDITY:
+                key_ids.add(fields[4])
+        return frozenset(key_ids) or None
+
     def set_gpg_home_path(self, path: str) -> None:
         """Recreate GPG interface with the new homedir"""
         self._gpg_home_path = path
@@ -28,10 +472,108 @@ class Gpg:
         self._gpg_binary_path = path
         self._create_gpg()
 
+    def abort(self, thread_id: int) -> bool:
+        """Kill the gpg decrypting for thread_id, returning whether there was one
+
+        With a worker, the worker is killed and the next decrypt starts another.
+        """
+        with self._worker_lock:
+            worker = self._worker
+            if worker is not None and worker.kill(thread_id):
+                self._worker = None
+                return True
+        return self._gpg.kill(thread_id)
+
+    def close(self) -> None:
+        """Stop the worker process if there is one"""
+        self._stop_worker()
+
+    def _decrypt_one(self, path: Path, passphrase=None) -> str | DecryptError:
+        """Decrypt path in process, returning the error rather than raising it"""
+        kwargs = {"fileobj_or_path": str(path)}
+        if passphrase:
+            kwargs["passphrase"] = passphrase
+        try:
+            crypt = self._gpg.decrypt_file(**kwargs)
+        except Exception as exc:
+            return DecryptError(f"Unable to decrypt {path}: {exc!r}")
+        if not crypt.ok:
+            return DecryptError(f"Unable to decrypt {path}: {crypt.status}")
+        return str(crypt)
+
+    def _reencrypt_one(
+        self, path: Path, recipients: tuple[str, ...]
+    ) -> ReencryptError | None:
+        """Encrypt path again to recipients, returning the error rather than raising"""
+        tmp_path = path.with_name(f".{path.name}.reencrypt")
+        gpg = [self._gpg_binary_path, "--homedir", self._gpg_home_path, "--batch"]
+        encrypt_args = [*PASS_ENCRYPT_ARGS, *(f"--recipient={x}" for x in recipients)]
+        try:
+            decrypt = subprocess.Popen(
+                [*gpg, "--quiet", "--decrypt", str(path)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            try:
+                encrypt = subprocess.Popen(
+                    [*gpg, *encrypt_args, "--output", str(tmp_path), "--encrypt"],
+                    stdin=decrypt.stdout,
+                    stderr=subprocess.PIPE,
+                )
+            finally:
+                # Only the processes should hold the pipe, so each sees the other exit
+                decrypt.stdout.close()
+            _, encrypt_error = encrypt.communicate()
+            decrypt_error = decrypt.stderr.read()
+            decrypt.stderr.close()
+            decrypt.wait()
+
+            # A failed decrypt still leaves gpg encrypting an empty plaintext
+            if decrypt.returncode or encrypt.returncode:
+                error = (decrypt_error if decrypt.returncode else encrypt_error).decode(
+                    errors="replace"
+                )
+                tmp_path.unlink(missing_ok=True)
+                return ReencryptError(f"Unable to re-encrypt {path}: {error.strip()}")
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            tmp_path.unlink(missing_ok=True)
+            return ReencryptError(f"Unable to re-encrypt {path}: {exc!r}")
+        return None
+
+    @metrics.timed("gpg.create")
     def _create_gpg(self) -> None:
         """Create the GPG client using stored_settings"""
-        self._gpg = gnupg.GPG(
+        self._gpg = _GPG(
             gnupghome=self._gpg_home_path,
             use_agent=self._use_agent,
             gpgbinary=self._gpg_binary_path,
         )
+        # Give new settings a new worker, even if the last one failed
+        self._stop_worker()
+        self._worker_failed = False
+        self._keygrips = None
+        self._get_worker()
+
+    def _get_worker(self) -> DecryptWorker | None:
+        """Return the running worker, starting one if it's enabled and not failed"""
+        with self._worker_lock:
+            if not self._use_worker or self._worker_failed:
+                return None
+            if self._worker is None:
+                try:
+                    self._worker = DecryptWorker(
+                        self._gpg_home_path, self._gpg_binary_path, self._use_agent
+                    )
+                except OSError as exc:
+                    log.warning("Unable to start gpg worker: %s", exc)
+                    self._worker_failed = True
+            return self._worker
+
+    def _stop_worker(self) -> None:
+        """Stop and forget the worker if there is one"""
+        with self._worker_lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.stop()
@@ -1,12 +1,17 @@
 from pathlib import Path
+from typing import Callable
 
+import objc
 import rumps
+from Foundation import NSObject
 from rumps.rumps import Response
 
 CANCEL = 0
 OK = 1
 SHOW = 2
 
+LOADING = "Loading…"
+
 
 class PathMenuItem(rumps.MenuItem):
     """A MenuItem that stores a Path"""
@@ -25,13 +30,78 @@ class PathMenuItem(rumps.MenuItem):
         self.path = path
 
 
+class FieldMenuItem(PathMenuItem):
+    """A MenuItem for one field of the entry at a Path"""
+
+    def __init__(self, field: str, path: Path, callback=None):
+        super().__init__(field, path, callback)
+        self.field = field
+
+
+class _MenuDelegate(NSObject):
+    """NSMenu delegate that calls back just before the menu is displayed"""
+
+    def initWithCallback_(self, callback):
+        self = objc.super(_MenuDelegate, self).init()
+        if self is None:
+            return None
+        self._callback = callback
+        return self
+
+    def menuNeedsUpdate_(self, menu):
+        self._callback()
+
+
+class LazyMenuItem(rumps.MenuItem):
+    """A submenu whose children are only created the first time it is opened
+
+    Until then it holds a single placeholder item so it's still shown as a submenu.
+    `dematerialize` drops the children again to free them.
+    """
+
+    def __init__(
+        self,
+        title,
+        populate: Callable[[], list[rumps.MenuItem]],
+        on_open: Callable[["LazyMenuItem"], None] | None = None,
+    ):
+        super().__init__(title)
+        self._populate = populate
+        self._on_open = on_open
+        self._materialized = False
+        self.add(rumps.MenuItem(LOADING))
+        # NSMenu only holds a weak reference to its delegate
+        self._delegate = _MenuDelegate.alloc().initWithCallback_(self.materialize)
+        self._menu.setDelegate_(self._delegate)
+
+    @property
+    def materialized(self) -> bool:
+        return self._materialized
+
+    def materialize(self) -> None:
+        """Create the children if they don't exist yet. Called when the menu opens"""
+        if not self._materialized:
+            self.clear()
+            self.update(self._populate())
+            self._materialized = True
+        if self._on_open is not None:
+            self._on_open(self)
+
+    def dematerialize(self) -> None:
+        """Drop the children, leaving the placeholder item"""
+        if not self._materialized:
+            return
+        self.clear()
+        self.add(rumps.MenuItem(LOADING))
+        self._materialized = False
+
+
 class RecentMenuItem(rumps.MenuItem):
-    """A Menu to hold the last N most recently accessed items"""
+    """A Menu showing the most recently accessed items"""
 
     def __init__(
         self,
         title,
-        max_recents,
         callback=None,
         key=None,
         icon=None,
@@ -41,47 +111,11 @@ class RecentMenuItem(rumps.MenuItem):
         super().__init__(title, callback, key, icon, dimensions, template)
         self._none_item = rumps.MenuItem("None")
         self.add(self._none_item)
-        self._max_items = max_recents
 
-    def reset(self) -> None:
-        """Reset the recents menu"""
+    def set_recents(self, items: list[PathMenuItem]) -> None:
+        """Replace the menu contents with items, most recent first"""
         self.clear()
-        self.add(self._none_item)
-
-    def add_recent(self, item: PathMenuItem) -> None:
-        """Add entry to the most recently used items"""
-        if self._none_item.title in self:
-            self._replace_empty(item)
-            return
-
-        if item.title in self:
-            self._move_to_top(item)
-        else:
-            self._add_to_top(item)
-
-    def _replace_empty(self, item: PathMenuItem) -> None:
-        """Replaces the default None item with the incoming item"""
-        self.clear()
-        self.add(PathMenuItem(item.title, item.path, item.callback))
-
-    def _move_to_top(self, item: PathMenuItem) -> None:
-        """Moves existing item to the top of the menu"""
-        existing = self.pop(item.title)
-        if len(self.keys()) == 0:
-            self.add(existing)
-            return
-
-        front = self.values()[0]
-        self.insert_before(front.title, existing)
-
-    def _add_to_top(self, item: PathMenuItem) -> None:
-        """Add a new entry to the top of the menu"""
-        front = self.values()[0]
-        self.insert_before(
-            front.title, PathMenuItem(item.title, item.path, item.callback)
-        )
-        if len(self) > self._max_items:
-            self.pop(self.values()[-1].title)
+        self.update(items or [self._none_item])
 
 
 def get_user_passphrase(path: Path, attempt_num: int, max_attempts: int) -> Response:
@@ -98,6 +132,21 @@ def get_user_passphrase(path: Path, attempt_num: int, max_attempts: int) -> Resp
     return resp
 
 
+def get_search_query() -> str | None:
+    """Show a window to get a search query, returning None if cancelled"""
+    win = rumps.Window(
+        "Search for passwords by name",
+        title="Search Passwords",
+        cancel=True,
+        dimensions=(300, 25),
+        ok="Search",
+    )
+    resp = win.run()
+    if not resp.clicked:
+        return None
+    return resp.text
+
+
 def show_get_path(msg: str, title: str, default_text: str, obj_type: str) -> str:
     """Show a gui to get a path based on obj_type"""
     msg_txt = msg
@@ -147,3 +196,9 @@ def show_message_with_ok_button(msg: str, title: str) -> None:
     """Shows an alert window with message, title and OK button"""
     win = rumps.Window(msg, title=title, cancel=False, dimensions=(0, 0))
     win.run()
+
+
+def confirm(msg: str, title: str, ok: str = "OK") -> bool:
+    """Show msg with OK and Cancel buttons, returning True if OK was clicked"""
+    win = rumps.Window(msg, title=title, ok=ok, cancel=True, dimensions=(0, 0))
+    return bool(win.run().clicked)
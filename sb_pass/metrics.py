@@ -0,0 +1,196 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+log = logging.getLogger(__name__)
+
+METRICS_ENV = "SB_PASS_METRICS"
+PROFILE_ENV = "SB_PASS_PROFILE"
+# Percentiles are computed over this many of the most recent samples of a span
+MAX_SAMPLES = 1000
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class _Span:
+    """Running totals and recent samples for one timed span"""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque[float] = deque(maxlen=MAX_SAMPLES)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> dict[str, float]:
+        ordered = sorted(self.samples)
+        summary = {"count": self.count, "sum": self.total, "max": self.max}
+        for quantile in QUANTILES:
+            index = min(len(ordered) - 1, int(quantile * len(ordered)))
+            summary[f"p{quantile * 100:g}"] = ordered[index]
+        return summary
+
+
+_enabled = False
+_lock = threading.Lock()
+_spans: dict[str, _Span] = {}
+_counters: dict[str, int] = {}
+_profiler = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(value: bool = True) -> None:
+    """Start or stop recording spans and counters"""
+    global _enabled
+    _enabled = value
+
+
+def reset() -> None:
+    """Forget everything recorded so far"""
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+def record(name: str, seconds: float) -> None:
+    """Record a duration for span name"""
+    with _lock:
+        span = _spans.get(name)
+        if span is None:
+            span = _spans[name] = _Span()
+        span.add(seconds)
+
+
+def count(name: str, value: int = 1) -> None:
+    """Add value to counter name if recording is enabled"""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+@contextlib.contextmanager
+def _timing(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def span(name: str) -> contextlib.AbstractContextManager:
+    """Return a context manager timing its block as span name"""
+    if not _enabled:
+        return contextlib.nullcontext()
+    return _timing(name)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorate a function so each call is recorded as span name"""
+
+    def decorate(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+def snapshot() -> dict[str, Any]:
+    """Return the percentiles of every span and the value of every counter"""
+    with _lock:
+        return {
+            "spans": {k: v.summary() for k, v in sorted(_spans.items())},
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def to_prometheus(data: dict[str, Any]) -> str:
+    """Return a snapshot in the Prometheus text exposition format"""
+    lines = ["# TYPE sb_pass_span_seconds summary"]
+    for name, summary in data["spans"].items():
+        for quantile in QUANTILES:
+            value = summary[f"p{quantile * 100:g}"]
+            lines.append(
+                f'sb_pass_span_seconds{{span="{name}",quantile="{quantile:g}"}} '
+                f"{value:.9f}"
+            )
+        lines.append(f'sb_pass_span_seconds_sum{{span="{name}"}} {summary["sum"]:.9f}')
+        lines.append(f'sb_pass_span_seconds_count{{span="{name}"}} {summary["count"]}')
+    lines.append("# TYPE sb_pass_events_total counter")
+    for name, value in data["counters"].items():
+        lines.append(f'sb_pass_events_total{{event="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def export(directory: Path) -> None:
+    """Write metrics.json and metrics.prom to directory"""
+    data = snapshot()
+    _write_atomic(directory / "metrics.json", json.dumps(data, indent=2))
+    _write_atomic(directory / "metrics.prom", to_prometheus(data))
+
+
+def start_profile() -> None:
+    """Start profiling the calling thread with cProfile"""
+    global _profiler
+    if _profiler is not None:
+        return
+    import cProfile
+
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+
+def profiling() -> bool:
+    return _profiler is not None
+
+
+def stop_profile(path: Path) -> None:
+    """Stop profiling and save the stats to path for pstats or snakeviz"""
+    global _profiler
+    if _profiler is None:
+        return
+    _profiler.disable()
+    _profiler.dump_stats(path)
+    _profiler = None
+    log.info("Saved profile to %s", path)
+
+
+def configure_from_env() -> None:
+    """Enable metrics and profiling requested through the environment"""
+    if os.environ.get(METRICS_ENV):
+        enable()
+    if os.environ.get(PROFILE_ENV):
+        start_profile()
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    """Replace path with text so readers never see a partial file"""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as fout:
+        fout.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,5 @@
+"""The password store, search, recents and menu state, independent of the GUI
+
+Nothing in this package imports rumps or PyObjC, so it can be tested and
+benchmarked anywhere. The app renders it into menus.
+"""
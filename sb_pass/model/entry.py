@@ -0,0 +1,109 @@
+import re
+from functools import cached_property
+
+PASSWORD = "password"
+NOTES = "notes"
+OTPAUTH = "otpauth"
+
+_OTPAUTH_PREFIX = "otpauth://"
+# "key: value" or "key:" but not "https://…", so bare URLs stay in the notes
+_FIELD = re.compile(r"([^:\s][^:]*?)\s*:(?:\s+(.*?))?\s*")
+# Field names used for the same thing by pass, browserpass and passff
+_USERNAME_KEYS = ("username", "user", "login", "email")
+_URL_KEYS = ("url", "website", "site", "link")
+
+
+def first_line(data: str | bytes) -> str:
+    """Return the first line of data, without looking at (or decoding) the rest"""
+    newline = "\n" if isinstance(data, str) else b"\n"
+    line = data[: data.find(newline)] if newline in data else data
+    if isinstance(line, bytes):
+        line = line.decode()
+    return line.rstrip("\r")
+
+
+class PassEntry:
+    """A decrypted pass entry, parsed only as far as it's accessed
+
+    Following the pass conventions, the first line is the password. Later lines
+    that look like "key: value" are fields, an otpauth:// line is the OTP URI and
+    everything else is notes.
+    """
+
+    def __init__(self, data: str | bytes) -> None:
+        self._data = data
+
+    @cached_property
+    def password(self) -> str:
+        return first_line(self._data)
+
+    @property
+    def username(self) -> str | None:
+        return self._first_field(_USERNAME_KEYS)
+
+    @property
+    def url(self) -> str | None:
+        return self._first_field(_URL_KEYS)
+
+    @property
+    def otpauth(self) -> str | None:
+        return self._parsed[2]
+
+    @property
+    def notes(self) -> str:
+        return self._parsed[1]
+
+    @property
+    def fields(self) -> dict[str, str]:
+        """Return the "key: value" fields in the order they appear"""
+        return self._parsed[0]
+
+    def field_names(self) -> list[str]:
+        """Return the names `get` accepts for this entry, in display order"""
+        reserved = (PASSWORD, NOTES, OTPAUTH)
+        names = [PASSWORD, *(x for x in self.fields if x.lower() not in reserved)]
+        if self.otpauth is not None:
+            names.append(OTPAUTH)
+        if self.notes:
+            names.append(NOTES)
+        return names
+
+    def get(self, name: str) -> str | None:
+        """Return the password, notes, otpauth URI or field (ignoring case) name"""
+        if name == PASSWORD:
+            return self.password
+        if name == NOTES:
+            return self.notes or None
+        if name == OTPAUTH:
+            return self.otpauth
+        return self._first_field((name,))
+
+    def _first_field(self, names: tuple[str, ...]) -> str | None:
+        """Return the value of the first field found with one of names"""
+        lowered = {k.lower(): v for k, v in self.fields.items()}
+        for name in names:
+            if name.lower() in lowered:
+                return lowered[name.lower()]
+        return None
+
+    @cached_property
+    def _parsed(self) -> tuple[dict[str, str], str, str | None]:
+        """Split everything after the password into fields, notes and otpauth"""
+        data = self._data
+        if isinstance(data, bytes):
+            data = data.decode()
+        _, _, body = data.partition("\n")
+
+        fields: dict[str, str] = {}
+        notes = []
+        otpauth = None
+        for line in body.splitlines():
+            if otpauth is None and line.strip().startswith(_OTPAUTH_PREFIX):
+                otpauth = line.strip()
+                continue
+            match = _FIELD.fullmatch(line)
+            if match is not None and match.group(1) not in fields:
+                fields[match.group(1)] = match.group(2) or ""
+            else:
+                notes.append(line)
+        return fields, "\n".join(notes).strip("\n"), otpauth
@@ -0,0 +1,60 @@
+import logging
+import os
+import subprocess
+
+log = logging.getLogger(__name__)
+
+GIT_TIMEOUT = 10.0
+
+
+def is_repo(path: str) -> bool:
+    """Return True if path is the top of a git work tree, as pass git stores are"""
+    return os.path.exists(os.path.join(path, ".git"))
+
+
+def head(path: str) -> str | None:
+    """Return the commit HEAD points to, or None if git can't tell us"""
+    output = _git(path, "rev-parse", "--verify", "--quiet", "HEAD")
+    return None if output is None else output.decode().strip()
+
+
+def changed_paths(path: str, old: str, new: str) -> list[str] | None:
+    """Return the paths below path changed between two commits, or None on error
+
+    This only compares the commits' trees, so it costs about as much as the number
+    of changes rather than the size of the store.
+    """
+    output = _git(
+        path, "diff", "--name-status", "-z", "--no-renames", "--relative", old, new
+    )
+    if output is None:
+        return None
+    # Each change is its status followed by its path, e.g. M\0web/github.gpg\0
+    fields = [x.decode() for x in output.split(b"\0") if x]
+    return fields[1::2]
+
+
+def is_clean(path: str) -> bool | None:
+    """Return whether the work tree below path matches HEAD, or None on error
+
+    Untracked files count as changes, as pass would show them like any other.
+    """
+    output = _git(path, "status", "--porcelain", "-z", "--untracked-files=normal")
+    return None if output is None else not output
+
+
+def _git(path: str, *args: str) -> bytes | None:
+    """Return the output of git args run in path, or None if it fails"""
+    try:
+        proc = subprocess.run(
+            ["git", "-C", path, *args],
+            capture_output=True,
+            timeout=GIT_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        log.warning("Unable to run git in %s: %s", path, exc)
+        return None
+    if proc.returncode:
+        log.info("git %s failed in %s: %s", args[0], path, proc.stderr.decode().strip())
+        return None
+    return proc.stdout
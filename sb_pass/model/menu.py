@@ -0,0 +1,129 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .store import StoreChange, StoreDir, StoreEntry
+
+DEFAULT_MAX_MATERIALIZED = 50
+
+
+@dataclass(frozen=True, slots=True)
+class Insert:
+    """Add the item for node to the menu of directory `menu`, before `before`"""
+
+    menu: str
+    node: StoreDir | StoreEntry
+    before: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class Remove:
+    """Remove the item for node from the menu of directory `menu`"""
+
+    menu: str
+    node: StoreDir | StoreEntry
+
+
+@dataclass(frozen=True, slots=True)
+class Dematerialize:
+    """Drop the items of the menu of directory `menu` until it's opened again"""
+
+    menu: str
+
+
+MenuOp = Insert | Remove | Dematerialize
+
+
+def menu_children(node: StoreDir) -> list[StoreDir | StoreEntry]:
+    """Return the items of a directory's menu in display order"""
+    return [*node.entries, *node.dirs]
+
+
+class MenuModel:
+    """Which directory menus have items, and how store changes alter them
+
+    Menus only get items when they're opened, and the least recently opened are
+    dematerialized again once more than max_materialized have items. Store changes
+    are turned into the operations needed for the menus that currently have items.
+    """
+
+    def __init__(self, max_materialized: int = DEFAULT_MAX_MATERIALIZED) -> None:
+        self.max_materialized = max_materialized
+        # Names of the items shown in each materialized menu, least recent first
+        self._shown: OrderedDict[str, set[str]] = OrderedDict()
+
+    def is_materialized(self, path: str) -> bool:
+        return path in self._shown
+
+    def opened(self, node: StoreDir) -> list[Dematerialize]:
+        """Record that node's menu was opened, returning the menus to dematerialize"""
+        if node.path not in self._shown:
+            self._shown[node.path] = {x.name for x in menu_children(node)}
+        self._shown.move_to_end(node.path)
+
+        ops = []
+        for old_path in list(self._shown):
+            if len(self._shown) <= self.max_materialized:
+                break
+            # Ancestors of the open menu are still being shown
+            if old_path == node.path or node.path.startswith(old_path + os.sep):
+                continue
+            # Already dropped along with an evicted ancestor
+            if old_path not in self._shown:
+                continue
+            del self._shown[old_path]
+            self._forget_below(old_path)
+            ops.append(Dematerialize(old_path))
+        return ops
+
+    def clear(self) -> list[Dematerialize]:
+        """Forget every menu with items, returning the operations to drop them"""
+        ops = [Dematerialize(x) for x in self._shown]
+        self._shown.clear()
+        return ops
+
+    def apply(self, changes: list[StoreChange]) -> list[Insert | Remove]:
+        """Return the operations that bring the materialized menus up to date"""
+        ops = []
+        # Remove first so the sibling lookups for additions only see current items
+        for change in sorted(changes, key=lambda x: x.added):
+            op = self._insert(change) if change.added else self._remove(change)
+            if op is not None:
+                ops.append(op)
+        return ops
+
+    def _insert(self, change: StoreChange) -> Insert | None:
+        """Return the Insert for an added node, or None if its menu has no items"""
+        shown = self._shown.get(change.parent.path)
+        # Unopened menus are built from the updated store when they're first opened
+        if shown is None or change.node.name in shown:
+            return None
+
+        children = menu_children(change.parent)
+        # Changes are queued, so a later refresh may already have removed the node
+        index = next((i for i, x in enumerate(children) if x is change.node), None)
+        if index is None:
+            return None
+        following = [x.name for x in children[index + 1 :] if x.name in shown]
+        shown.add(change.node.name)
+        return Insert(
+            change.parent.path, change.node, following[0] if following else None
+        )
+
+    def _remove(self, change: StoreChange) -> Remove | None:
+        """Return the Remove for a removed node, or None if it isn't shown"""
+        if isinstance(change.node, StoreDir):
+            self._shown.pop(change.node.path, None)
+            self._forget_below(change.node.path)
+
+        shown = self._shown.get(change.parent.path)
+        if shown is None or change.node.name not in shown:
+            return None
+        shown.discard(change.node.name)
+        return Remove(change.parent.path, change.node)
+
+    def _forget_below(self, path: str) -> None:
+        """Forget the menus of every directory below path"""
+        prefix = path + os.sep
+        for key in [x for x in self._shown if x.startswith(prefix)]:
+            del self._shown[key]
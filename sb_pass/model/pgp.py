@@ -0,0 +1,116 @@
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# Packet tags from RFC 4880 section 4.3
+PKESK_TAG = 1
+SKESK_TAG = 3
+# The key ID gpg writes for recipients hidden with --throw-keyids
+WILDCARD_KEY_ID = "0" * 16
+# Enough for the session key packets of a few 4096 bit RSA recipients in one read
+READ_SIZE = 4096
+# Stop looking for recipients after this many, as no real message has more
+MAX_RECIPIENTS = 256
+
+
+def recipient_key_ids(path: str | os.PathLike) -> list[str] | None:
+    """Return the key IDs path is encrypted to, or None if they can't be known
+
+    That's when path can't be read, or it names no recipients, e.g. as it was
+    encrypted with only a passphrase (gpg -c), which no key ID can rule out.
+
+    Only the public key encrypted session key packets at the start of the file are
+    read, usually in a single small read however large the file is. Key IDs are
+    upper case hex as gpg shows them, and hidden recipients have WILDCARD_KEY_ID.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError as exc:
+        log.warning("Unable to read recipients of %s: %s", path, exc)
+        return None
+    try:
+        return _read_recipients(fd)
+    except OSError as exc:
+        log.warning("Unable to read recipients of %s: %s", path, exc)
+        return None
+    finally:
+        os.close(fd)
+
+
+def _read_recipients(fd: int) -> list[str] | None:
+    """Return the key IDs of the leading PKESK packets of the binary message fd"""
+    data = os.read(fd, READ_SIZE)
+    key_ids = []
+    offset = 0
+    while len(key_ids) < MAX_RECIPIENTS:
+        # The longest header is six octets
+        data = _read_to(fd, data, offset + 6)
+        header = _parse_header(data, offset)
+        if header is None:
+            # Armored, truncated or using a length form PKESKs never use
+            return key_ids or None
+        tag, start, length = header
+        if tag == PKESK_TAG:
+            data = _read_to(fd, data, start + 9)
+            if len(data) < start + 9:
+                # Truncated, so some recipients may be missing
+                return None
+            key_id = _pkesk_key_id(data[start : start + 9])
+            if key_id is not None:
+                key_ids.append(key_id)
+        elif tag != SKESK_TAG:
+            # The encrypted data follows the session key packets
+            return key_ids or None
+        offset = start + length
+    return key_ids
+
+
+def _read_to(fd: int, data: bytes, size: int) -> bytes:
+    """Return data extended from fd to at least size octets, unless it ends first"""
+    # Rarely needed, e.g. for many recipients with large keys
+    while len(data) < size:
+        more = os.pread(fd, READ_SIZE, len(data))
+        if not more:
+            break
+        data += more
+    return data
+
+
+def _parse_header(data: bytes, offset: int) -> tuple[int, int, int] | None:
+    """Return the tag, body offset and body length of the packet at offset"""
+    if offset >= len(data) or not data[offset] & 0x80:
+        return None
+    octet = data[offset]
+
+    if octet & 0x40:
+        # New format, with the length in one, two or five octets
+        tag = octet & 0x3F
+        if offset + 1 >= len(data):
+            return None
+        size = data[offset + 1]
+        if size < 192:
+            return tag, offset + 2, size
+        if size < 224:
+            if offset + 2 >= len(data):
+                return None
+            return tag, offset + 3, ((size - 192) << 8) + data[offset + 2] + 192
+        if size == 255 and offset + 6 <= len(data):
+            return tag, offset + 6, int.from_bytes(data[offset + 2 : offset + 6], "big")
+        return None
+
+    # Old format, with the length size in the low bits
+    tag = (octet >> 2) & 0x0F
+    length_size = {0: 1, 1: 2, 2: 4}.get(octet & 0x03)
+    if length_size is None or offset + 1 + length_size > len(data):
+        return None
+    start = offset + 1 + length_size
+    return tag, start, int.from_bytes(data[offset + 1 : start], "big")
+
+
+def _pkesk_key_id(body: bytes) -> str | None:
+    """Return the key ID in the start of a PKESK packet body, if it has one"""
+    # Version 3 has the 8 octet key ID straight after the version
+    if len(body) == 9 and body[0] == 3:
+        return body[1:9].hex().upper()
+    return None
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator
+
+log = logging.getLogger(__name__)
+
+RECENTS_VERSION = 1
+DEFAULT_MAX_ITEMS = 10
+DEFAULT_SAVE_DELAY = 2.0
+
+
+class Recents:
+    """Most recently used store relative entry names, persisted to a JSON file
+
+    Adding, moving and evicting an entry are all O(1). Saves are batched so a
+    burst of changes is written once, `save_delay` seconds after the first one.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_items: int = DEFAULT_MAX_ITEMS,
+        save_delay: float = DEFAULT_SAVE_DELAY,
+    ) -> None:
+        self._path = path
+        self._max_items = max_items
+        self._save_delay = save_delay
+        # Least recently used first
+        self._names: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer: threading.Timer | None = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the names, most recently used first"""
+        return reversed(list(self._names))
+
+    @property
+    def max_items(self) -> int:
+        return self._max_items
+
+    @max_items.setter
+    def max_items(self, value: int) -> None:
+        with self._lock:
+            self._max_items = value
+            self._trim()
+        self._schedule_save()
+
+    def add(self, name: str) -> None:
+        """Make name the most recently used entry"""
+        with self._lock:
+            self._names[name] = None
+            self._names.move_to_end(name)
+            self._trim()
+        self._schedule_save()
+
+    def discard(self, name: str) -> None:
+        """Remove name, or every entry below it if it's a directory"""
+        prefix = name + os.sep
+        with self._lock:
+            removed = [x for x in self._names if x == name or x.startswith(prefix)]
+            for key in removed:
+                del self._names[key]
+        if removed:
+            self._schedule_save()
+
+    def clear(self) -> None:
+        """Remove every entry"""
+        with self._lock:
+            self._names.clear()
+        self._schedule_save()
+
+    def flush(self) -> None:
+        """Write any pending changes now"""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def save(self) -> None:
+        """Atomically write the entries to the recents file"""
+        with self._lock:
+            data = {"version": RECENTS_VERSION, "recents": list(self._names)}
+        tmp_path = self._path.with_name(self._path.name + ".tmp")
+        try:
+            with self._save_lock:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                with open(tmp_path, "w") as fout:
+                    json.dump(data, fout)
+                os.replace(tmp_path, self._path)
+        except OSError as exc:
+            log.warning("Unable to save recents to %s: %s", self._path, exc)
+            return
+        log.debug("Wrote %s recents to %s", len(data["recents"]), self._path)
+
+    def _load(self) -> None:
+        """Load the entries saved by a previous run, if there are any"""
+        try:
+            with open(self._path) as fin:
+                data = json.load(fin)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            log.warning("Ignoring unreadable recents %s: %s", self._path, exc)
+            return
+
+        if not isinstance(data, dict) or data.get("version") != RECENTS_VERSION:
+            log.info("Ignoring recents with unknown version in %s", self._path)
+            return
+        names = [x for x in data.get("recents", []) if isinstance(x, str)]
+        self._names = OrderedDict.fromkeys(names)
+        self._trim()
+
+    def _trim(self) -> None:
+        """Drop the least recently used entries beyond max_items"""
+        while len(self._names) > max(self._max_items, 0):
+            self._names.popitem(last=False)
+
+    def _schedule_save(self) -> None:
+        """Save after save_delay seconds unless a save is already scheduled"""
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self._save_delay, self._delayed_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _delayed_save(self) -> None:
+        """Run the scheduled save"""
+        with self._lock:
+            self._save_timer = None
+        self.save()
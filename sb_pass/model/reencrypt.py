@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from . import pgp
+from .store import StoreDir, entry_name
+
+log = logging.getLogger(__name__)
+
+# How often run reports progress, in seconds
+PROGRESS_INTERVAL = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class Job:
+    """An entry to encrypt again to the recipients of its .gpg-id"""
+
+    name: str
+    path: Path
+    gpg_ids: tuple[str, ...]
+
+
+@dataclass(slots=True)
+class Progress:
+    """How far a re-encryption run has got, and how fast it's going"""
+
+    total: int
+    done: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+    finished: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self) -> float:
+        """Return the entries handled per second"""
+        elapsed = self.elapsed
+        return (self.done + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.done}/{self.total} re-encrypted, {self.failed} failed, "
+            f"{self.rate:.1f} entries/s"
+        )
+
+
+def gpg_id_lines(root: StoreDir) -> set[str]:
+    """Return every distinct line of the .gpg-id files in root
+
+    These can be resolved to key IDs without the root's lock, which is only held
+    while they're read, then given to plan.
+    """
+    lines = set()
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        lines.update(directory.gpg_ids or ())
+        pending.extend(directory.dirs)
+    return lines
+
+
+def plan(
+    root: StoreDir, key_ids_for: Callable[[str], frozenset[str] | None]
+) -> list[Job]:
+    """Return the entries whose recipients differ from their .gpg-id, in name order
+
+    key_ids_for returns the key IDs gpg may encrypt to for a .gpg-id line, and is
+    called once per distinct line. Entries whose recipients are unknown or hidden,
+    or whose .gpg-id names a key gpg doesn't have, are skipped, as pass couldn't
+    encrypt them either. The root's lock must be held, if it has one.
+    """
+    resolved: dict[str, frozenset[str] | None] = {}
+    jobs = []
+    # Directories with the .gpg-id lines that apply to them, from the nearest one
+    pending = [(root, root.gpg_ids)]
+    while pending:
+        directory, ids = pending.pop()
+        ids = directory.gpg_ids or ids
+        pending.extend((x, ids) for x in directory.dirs)
+        if not ids:
+            continue
+
+        for gpg_id in ids:
+            if gpg_id not in resolved:
+                resolved[gpg_id] = key_ids_for(gpg_id)
+                if resolved[gpg_id] is None:
+                    log.warning("No usable key for %s, skipping its entries", gpg_id)
+        keys = [resolved[x] for x in ids]
+        if any(x is None for x in keys):
+            continue
+
+        for entry in directory.entries:
+            recipients = entry.recipients
+            if recipients is None or pgp.WILDCARD_KEY_ID in recipients:
+                continue
+            if not _encrypted_for(recipients, keys):
+                name = entry_name(root.path, entry.path)
+                jobs.append(Job(name, Path(entry.path), ids))
+    return sorted(jobs, key=lambda x: x.name)
+
+
+def run(
+    jobs: list[Job],
+    reencrypt_many: Callable[[Iterable[tuple[Path, tuple[str, ...]]]], Iterator],
+    on_progress: Callable[[Progress], None] | None = None,
+    stop: threading.Event | None = None,
+) -> Progress:
+    """Re-encrypt jobs with reencrypt_many, e.g. `Gpg.reencrypt_many`, returning
+    how it went
+
+    on_progress is called about every PROGRESS_INTERVAL seconds and at the end.
+    Setting stop lets the jobs already started finish and starts no more. Each
+    entry is replaced atomically, so an interrupted run is resumed by planning
+    again, which skips the entries already done.
+    """
+    progress = Progress(len(jobs))
+    reported = progress.started
+    results = reencrypt_many((x.path, x.gpg_ids) for x in jobs)
+    try:
+        for (path, _), error in results:
+            if error is None:
+                progress.done += 1
+            else:
+                progress.failed += 1
+                log.warning("%s", error)
+            now = time.monotonic()
+            if on_progress is not None and now - reported >= PROGRESS_INTERVAL:
+                reported = now
+                on_progress(progress)
+            if stop is not None and stop.is_set():
+                log.info("Stopped re-encrypting after %s", path)
+                break
+    finally:
+        # Cancels the jobs not started yet
+        results.close()
+    progress.finished = time.monotonic()
+    if on_progress is not None:
+        on_progress(progress)
+    return progress
+
+
+def _encrypted_for(recipients: tuple[str, ...], keys: list[frozenset[str]]) -> bool:
+    """Return True if recipients are one key for each .gpg-id line and no others"""
+    allowed = frozenset().union(*keys)
+    return all(x in allowed for x in recipients) and all(
+        not x.isdisjoint(recipients) for x in keys
+    )
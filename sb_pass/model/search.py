@@ -0,0 +1,175 @@
+import heapq
+import re
+from collections import Counter
+from typing import Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_LIMIT = 20
+
+# Minimum fraction of the query's trigrams a name must share to be a fuzzy match
+_FUZZY_THRESHOLD = 0.5
+# Rebuild the postings once this fraction of the names have been removed
+_COMPACT_THRESHOLD = 0.25
+_SEPARATORS = "/-_. "
+_COMPONENT_START = re.compile(r"(?:^|[/\-_. ])([^/\-_. ]{1,2})")
+
+
+class SearchIndex:
+    """Trigram index over store relative entry names such as "web/github"
+
+    Queries are split on whitespace and every term must appear in a name. Terms
+    shorter than three characters must start one of the name's components. When
+    nothing matches, names sharing most of the query's trigrams are returned
+    instead so small typos still find the entry.
+    """
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self._names: list[str | None] = []
+        self._lower: list[str | None] = []
+        self._ids: dict[str, int] = {}
+        # Ids of the names containing each trigram, or with a component starting
+        # with each one or two character prefix
+        self._postings: dict[str, list[int]] = {}
+        self.update(added=names)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ids)
+
+    def update(self, added: Iterable[str] = (), removed: Iterable[str] = ()) -> None:
+        """Add and remove names from the index"""
+        for name in removed:
+            name_id = self._ids.pop(name, None)
+            if name_id is not None:
+                self._names[name_id] = self._lower[name_id] = None
+
+        for name in added:
+            if name not in self._ids:
+                self._add(name)
+
+        removed_count = len(self._names) - len(self._ids)
+        if removed_count > _COMPACT_THRESHOLD * len(self._names):
+            self._compact()
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[str]:
+        """Return up to limit names matching query, best matches first"""
+        return [x[1] for x in self.ranked_search(query, limit)]
+
+    def ranked_search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[tuple]:
+        """Return up to limit (sort key, name) of the best matches, for merge_ranked
+
+        The keys of different indexes compare, so their results can be merged.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return []
+
+        matches = self._matches(terms)
+        if not matches:
+            return self._fuzzy_matches(" ".join(terms), limit)
+
+        ranked = heapq.nsmallest(
+            limit, ((_rank(self._lower[x], terms), x) for x in matches)
+        )
+        return [((0, *key), self._names[x]) for key, x in ranked]
+
+    def _add(self, name: str) -> None:
+        """Add name to the postings of its trigrams and component prefixes"""
+        name_id = len(self._names)
+        lower = name.lower()
+        self._names.append(name)
+        self._lower.append(lower)
+        self._ids[name] = name_id
+        for key in _trigrams(lower) | _prefixes(lower):
+            self._postings.setdefault(key, []).append(name_id)
+
+    def _compact(self) -> None:
+        """Rebuild the index without the removed names"""
+        names = list(self._ids)
+        self._names, self._lower, self._ids, self._postings = [], [], {}, {}
+        for name in names:
+            self._add(name)
+
+    def _matches(self, terms: list[str]) -> list[int]:
+        """Return the ids of the names matching every term"""
+        keys = [x for t in terms for x in (_trigrams(t) if len(t) > 2 else [t])]
+        # Only verify the names in the smallest posting list of any key
+        candidates = min((self._postings.get(x, []) for x in keys), key=len)
+        long_terms = [x for x in terms if len(x) > 2]
+        short_terms = {x for x in terms if len(x) <= 2}
+
+        matches = []
+        for name_id in candidates:
+            lower = self._lower[name_id]
+            if lower is None or not all(t in lower for t in long_terms):
+                continue
+            if short_terms and not short_terms <= _prefixes(lower):
+                continue
+            matches.append(name_id)
+        return matches
+
+    def _fuzzy_matches(self, query: str, limit: int) -> list[tuple]:
+        """Return the (sort key, name) of the names sharing most trigrams with query"""
+        trigrams = _trigrams(query)
+        if not trigrams:
+            return []
+
+        counts = Counter()
+        for trigram in trigrams:
+            counts.update(self._postings.get(trigram, ()))
+
+        required = _FUZZY_THRESHOLD * len(trigrams)
+        matches = [
+            (1, -count, len(self._names[x]), self._names[x])
+            for x, count in counts.items()
+            if count >= required and self._names[x] is not None
+        ]
+        return [(x, x[-1]) for x in sorted(matches)[:limit]]
+
+
+def merge_ranked(results: Iterable[list[tuple[tuple, T]]], limit: int) -> list[T]:
+    """Return the best limit items of several ranked_search like results
+
+    As within one index, fuzzy matches are dropped if there are any others.
+    """
+    merged = list(heapq.merge(*results, key=lambda x: x[0]))
+    if merged and merged[0][0][0] == 0:
+        merged = [x for x in merged if x[0][0] == 0]
+    return [x[1] for x in merged[:limit]]
+
+
+def _trigrams(text: str) -> set[str]:
+    """Return the set of three character substrings of text"""
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _prefixes(text: str) -> set[str]:
+    """Return the one and two character prefixes of the components of text"""
+    prefixes = set()
+    for prefix in _COMPONENT_START.findall(text):
+        prefixes.add(prefix[0])
+        prefixes.add(prefix)
+    return prefixes
+
+
+def _rank(lower: str, terms: list[str]) -> tuple[int, int, str]:
+    """Return a sort key preferring matches at the start of an entry's name"""
+    entry = lower.rsplit("/", 1)[-1]
+    score = 0
+    for term in terms:
+        if entry == term:
+            score += 4
+        elif entry.startswith(term):
+            score += 3
+        elif term in entry:
+            score += 2
+        index = lower.find(term)
+        if index == 0 or lower[index - 1] in _SEPARATORS:
+            score += 1
+    return -score, len(lower), lower
@@ -0,0 +1,524 @@
+import json
+import logging
+import os
+import struct
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from . import git, pgp
+
+log = logging.getLogger(__name__)
+
+GPG_SUFFIX = ".gpg"
+GPG_ID_FILE = ".gpg-id"
+INDEX_VERSION = 3
+
+_INDEX_MAGIC = b"SBPI"
+_INDEX_HEADER = struct.Struct(">4sHI")
+
+# Directories modified this recently before a scan may still change within the same
+# mtime tick, so they aren't trusted as unchanged on the next refresh (or poll)
+RACY_WINDOW_NS = 2_000_000_000
+
+# Each distinct set of recipients, shared by the entries encrypted to it
+_RECIPIENT_SETS: dict[tuple[str, ...], tuple[str, ...]] = {}
+
+
+@dataclass(slots=True)
+class StoreEntry:
+    """A single .gpg file within the store
+
+    Only the name is stored, with the path built from the parent's when it's
+    needed, as entries far outnumber directories. recipients are the key IDs the
+    file is encrypted to, None if they couldn't be read.
+    """
+
+    name: str
+    parent: "StoreDir" = field(compare=False, repr=False)
+    recipients: tuple[str, ...] | None = field(default=None, repr=False)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.parent.path, self.name + GPG_SUFFIX)
+
+
+@dataclass(slots=True)
+class StoreDir:
+    """A directory within the store and its sorted entries and subdirectories"""
+
+    name: str
+    path: str
+    entries: list[StoreEntry] = field(default_factory=list)
+    dirs: list["StoreDir"] = field(default_factory=list)
+    mtime: int | None = None
+    # The recipients listed in the directory's .gpg-id, None if it has none
+    gpg_ids: tuple[str, ...] | None = None
+    # The .gpg-id's mtime, as editing it in place leaves the directory's alone
+    gpg_id_mtime: int | None = None
+    # The git commit the tree was last updated for, only set on the root of a git
+    # store
+    revision: str | None = None
+
+    def __len__(self) -> int:
+        """Return the total number of entries in this directory and below"""
+        return len(self.entries) + sum(len(x) for x in self.dirs)
+
+
+@dataclass(slots=True)
+class _Listing:
+    """What a directory held when it was read, yet to be applied to its node"""
+
+    node: StoreDir
+    mtime: int | None
+    gpg_ids: tuple[str, ...] | None
+    gpg_id_mtime: int | None
+    entries: list[StoreEntry]
+    # The node's current subdirectories that still exist, and scans of new ones
+    dirs: list[StoreDir]
+
+
+@dataclass(slots=True)
+class StoreUpdate:
+    """The directories read by read_update, for apply_update to bring a tree up to
+    date with"""
+
+    revision: str | None
+    listings: list[_Listing]
+
+
+@dataclass(slots=True)
+class StoreChange:
+    """An entry or directory added to or removed from parent during a refresh"""
+
+    parent: StoreDir
+    node: StoreEntry | StoreDir
+    added: bool
+
+
+def scan_store(root: str | os.PathLike) -> StoreDir:
+    """Walk the store once and return its tree of .gpg entries and directories"""
+    path = os.path.normpath(os.fspath(root))
+    # Read before scanning so anything committed during the scan is diffed later
+    revision = git.head(path) if git.is_repo(path) else None
+    node = _scan_dir(os.path.basename(path), path)
+    node.revision = revision
+    return node
+
+
+def refresh_store(root: StoreDir) -> list[StoreChange]:
+    """Update root in place, returning what changed since it was last scanned"""
+    return apply_update(root, read_update(root))
+
+
+def read_update(root: StoreDir) -> StoreUpdate:
+    """Read what changed in the store since root was last updated, leaving it as is
+
+    Only directories whose mtime changed are listed again, so the cost is one stat
+    per directory plus the work for whatever actually changed. In a git store
+    whose HEAD moved, e.g. after `pass git pull`, the directories holding the files
+    changed between the commits are listed even if their mtime didn't change. If
+    the work tree is also clean, the diff names everything that changed, so only
+    those directories are listed and the walk is skipped.
+
+    As root is only read, this can run while others read the tree, but no other
+    update may be read or applied until this one is applied.
+    """
+    listings = []
+    paths = None
+    revision = root.revision
+    if revision is not None:
+        revision = git.head(root.path)
+        if revision is not None and revision != root.revision:
+            paths = git.changed_paths(root.path, root.revision, revision)
+
+    if paths is not None and git.is_clean(root.path):
+        _read_paths(root, paths, listings)
+    else:
+        # The diff misses anything not committed, which only the walk finds
+        changed_dirs = {
+            os.path.normpath(os.path.join(root.path, os.path.dirname(x)))
+            for x in paths or []
+        }
+        _read_changed_dirs(root, listings, changed_dirs)
+    # Without a HEAD the store is no longer (usable as) a git repo
+    return StoreUpdate(revision, listings)
+
+
+def apply_update(root: StoreDir, update: StoreUpdate) -> list[StoreChange]:
+    """Bring root up to date with update from read_update, returning the changes"""
+    changes = []
+    root.revision = update.revision
+    for listing in update.listings:
+        _apply_listing(listing, changes)
+    return changes
+
+
+def entry_names(
+    root: StoreDir, node: StoreDir | StoreEntry | None = None
+) -> Iterator[str]:
+    """Yield the root relative names, e.g. "web/github", of the entries in node"""
+    node = root if node is None else node
+    start = len(os.path.join(root.path, ""))
+    if isinstance(node, StoreEntry):
+        yield node.path[start : -len(GPG_SUFFIX)]
+        return
+
+    pending = [node]
+    while pending:
+        directory = pending.pop()
+        for entry in directory.entries:
+            yield entry.path[start : -len(GPG_SUFFIX)]
+        pending.extend(directory.dirs)
+
+
+def find_entry(root: StoreDir, name: str) -> StoreEntry | None:
+    """Return the entry with the root relative name, None if there isn't one"""
+    *dir_names, entry_name = name.split("/")
+    node = root
+    for dir_name in dir_names:
+        node = next((x for x in node.dirs if x.name == dir_name), None)
+        if node is None:
+            return None
+    return next((x for x in node.entries if x.name == entry_name), None)
+
+
+def entry_name(root: str | os.PathLike, path: str | os.PathLike) -> str:
+    """Return the root relative name, e.g. "web/github", of the entry at path"""
+    return os.path.relpath(os.path.splitext(path)[0], root)
+
+
+def entry_path(root: str | os.PathLike, name: str) -> str:
+    """Return the path of the entry with the root relative name"""
+    return os.path.join(root, name + GPG_SUFFIX)
+
+
+def gpg_ids(root: StoreDir, node: StoreDir | StoreEntry) -> tuple[str, ...] | None:
+    """Return the recipients pass encrypts node to, from the nearest .gpg-id"""
+    directory = node.parent if isinstance(node, StoreEntry) else node
+    relative = os.path.relpath(directory.path, root.path)
+    current, found = root, root.gpg_ids
+    for part in relative.split(os.sep) if relative != os.curdir else []:
+        current = next((x for x in current.dirs if x.name == part), None)
+        if current is None:
+            break
+        found = current.gpg_ids or found
+    return found
+
+
+def can_decrypt(entry: StoreEntry, secret_key_ids: set[str] | frozenset[str]) -> bool:
+    """Return False only if entry is known to be encrypted to none of the keys"""
+    if entry.recipients is None or pgp.WILDCARD_KEY_ID in entry.recipients:
+        return True
+    return not secret_key_ids.isdisjoint(entry.recipients)
+
+
+def save_index(root: StoreDir, path: str | os.PathLike) -> None:
+    """Atomically write the index to path so a later launch can use load_index"""
+    write_index(dump_index(root), path)
+
+
+def dump_index(root: StoreDir) -> dict:
+    """Return the index of root for write_index, which needn't see root itself"""
+    recipients: dict[tuple[str, ...], int] = {}
+    return {
+        "root": root.path,
+        "revision": root.revision,
+        "tree": _dump_dir(root, recipients),
+        "recipients": list(recipients),
+    }
+
+
+def write_index(index: dict, path: str | os.PathLike) -> None:
+    """Atomically write an index from dump_index to path"""
+    payload = zlib.compress(json.dumps(index, separators=(",", ":")).encode())
+    header = _INDEX_HEADER.pack(_INDEX_MAGIC, INDEX_VERSION, zlib.crc32(payload))
+
+    tmp_path = f"{os.fspath(path)}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, "wb") as fout:
+        fout.write(header + payload)
+    os.replace(tmp_path, path)
+
+
+def load_index(path: str | os.PathLike, root: str | os.PathLike) -> StoreDir | None:
+    """Return the index saved at path if it is valid and for root, otherwise None
+
+    Directory mtimes are kept, so refresh_store only relists what changed since.
+    """
+    try:
+        with open(path, "rb") as fin:
+            data = fin.read()
+    except FileNotFoundError:
+        return None
+    except OSError as exc:
+        log.warning("Unable to read store index %s: %s", path, exc)
+        return None
+
+    try:
+        index = _parse_index(data)
+    except (
+        ValueError,
+        TypeError,
+        KeyError,
+        IndexError,
+        zlib.error,
+        struct.error,
+    ) as exc:
+        log.warning("Ignoring invalid store index %s: %s", path, exc)
+        return None
+
+    if index.path != os.path.normpath(os.fspath(root)):
+        log.info("Store index %s is for another store: %s", path, index.path)
+        return None
+    return index
+
+
+def _parse_index(data: bytes) -> StoreDir:
+    """Return the StoreDir serialized in data, raising ValueError if it's invalid"""
+    magic, version, checksum = _INDEX_HEADER.unpack_from(data)
+    if magic != _INDEX_MAGIC:
+        raise ValueError("Not a store index")
+    if version != INDEX_VERSION:
+        raise ValueError(f"Unsupported version {version}")
+
+    payload = data[_INDEX_HEADER.size :]
+    if zlib.crc32(payload) != checksum:
+        raise ValueError("Checksum mismatch")
+
+    index = json.loads(zlib.decompress(payload))
+    recipients = [_intern_recipients(x) for x in index["recipients"]]
+    root = _load_dir(index["tree"], index["root"], recipients)
+    root.revision = index.get("revision")
+    return root
+
+
+def _dump_dir(node: StoreDir, recipients: dict[tuple[str, ...], int]) -> list:
+    """Return node as nested lists of names and mtimes
+
+    Each entry's recipients are stored as an index into recipients, which is
+    extended with the sets not seen yet, as most entries share a few sets.
+    """
+    entries, refs = [], []
+    for entry in node.entries:
+        entries.append(entry.name)
+        if entry.recipients is None:
+            refs.append(None)
+        else:
+            refs.append(recipients.setdefault(entry.recipients, len(recipients)))
+    dirs = [_dump_dir(x, recipients) for x in node.dirs]
+    return [
+        node.name,
+        node.mtime,
+        entries,
+        dirs,
+        refs,
+        node.gpg_ids,
+        node.gpg_id_mtime,
+    ]
+
+
+def _load_dir(data: list, path: str, recipients: list[tuple[str, ...]]) -> StoreDir:
+    """Return the StoreDir at path from the nested lists created by _dump_dir"""
+    name, mtime, entries, dirs, refs, gpg_ids, gpg_id_mtime = data
+    if not isinstance(name, str) or not all(
+        isinstance(x, (int, type(None))) for x in (mtime, gpg_id_mtime)
+    ):
+        raise ValueError(f"Invalid directory {data!r:.80}")
+    node = StoreDir(sys.intern(name), path, mtime=mtime, gpg_id_mtime=gpg_id_mtime)
+    if gpg_ids is not None:
+        node.gpg_ids = tuple(gpg_ids)
+    node.entries = [
+        StoreEntry(sys.intern(x), node, None if ref is None else recipients[ref])
+        for x, ref in zip(entries, refs, strict=True)
+    ]
+    node.dirs = [_load_dir(x, os.path.join(path, x[0]), recipients) for x in dirs]
+    return node
+
+
+def _scan_dir(name: str, path: str) -> StoreDir:
+    """Return the StoreDir for path and everything below it"""
+    node = StoreDir(sys.intern(name), path)
+    node.mtime, node.gpg_ids, node.gpg_id_mtime, node.entries, subdirs = _read_dir(node)
+    node.dirs = [_scan_dir(x.name, x.path) for x in subdirs]
+    return node
+
+
+def _read_changed_dirs(
+    node: StoreDir, listings: list[_Listing], changed_dirs: set[str]
+) -> None:
+    """List node if its mtime changed or it's in changed_dirs, then its subdirectories
+
+    Only existing subdirectories are recursed into, as new ones are scanned in full
+    while listing.
+    """
+    try:
+        unchanged = node.mtime is not None and node.mtime == _mtime(node.path)
+        if unchanged and node.gpg_ids is not None:
+            gpg_id_path = os.path.join(node.path, GPG_ID_FILE)
+            unchanged = node.gpg_id_mtime == _mtime(gpg_id_path)
+    except OSError:
+        unchanged = False
+
+    subdirs = node.dirs
+    if not unchanged or node.path in changed_dirs:
+        listing = _list_dir(node)
+        listings.append(listing)
+        existing = {x.name for x in node.dirs}
+        subdirs = [x for x in listing.dirs if x.name in existing]
+    for subdir in subdirs:
+        _read_changed_dirs(subdir, listings, changed_dirs)
+
+
+def _read_paths(root: StoreDir, paths: list[str], listings: list[_Listing]) -> None:
+    """List only the directories holding paths, which are relative to root"""
+    targets = {}
+    for path in paths:
+        chain = [root]
+        for part in path.split("/")[:-1]:
+            child = next((x for x in chain[-1].dirs if x.name == part), None)
+            if child is None:
+                break
+            chain.append(child)
+        # A removed directory disappears from the listing of its nearest ancestor
+        while len(chain) > 1 and not os.path.isdir(chain[-1].path):
+            chain.pop()
+        targets[chain[-1].path] = chain[-1]
+
+    # Deepest first, so applying a parent never detaches a directory still to do
+    for path in sorted(targets, key=lambda x: x.count(os.sep), reverse=True):
+        listings.append(_list_dir(targets[path]))
+
+
+def _list_dir(node: StoreDir) -> _Listing:
+    """Read node's directory again, scanning any new subdirectories in full"""
+    mtime, gpg_ids, gpg_id_mtime, entries, subdirs = _read_dir(node)
+    existing = {x.name: x for x in node.dirs}
+    dirs = [
+        existing[x.name] if x.name in existing else _scan_dir(x.name, x.path)
+        for x in subdirs
+    ]
+    return _Listing(node, mtime, gpg_ids, gpg_id_mtime, entries, dirs)
+
+
+def _apply_listing(listing: _Listing, changes: list[StoreChange]) -> None:
+    """Update a directory's node to what its listing found"""
+    node = listing.node
+    node.mtime = listing.mtime
+    node.gpg_ids = listing.gpg_ids
+    node.gpg_id_mtime = listing.gpg_id_mtime
+    recipients = {x.name: x.recipients for x in listing.entries}
+    node.entries = _merge(node, node.entries, listing.entries, changes)
+    # Kept entries may have been encrypted again, e.g. by pass init
+    for entry in node.entries:
+        entry.recipients = recipients[entry.name]
+    node.dirs = _merge(node, node.dirs, listing.dirs, changes)
+
+
+def _merge(parent: StoreDir, old: list, new: list, changes: list[StoreChange]) -> list:
+    """Record the differences between old and new, keeping unchanged old nodes"""
+    old_by_name = {x.name: x for x in old}
+    new_names = {x.name for x in new}
+    changes.extend(
+        StoreChange(parent, x, False) for x in old if x.name not in new_names
+    )
+    merged = []
+    for node in new:
+        if node.name in old_by_name:
+            merged.append(old_by_name[node.name])
+        else:
+            changes.append(StoreChange(parent, node, True))
+            merged.append(node)
+    return merged
+
+
+def _read_dir(
+    node: StoreDir,
+) -> tuple[
+    int | None,
+    tuple[str, ...] | None,
+    int | None,
+    list[StoreEntry],
+    list[os.DirEntry],
+]:
+    """Return the mtime, .gpg-id and its mtime, sorted entries and visible
+    subdirectories of node
+
+    node itself isn't changed, beyond being the parent of the new entries.
+    """
+    gpg_ids = gpg_id_mtime = None
+    entries, subdirs = [], []
+    try:
+        # Stat before listing so changes made during the listing bump the mtime
+        mtime = _mtime(node.path)
+        with os.scandir(node.path) as it:
+            children = list(it)
+    except OSError as exc:
+        log.warning("Unable to scan %s: %s", node.path, exc)
+        return None, gpg_ids, gpg_id_mtime, entries, subdirs
+
+    now = time.time_ns()
+    if now - mtime < RACY_WINDOW_NS:
+        mtime = None
+
+    # Sort on name to match the previous (is_dir, path) ordering within a directory
+    for entry in sorted(children, key=lambda x: x.name):
+        if _is_visible_dir(entry):
+            subdirs.append(entry)
+        elif _is_gpg_file(entry):
+            recipients = _intern_recipients(pgp.recipient_key_ids(entry.path))
+            name = sys.intern(entry.name[: -len(GPG_SUFFIX)])
+            entries.append(StoreEntry(name, node, recipients))
+        elif entry.name == GPG_ID_FILE:
+            try:
+                gpg_id_mtime = _mtime(entry.path)
+            except OSError:
+                pass
+            else:
+                if now - gpg_id_mtime < RACY_WINDOW_NS:
+                    gpg_id_mtime = None
+            gpg_ids = _read_gpg_ids(entry.path)
+    return mtime, gpg_ids, gpg_id_mtime, entries, subdirs
+
+
+def _read_gpg_ids(path: str) -> tuple[str, ...] | None:
+    """Return the recipients in a .gpg-id file, ignoring comments as pass does"""
+    try:
+        with open(path, encoding="utf-8", errors="replace") as fin:
+            lines = fin.read().splitlines()
+    except OSError as exc:
+        log.warning("Unable to read %s: %s", path, exc)
+        return None
+    gpg_ids = (x.split("#", 1)[0].strip() for x in lines)
+    return tuple(x for x in gpg_ids if x)
+
+
+def _intern_recipients(key_ids: list[str] | None) -> tuple[str, ...] | None:
+    """Return key_ids as a tuple shared with every other entry with the same keys"""
+    if key_ids is None:
+        return None
+    key_ids = tuple(sys.intern(x) for x in key_ids)
+    return _RECIPIENT_SETS.setdefault(key_ids, key_ids)
+
+
+def _mtime(path: str) -> int:
+    """Return the mtime of path in nanoseconds"""
+    return os.stat(path).st_mtime_ns
+
+
+def _is_visible_dir(entry: os.DirEntry) -> bool:
+    """Return True if entry is a directory that isn't hidden"""
+    try:
+        return entry.is_dir() and not entry.name.startswith(".")
+    except OSError:
+        return False
+
+
+def _is_gpg_file(entry: os.DirEntry) -> bool:
+    """Return True if entry is a .gpg file"""
+    try:
+        return os.path.splitext(entry.name)[1] == GPG_SUFFIX and entry.is_file()
+    except OSError:
+        return False
@@ -0,0 +1,197 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+
+from . import store
+from .menu import MenuModel
+from .search import DEFAULT_LIMIT, SearchIndex, merge_ranked
+
+log = logging.getLogger(__name__)
+
+
+def index_path(directory: Path, root: str) -> Path:
+    """Return where the index of the store at root is cached within directory"""
+    digest = hashlib.sha1(os.path.normpath(root).encode()).hexdigest()[:12]
+    return directory / f"store_index-{digest}.bin"
+
+
+class PasswordStore:
+    """One password store: its index, search index and the menus showing it
+
+    Each store has its own lock so a slow (e.g. network mounted) store being
+    scanned or refreshed doesn't hold up the others. The lock is only held to read
+    or change the tree, never while the store is read or the index written, so
+    the UI can take it. root is None until `load` has finished.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        index_path: Path,
+        gpg_home: str | None = None,
+        gpg_binary_path: str | None = None,
+    ) -> None:
+        self.name = name
+        self.path = os.path.normpath(path)
+        self.index_path = index_path
+        # None when the global gpg settings apply
+        self.gpg_home = gpg_home
+        self.gpg_binary_path = gpg_binary_path
+        self.lock = threading.Lock()
+        # Held through a refresh, so each is read and applied before the next
+        self._refresh_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.root: store.StoreDir | None = None
+        self.search_index: SearchIndex | None = None
+        self.menu_model = MenuModel()
+        # Key IDs of the secret keys available to decrypt with, None until known
+        self.secret_key_ids: frozenset[str] | None = None
+        # Set when secret_key_ids changes, until the menus are rebuilt to show it
+        self.secret_keys_changed = False
+        # Changes found in the background for the UI thread, None once it's loaded
+        self.pending: queue.SimpleQueue[
+            list[store.StoreChange] | None
+        ] = queue.SimpleQueue()
+
+    def __repr__(self) -> str:
+        return f"PasswordStore({self.name!r}, {self.path!r})"
+
+    def load(self) -> bool:
+        """Load the cached index, or scan the store, returning True if it was cached"""
+        root = store.load_index(self.index_path, self.path)
+        cached = root is not None
+        if not cached:
+            root = store.scan_store(self.path)
+        with self.lock:
+            self.root = root
+        log.info("Loaded %s with %d entries", self, len(root))
+        return cached
+
+    def drain_pending(self) -> list[list[store.StoreChange] | None]:
+        """Remove and return everything queued in pending"""
+        pending = []
+        while not self.pending.empty():
+            pending.append(self.pending.get_nowait())
+        return pending
+
+    def refresh(self, queue_changes: bool = False) -> list[store.StoreChange]:
+        """Refresh the store and search indexes. The lock must not be held
+
+        The store is read without the lock, which is then only held to apply what
+        changed. With queue_changes, any changes are also put on pending while the
+        lock is held, so the UI sees them in the order they were made.
+        """
+        with self._refresh_lock:
+            root = self.root
+            if root is None:
+                return []
+            update = store.read_update(root)
+            with self.lock:
+                changes = store.apply_update(root, update)
+                self._update_search_index(changes)
+                if queue_changes and changes:
+                    self.pending.put(changes)
+        return changes
+
+    def _update_search_index(self, changes: list[store.StoreChange]) -> None:
+        """Add and remove the names of changed entries. The lock must be held"""
+        if self.search_index is None:
+            return
+        for change in changes:
+            names = store.entry_names(self.root, change.node)
+            if change.added:
+                self.search_index.update(added=names)
+            else:
+                self.search_index.update(removed=names)
+
+    def build_search_index(self) -> None:
+        """Build the search index without holding the lock, then catch up"""
+        with self.lock:
+            root = self.root
+            if root is None:
+                return
+            names = list(store.entry_names(root))
+
+        index = SearchIndex(names)
+        with self.lock:
+            current = set(store.entry_names(root))
+            indexed = set(index)
+            index.update(added=current - indexed, removed=indexed - current)
+            self.search_index = index
+        log.info("Built search index of %d entries for %s", len(index), self)
+
+    def __contains__(self, name: str) -> bool:
+        """Return True if the store has an entry with the root relative name"""
+        with self.lock:
+            if self.root is None:
+                return False
+            return store.find_entry(self.root, name) is not None
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[str]:
+        """Return the names of the entries best matching query"""
+        return [x[1] for x in self.ranked_search(query, limit)]
+
+    def ranked_search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[tuple]:
+        """Return the (sort key, name) of the best matches, as SearchIndex does"""
+        with self.lock:
+            if self.root is None:
+                return []
+            return self._search_index().ranked_search(query, limit)
+
+    def _search_index(self) -> SearchIndex:
+        """Return the search index, building it now if it isn't yet. Needs the lock"""
+        if self.search_index is None:
+            self.search_index = SearchIndex(store.entry_names(self.root))
+        return self.search_index
+
+    def save_index(self) -> None:
+        """Save the index so the next launch can show it without a full scan"""
+        with self.lock:
+            if self.root is None:
+                return
+            index = store.dump_index(self.root)
+        # Compressing and writing it can be slow, so it's done without the lock
+        with self._save_lock:
+            try:
+                store.write_index(index, self.index_path)
+            except OSError as exc:
+                log.warning("Unable to save store index for %s: %s", self, exc)
+
+    def set_secret_key_ids(self, key_ids: frozenset[str] | None) -> None:
+        """Record which secret keys are available. The lock must be held"""
+        if key_ids != self.secret_key_ids:
+            self.secret_key_ids = key_ids
+            self.secret_keys_changed = True
+
+    def can_decrypt(self, entry: store.StoreEntry) -> bool:
+        """Return False only if entry is known to need a key that isn't available"""
+        if self.secret_key_ids is None:
+            return True
+        return store.can_decrypt(entry, self.secret_key_ids)
+
+    def contains(self, path: str | os.PathLike) -> bool:
+        """Return True if path is within this store"""
+        return os.fspath(path).startswith(os.path.join(self.path, ""))
+
+
+def search(
+    stores: list[PasswordStore], query: str, limit: int = DEFAULT_LIMIT
+) -> list[tuple[PasswordStore, str]]:
+    """Return the (store, name) of the entries best matching query in any store"""
+    results = [
+        [(key, (x, name)) for key, name in x.ranked_search(query, limit)]
+        for x in stores
+    ]
+    return merge_ranked(results, limit)
+
+
+def store_for_path(
+    stores: list[PasswordStore], path: str | os.PathLike
+) -> PasswordStore | None:
+    """Return the store holding path, preferring the innermost of nested stores"""
+    matches = [x for x in stores if x.contains(path)]
+    return max(matches, key=lambda x: len(x.path), default=None)
@@ -0,0 +1,87 @@
+import itertools
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable
+
+if TYPE_CHECKING:
+    from secret_cache import SecretCache
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 0
+
+
+class Prefetcher:
+    """Decrypts the entries likely to be opened next into the secret cache
+
+    Decrypts run one at a time on a background thread and must only use a
+    passphrase gpg-agent already has cached, so they never prompt. The first one
+    that fails is taken to mean the agent is locked, and nothing more is prefetched
+    until `start` is called again after the user next decrypts successfully.
+    """
+
+    def __init__(
+        self,
+        decrypt: Callable[[Path], str],
+        cache: "SecretCache",
+        limit: int = DEFAULT_LIMIT,
+    ) -> None:
+        self.limit = limit
+        self._decrypt = decrypt
+        self._cache = cache
+        self._lock = threading.Lock()
+        # Bumped to abandon the run in progress
+        self._generation = 0
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0 and self._cache.enabled
+
+    def start(self, paths: Iterable[Path]) -> None:
+        """Prefetch the first limit paths, most likely first, replacing any run"""
+        if not self.enabled:
+            return
+        # Prefetching more than the cache holds would evict what was just fetched
+        count = min(self.limit, self._cache.max_entries)
+        paths = list(itertools.islice(paths, count))
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._thread = threading.Thread(
+            target=self._run, args=(generation, paths), name="prefetch", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Abandon the run in progress, if any"""
+        with self._lock:
+            self._generation += 1
+
+    def _run(self, generation: int, paths: list[Path]) -> None:
+        """Decrypt the uncached paths until one fails or the run is abandoned"""
+        fetched = 0
+        for path in paths:
+            if self._generation != generation:
+                return
+            if path in self._cache:
+                continue
+
+            try:
+                plaintext = self._decrypt(path)
+            except Exception:
+                log.exception("Prefetching %s failed", path)
+                plaintext = ""
+            if not plaintext:
+                log.info("gpg-agent is locked, stopped prefetching")
+                self.stop()
+                return
+
+            with self._lock:
+                # Don't resurrect secrets cleared while this one was decrypting
+                if self._generation != generation:
+                    return
+                self._cache.put(path, plaintext)
+            fetched += 1
+        log.info("Prefetched %d secrets", fetched)
@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 0.0
+DEFAULT_MAX_ENTRIES = 16
+
+
+@dataclass(slots=True)
+class _CachedSecret:
+    # (inode, mtime, size) of the file the plaintext was decrypted from
+    identity: tuple[int, int, int]
+    plaintext: bytearray
+    expires: float
+
+
+class SecretCache:
+    """Short lived LRU cache of decrypted secrets, keyed on path and file identity
+
+    Plaintexts are held in bytearrays which are zeroed when they're evicted,
+    expire or the file changes. A ttl of zero disables the cache. `get` has to
+    return a str, so callers still end up with an immutable copy.
+    """
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._secrets: OrderedDict[str, _CachedSecret] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._secrets)
+
+    def __contains__(self, path: Path) -> bool:
+        """Return True if a fresh plaintext of path is cached, without copying it"""
+        key = str(path)
+        with self._lock:
+            secret = self._secrets.get(key)
+            return (
+                secret is not None
+                and secret.expires > self._clock()
+                and secret.identity == _identity(key)
+            )
+
+    def get(self, path: Path) -> str | None:
+        """Return the cached plaintext of path if it's fresh and the file unchanged"""
+        key = str(path)
+        with self._lock:
+            secret = self._secrets.get(key)
+            if secret is None:
+                return None
+            if secret.expires <= self._clock() or secret.identity != _identity(key):
+                self._evict(key)
+                return None
+            self._secrets.move_to_end(key)
+            return secret.plaintext.decode()
+
+    def put(self, path: Path, plaintext: str) -> None:
+        """Cache plaintext for path, evicting the least recently used if full"""
+        if not self.enabled or not plaintext:
+            return
+
+        key = str(path)
+        identity = _identity(key)
+        if identity is None:
+            return
+        with self._lock:
+            self._evict(key)
+            self._secrets[key] = _CachedSecret(
+                identity, bytearray(plaintext.encode()), self._clock() + self.ttl
+            )
+            while len(self._secrets) > self.max_entries:
+                self._evict(next(iter(self._secrets)))
+
+    def invalidate(self, path: Path | str) -> None:
+        """Drop the secret for path, or every secret below it if it's a directory"""
+        key = str(path)
+        prefix = key + os.sep
+        with self._lock:
+            for cached in [
+                x for x in self._secrets if x == key or x.startswith(prefix)
+            ]:
+                self._evict(cached)
+
+    def expire(self) -> int:
+        """Drop every expired secret, returning how many were dropped"""
+        now = self._clock()
+        with self._lock:
+            expired = [k for k, v in self._secrets.items() if v.expires <= now]
+            for key in expired:
+                self._evict(key)
+        return len(expired)
+
+    def clear(self) -> None:
+        """Drop every secret"""
+        with self._lock:
+            for key in list(self._secrets):
+                self._evict(key)
+
+    def _evict(self, key: str) -> None:
+        """Zero and forget the secret for key if there is one"""
+        secret = self._secrets.pop(key, None)
+        if secret is not None:
+            secret.plaintext[:] = bytes(len(secret.plaintext))
+
+
+def _identity(path: str) -> tuple[int, int, int] | None:
+    """Return what identifies the current contents of path, or None if it's gone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
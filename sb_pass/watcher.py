@@ -0,0 +1,320 @@
+import abc
+import ctypes
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable
+
+try:
+    from .model.store import GPG_ID_FILE, GPG_SUFFIX, RACY_WINDOW_NS
+except ImportError:
+    # Imported as a top level module by the app, which runs from within sb_pass
+    from model.store import GPG_ID_FILE, GPG_SUFFIX, RACY_WINDOW_NS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_MAX_DELAY = 5.0
+
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_IN_WATCH_MASK = (
+    _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+    | _IN_DELETE_SELF
+    | _IN_MOVE_SELF
+    | _IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class WatchBackend(abc.ABC):
+    """Source of change notifications for the directories of a store"""
+
+    @abc.abstractmethod
+    def wait(self, timeout: float) -> bool:
+        """Block for up to timeout seconds, returning True if the store changed"""
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+class PollingBackend(WatchBackend):
+    """Detect changes by comparing the mtimes of every visible store directory
+
+    The mtimes of .gpg-id files are compared too, as they're edited in place.
+    """
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+        self._snapshot = self._take_snapshot()
+
+    def wait(self, timeout: float) -> bool:
+        time.sleep(timeout)
+        if all(self._unchanged(path, value) for path, value in self._snapshot.items()):
+            return False
+        self._snapshot = self._take_snapshot()
+        return True
+
+    def _unchanged(self, path: str, value: tuple) -> bool:
+        """Return True if path still matches its snapshot value"""
+        try:
+            return self._snapshot_value(path) == value
+        except OSError:
+            return value is None
+
+    def _take_snapshot(self) -> dict[str, tuple]:
+        """Return the snapshot values of root and all visible directories below it"""
+        snapshot = {}
+        pending = [self._root]
+        while pending:
+            path = pending.pop()
+            try:
+                snapshot[path] = self._snapshot_value(path)
+                gpg_ids = []
+                pending.extend(_visible_subdirs(path, gpg_ids))
+                for gpg_id in gpg_ids:
+                    snapshot[gpg_id] = self._snapshot_value(gpg_id)
+            except OSError:
+                snapshot[path] = None
+        return snapshot
+
+    def _snapshot_value(self, path: str) -> tuple:
+        """Return the mtime of path, plus its listing if the mtime can't be trusted"""
+        mtime = os.stat(path).st_mtime_ns
+        if os.path.basename(path) == GPG_ID_FILE:
+            return mtime, None
+        # It may change again within the same mtime tick, so compare the listing too
+        if time.time_ns() - mtime < RACY_WINDOW_NS:
+            return mtime, frozenset(os.listdir(path))
+        return mtime, None
+
+
+class InotifyBackend(WatchBackend):
+    """Detect changes with Linux inotify watches on every visible store directory"""
+
+    def __init__(self, root: str) -> None:
+        # ctypes.util pulls in subprocess, so only load it when it's needed
+        import ctypes.util
+
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        self._watches: dict[int, str] = {}
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        # Events the store doesn't care about, e.g. closing a written entry, don't
+        # end the wait, or they'd cut a debounce short
+        while True:
+            remaining = max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self._fd], [], [], remaining)
+            if not ready:
+                return False
+
+            changed = False
+            while True:
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    break
+                changed |= self._handle_events(data)
+            if changed:
+                return True
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _handle_events(self, data: bytes) -> bool:
+        """Return True if any of the raw events in data affect the store"""
+        changed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & _IN_Q_OVERFLOW:
+                changed = True
+            elif mask & _IN_IGNORED:
+                self._watches.pop(wd, None)
+            elif mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                changed = True
+            elif mask & _IN_ISDIR:
+                if name.startswith("."):
+                    continue
+                changed = True
+                if mask & (_IN_CREATE | _IN_MOVED_TO) and wd in self._watches:
+                    self._watch_new_tree(os.path.join(self._watches[wd], name))
+            elif name == GPG_ID_FILE:
+                # Written in place by pass init, which only close-write reports
+                changed = True
+            elif os.path.splitext(name)[1] == GPG_SUFFIX and not mask & _IN_CLOSE_WRITE:
+                changed = True
+        return changed
+
+    def _watch_new_tree(self, path: str) -> None:
+        """Watch a directory that appeared after the backend started"""
+        try:
+            self._watch_tree(path)
+        except OSError as exc:
+            log.warning("Unable to watch %s: %s", path, exc)
+
+    def _watch_tree(self, root: str) -> None:
+        """Add a watch to root and all visible directories below it"""
+        pending = [root]
+        while pending:
+            path = pending.pop()
+            wd = self._libc.inotify_add_watch(
+                self._fd, os.fsencode(path), _IN_WATCH_MASK
+            )
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR) and path != root:
+                    continue
+                raise OSError(err, f"Unable to watch {path}: {os.strerror(err)}")
+            self._watches[wd] = path
+            try:
+                pending.extend(_visible_subdirs(path))
+            except OSError as exc:
+                log.warning("Unable to list %s: %s", path, exc)
+
+
+def create_backend(root: str) -> WatchBackend:
+    """Return the best available backend for watching root"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyBackend(root)
+        except OSError as exc:
+            log.info("inotify unavailable (%s), polling %s instead", exc, root)
+    return PollingBackend(root)
+
+
+class StoreWatcher:
+    """Watch a store in a background thread, calling back once per burst of changes
+
+    After the first change the watcher waits until no further changes have been seen
+    for `debounce` seconds (but never longer than `max_delay`) before calling back.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        callback: Callable[[], None],
+        backend: Callable[[str], WatchBackend] = create_backend,
+        interval: float = DEFAULT_INTERVAL,
+        debounce: float = DEFAULT_DEBOUNCE,
+        max_delay: float = DEFAULT_MAX_DELAY,
+    ) -> None:
+        self._root = root
+        self._callback = callback
+        self._backend = backend
+        self._interval = interval
+        self._debounce = debounce
+        self._max_delay = max_delay
+        self._stopped = threading.Event()
+        self._started = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def root(self) -> str:
+        return self._root
+
+    def start(self) -> None:
+        """Start watching in a background thread"""
+        self._stopped.clear()
+        self._started.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="store-watcher", daemon=True
+        )
+        self._thread.start()
+
+    def wait_started(self, timeout: float | None = None) -> bool:
+        """Block until the backend is watching, returning False on timeout"""
+        return self._started.wait(timeout)
+
+    def stop(self, wait: bool = True) -> None:
+        """Stop watching, optionally waiting for the background thread to finish"""
+        self._stopped.set()
+        if self._thread is not None and wait:
+            self._thread.join(timeout=self._interval + self._debounce + 1)
+        self._thread = None
+
+    def _run(self) -> None:
+        """Wait for changes, coalescing each burst into a single callback"""
+        try:
+            backend = self._backend(self._root)
+        except OSError as exc:
+            log.warning("Unable to watch %s: %s", self._root, exc)
+            return
+
+        log.info("Watching %s with %s", self._root, type(backend).__name__)
+        self._started.set()
+        try:
+            while not self._stopped.is_set():
+                if not backend.wait(self._interval):
+                    continue
+
+                deadline = time.monotonic() + self._max_delay
+                while time.monotonic() < deadline and not self._stopped.is_set():
+                    if not backend.wait(self._debounce):
+                        break
+
+                if not self._stopped.is_set():
+                    self._notify()
+        finally:
+            backend.close()
+
+    def _notify(self) -> None:
+        """Call the callback, logging rather than dying on failures"""
+        try:
+            self._callback()
+        except Exception:
+            log.exception("Store watcher callback failed for %s", self._root)
+
+
+def _visible_subdirs(path: str, gpg_ids: list[str] | None = None) -> list[str]:
+    """Return the paths of the directories within path that aren't hidden
+
+    The path of path's .gpg-id, if it has one, is appended to gpg_ids.
+    """
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name == GPG_ID_FILE and gpg_ids is not None:
+                gpg_ids.append(entry.path)
+            elif not entry.name.startswith(".") and entry.is_dir():
+                subdirs.append(entry.path)
+    return subdirs
@@ -3,6 +3,9 @@ from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 import pytest
 
+from benchmarks.fixtures import gpg_binary, gpg_home  # noqa: F401
+from benchmarks.synthetic import encrypt_file
+from benchmarks.synthetic import settle as settle_mtimes
 from sb_pass import config
 
 
@@ -21,3 +24,59 @@ def _setup_config_defaults():
 
     config._DEFAULT_GPG_HOME = tmp_gpg_home
     config._DEFAULT_STORE_HOME = tmp_store_home
+
+
+@pytest.fixture
+def encrypt(gpg_binary, gpg_home):
+    """Return a function that encrypts text to the gpg_home key at a path"""
+
+    def _encrypt(path: Path, text: str) -> Path:
+        return encrypt_file(gpg_home, path, text, gpg_binary)
+
+    return _encrypt
+
+
+@pytest.fixture
+def touch():
+    """Return a function that creates files under a root, holding their names"""
+
+    def _touch(root: Path, *names: str) -> None:
+        for name in names:
+            path = root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(name)
+
+    return _touch
+
+
+@pytest.fixture
+def settle():
+    """Return a function that backdates directory and .gpg-id mtimes under a root
+
+    This keeps them outside the racy window, so a later change is always seen.
+    """
+    return settle_mtimes
+
+
+@pytest.fixture
+def store_home(tmp_path, touch, settle):
+    """Return a settled store of entries at the top level and in web/"""
+    home = tmp_path / "store"
+    touch(home, "a.gpg", "c.gpg", "web/github.gpg", "web/gitlab.gpg")
+    settle(home)
+    return home
+
+
+@pytest.fixture
+def encrypted_to():
+    """Return a function giving the leading packets of a message to key IDs"""
+
+    def _encrypted_to(*key_ids: str) -> bytes:
+        data = b""
+        for key_id in key_ids:
+            body = bytes([3]) + bytes.fromhex(key_id) + bytes([1]) + bytes(20)
+            data += bytes([0xC1, len(body)]) + body
+        # Symmetrically encrypted integrity protected data
+        return data + bytes([0xD2, 2, 1, 0])
+
+    return _encrypted_to
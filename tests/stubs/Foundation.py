@@ -0,0 +1,10 @@
+"""Stand-in for the parts of PyObjC's Foundation module the app uses"""
+
+
+class NSObject:
+    @classmethod
+    def alloc(cls):
+        return cls()
+
+    def init(self):
+        return self
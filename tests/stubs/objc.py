@@ -0,0 +1,6 @@
+"""Stand-in for the parts of PyObjC's objc module the app uses"""
+import builtins
+
+
+def super(cls, obj):
+    return builtins.super(cls, obj)
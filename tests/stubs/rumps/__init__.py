@@ -0,0 +1,94 @@
+"""Stand-in for the parts of rumps the app uses while starting up"""
+import os
+from collections import OrderedDict
+
+
+class _NSMenu:
+    def setDelegate_(self, delegate):
+        self.delegate = delegate
+
+
+class MenuItem(OrderedDict):
+    def __init__(
+        self,
+        title,
+        callback=None,
+        key=None,
+        icon=None,
+        dimensions=None,
+        template=None,
+    ):
+        super().__init__()
+        self.title = title
+        self.callback = callback
+        self.state = 0
+        self._menu = _NSMenu()
+
+    def __hash__(self):
+        return id(self)
+
+    def __eq__(self, other):
+        return self is other
+
+    def add(self, item):
+        if item is None:
+            self[f"separator_{len(self)}"] = None
+        elif isinstance(item, dict) and not isinstance(item, MenuItem):
+            for title, children in item.items():
+                menu = MenuItem(title)
+                menu.update(children)
+                self.add(menu)
+        else:
+            self[item.title] = item
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def insert_before(self, existing, item):
+        items = list(self.values())
+        index = list(self).index(existing)
+        self.clear()
+        self.update(items[:index] + [item] + items[index:])
+
+
+class Timer:
+    def __init__(self, callback, interval):
+        self.callback = callback
+        self.interval = interval
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+
+class App:
+    def __init__(
+        self, name, title=None, icon=None, template=None, menu=None, quit_button=None
+    ):
+        self.name = name
+        self._menu = MenuItem(name)
+
+    @property
+    def menu(self):
+        return self._menu
+
+    @menu.setter
+    def menu(self, items):
+        self._menu.update(items)
+
+    def run(self):
+        pass
+
+
+def application_support(name):
+    path = os.path.join(os.environ["SB_PASS_APP_SUPPORT"], name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def quit_application(sender=None):
+    pass
@@ -0,0 +1,3 @@
+from collections import namedtuple
+
+Response = namedtuple("Response", ["clicked", "text"])
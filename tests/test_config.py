@@ -1,4 +1,5 @@
 import json
+import os
 from pathlib import Path
 from tempfile import NamedTemporaryFile
 
@@ -10,7 +11,9 @@ from sb_pass.config import Config
 
 @pytest.fixture
 def conf(root):
-    return config.Config(root)
+    conf = config.Config(root)
+    yield conf
+    conf.flush()
 
 
 class TestGettingDefaults:
@@ -29,8 +32,26 @@ class TestGettingDefaults:
     def test_default_max_recent_items(self, conf: Config):
         assert conf.max_recent_items == config._DEFAULT_MAX_RECENT_ITEMS
 
+    def test_default_watch_store(self, conf: Config):
+        assert conf.watch_store == config._DEFAULT_WATCH_STORE
+
+    def test_default_use_gpg_worker(self, conf: Config):
+        assert conf.use_gpg_worker == config._DEFAULT_USE_GPG_WORKER
+
+    def test_default_decrypt_timeout(self, conf: Config):
+        assert conf.decrypt_timeout == config._DEFAULT_DECRYPT_TIMEOUT
+
+    def test_default_secret_cache_ttl(self, conf: Config):
+        assert conf.secret_cache_ttl == config._DEFAULT_SECRET_CACHE_TTL
+
+    def test_default_secret_cache_size(self, conf: Config):
+        assert conf.secret_cache_size == config._DEFAULT_SECRET_CACHE_SIZE
+
+    def test_default_prefetch_recents(self, conf: Config):
+        assert conf.prefetch_recents == config._DEFAULT_PREFETCH_RECENTS
+
     def test_default_gpg_binary_path(self, conf: Config):
-        assert conf.gpg_binary_path == config._DEFAULT_GPG_BINARY_PATH
+        assert conf.gpg_binary_path == config._default_gpg_binary_path()
 
 
 class TestSettingConfigValues:
@@ -52,6 +73,41 @@ class TestSettingConfigValues:
         assert conf.gpg_home == expected
         assert conf.reload_settings() == {conf.GPG_HOME: expected}
 
+    def test_setting_watch_store(self, conf: Config):
+        conf.watch_store = True
+
+        assert conf.watch_store is True
+        assert conf.reload_settings() == {conf.WATCH_STORE: True}
+
+    def test_setting_use_gpg_worker(self, conf: Config):
+        conf.use_gpg_worker = True
+
+        assert conf.use_gpg_worker is True
+        assert conf.reload_settings() == {conf.USE_GPG_WORKER: True}
+
+    def test_setting_decrypt_timeout(self, conf: Config):
+        conf.decrypt_timeout = 5.0
+
+        assert conf.decrypt_timeout == 5.0
+        assert conf.reload_settings() == {conf.DECRYPT_TIMEOUT: 5.0}
+
+    def test_setting_prefetch_recents(self, conf: Config):
+        conf.prefetch_recents = 5
+
+        assert conf.prefetch_recents == 5
+
+    def test_setting_secret_cache_ttl(self, conf: Config):
+        conf.secret_cache_ttl = 30.0
+
+        assert conf.secret_cache_ttl == 30.0
+        assert conf.reload_settings() == {conf.SECRET_CACHE_TTL: 30.0}
+
+    def test_setting_secret_cache_size(self, conf: Config):
+        conf.secret_cache_size = 4
+
+        assert conf.secret_cache_size == 4
+        assert conf.reload_settings() == {conf.SECRET_CACHE_SIZE: 4}
+
     def test_setting_gpg_binary_path(self, conf: Config):
         expected = "/some/test/gpg_binary_path"
 
@@ -86,3 +142,168 @@ def test_existing_settings_are_loaded():
         conf = Config(Path(settings.name))
 
         assert conf._settings == existing
+
+
+class TestWriteBehind:
+    """Tests for deferred writes, reloading and change notifications"""
+
+    def test_writes_are_deferred_until_flush(self, conf: Config, root: Path):
+        conf.store_home = "/a"
+        conf.gpg_home = "/b"
+
+        assert not root.exists()
+        conf.flush()
+        assert json.loads(root.read_text()) == {
+            conf.STORE_HOME: "/a",
+            conf.GPG_HOME: "/b",
+        }
+        assert not root.with_name(root.name + ".tmp").exists()
+
+    def test_writes_happen_after_delay(self, root: Path):
+        conf = Config(root, save_delay=0.01)
+        conf.store_home = "/a"
+
+        conf._save_timer.join()
+
+        assert json.loads(root.read_text()) == {conf.STORE_HOME: "/a"}
+
+    def test_subscribers_are_notified(self, conf: Config):
+        seen = []
+        conf.subscribe(conf.WATCH_STORE, seen.append)
+
+        conf.watch_store = True
+        conf.watch_store = True
+
+        assert seen == [True]
+
+    def test_failing_subscriber_does_not_stop_others(self, conf: Config):
+        seen = []
+        conf.subscribe(conf.STORE_HOME, lambda value: 1 / 0)
+        conf.subscribe(conf.STORE_HOME, seen.append)
+
+        conf.store_home = "/a"
+
+        assert seen == ["/a"]
+
+    def test_external_edit_is_reloaded(self, conf: Config, root: Path):
+        seen = []
+        conf.subscribe(conf.GPG_HOME, seen.append)
+        conf.subscribe(conf.STORE_HOME, seen.append)
+        conf.store_home = "/a"
+        conf.flush()
+        root.write_text(json.dumps({conf.GPG_HOME: "/edited"}))
+        os.utime(root, ns=(1, 1))
+
+        assert conf.reload_if_changed()
+        assert conf.gpg_home == "/edited"
+        assert sorted(seen) == ["/a", "/edited", config._DEFAULT_STORE_HOME]
+        assert not conf.reload_if_changed()
+
+    def test_pending_write_wins_over_external_edit(self, conf: Config, root: Path):
+        root.write_text(json.dumps({conf.GPG_HOME: "/edited"}))
+        conf.store_home = "/a"
+
+        assert not conf.reload_if_changed()
+        conf.flush()
+        assert json.loads(root.read_text()) == {conf.STORE_HOME: "/a"}
+
+    def test_unreadable_settings_are_ignored(self, root: Path):
+        root.write_text('{"store_home": "/trunc')
+
+        assert Config(root)._settings == {}
+
+    def test_unreadable_edit_keeps_settings(self, conf: Config, root: Path):
+        conf.store_home = "/a"
+        conf.flush()
+        seen = []
+        conf.subscribe(conf.STORE_HOME, seen.append)
+        root.write_text('{"store_home": "/trunc')
+        os.utime(root, ns=(1, 1))
+
+        assert not conf.reload_if_changed()
+        assert conf.store_home == "/a"
+        assert seen == []
+
+        conf.watch_store = True
+        conf.flush()
+        assert json.loads(root.read_text()) == {
+            conf.STORE_HOME: "/a",
+            conf.WATCH_STORE: True,
+        }
+
+    def test_reloads_once_edit_is_readable(self, conf: Config, root: Path):
+        root.write_text("[]")
+        os.utime(root, ns=(1, 1))
+        assert not conf.reload_if_changed()
+
+        root.write_text(json.dumps({conf.STORE_HOME: "/b"}))
+        os.utime(root, ns=(2, 2))
+
+        assert conf.reload_if_changed()
+        assert conf.store_home == "/b"
+
+
+class TestStores:
+    def test_default_is_store_home(self, conf: Config):
+        assert conf.stores == [
+            config.StoreConfig(config._DEFAULT_STORE_NAME, config._DEFAULT_STORE_HOME)
+        ]
+
+    def test_stores_from_settings(self, root: Path):
+        root.write_text(
+            json.dumps(
+                {
+                    Config.STORES: [
+                        {"path": "/stores/team/", Config.GPG_HOME: "/gnupg-team"},
+                        {"name": "Mine", "path": "/stores/personal"},
+                    ]
+                }
+            )
+        )
+
+        assert Config(root).stores == [
+            config.StoreConfig("team", "/stores/team/", gpg_home="/gnupg-team"),
+            config.StoreConfig("Mine", "/stores/personal"),
+        ]
+
+    def test_stores_with_the_same_name_are_numbered(self, root: Path):
+        root.write_text(
+            json.dumps(
+                {
+                    Config.STORES: [
+                        {"path": "/home/me/.password-store"},
+                        {"path": "/mnt/team/.password-store"},
+                        {"name": ".password-store 2", "path": "/mnt/other"},
+                    ]
+                }
+            )
+        )
+
+        assert [x.name for x in Config(root).stores] == [
+            ".password-store",
+            ".password-store 2",
+            ".password-store 2 2",
+        ]
+
+    def test_invalid_stores_are_skipped(self, root: Path):
+        invalid = [{"name": "x"}, "/a", None, {"name": "a/b", "path": "/b"}]
+        root.write_text(json.dumps({Config.STORES: invalid}))
+
+        assert Config(root).stores == [
+            config.StoreConfig(config._DEFAULT_STORE_NAME, config._DEFAULT_STORE_HOME)
+        ]
+
+    def test_setting_stores_omits_inherited_settings(self, conf: Config, root: Path):
+        seen = []
+        conf.subscribe(conf.STORES, seen.append)
+        stores = [config.StoreConfig("team", "/team", gpg_binary_path="/bin/gpg")]
+
+        conf.stores = stores
+        conf.flush()
+
+        assert json.loads(root.read_text()) == {
+            conf.STORES: [
+                {"name": "team", "path": "/team", conf.GPG_BINARY_PATH: "/bin/gpg"}
+            ]
+        }
+        assert seen == [stores]
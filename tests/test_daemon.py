@@ -0,0 +1,318 @@
+import json
+import os
+import socket
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from benchmarks.synthetic import GPG_RECIPIENT
+from sb_pass import config, daemon
+from sb_pass.model import stores
+from sb_pass.__main__ import main
+
+
+@pytest.fixture
+def store_home(tmp_path, encrypt):
+    """Return a store holding two encrypted entries"""
+    home = tmp_path / "store"
+    encrypt(home / "web" / "github.gpg", "hunter2\nuser: octocat\n")
+    encrypt(home / "email.gpg", "s3cret\n")
+    return home
+
+
+@pytest.fixture
+def config_path(tmp_path, store_home, gpg_binary, gpg_home):
+    """Return a config.json pointing at the test store and gpg home"""
+    path = tmp_path / "config.json"
+    settings = {
+        config.Config.STORE_HOME: str(store_home),
+        config.Config.GPG_HOME: gpg_home,
+        config.Config.GPG_BINARY_PATH: gpg_binary,
+    }
+    path.write_text(json.dumps(settings))
+    return path
+
+
+@pytest.fixture
+def service(config_path):
+    service = daemon.Service(
+        config.Config(config_path), config_path.parent, refresh_interval=0
+    )
+    yield service
+    service.close()
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return tmp_path / "run" / "daemon.sock"
+
+
+@pytest.fixture
+def server(service, socket_path):
+    """Serve service on socket_path from a background thread"""
+    server = daemon.Daemon(service, socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+class TestService:
+    def test_list_returns_sorted_names(self, service):
+        assert service.list_names() == ["email", "web/github"]
+
+    def test_list_filters_on_prefix(self, service):
+        assert service.list_names("web/") == ["web/github"]
+
+    def test_search_finds_entry(self, service):
+        assert service.search("git") == ["web/github"]
+
+    def test_search_limit(self, service, store_home):
+        for i in range(40):
+            (store_home / "many").mkdir(exist_ok=True)
+            (store_home / "many" / f"site{i:02}.gpg").touch()
+
+        assert len(service.search("site", limit=50)) == 40
+        assert len(service.search("site", limit=5)) == 5
+
+    def test_show_decrypts_entry(self, service):
+        assert service.show("web/github") == "hunter2\nuser: octocat\n"
+
+    def test_show_field(self, service):
+        assert service.show("web/github", "user") == "octocat"
+
+    def test_show_missing_field_raises(self, service):
+        with pytest.raises(daemon.RequestError, match="has no url"):
+            service.show("web/github", "url")
+
+    def test_show_unknown_entry_raises(self, service):
+        with pytest.raises(daemon.RequestError):
+            service.show("missing")
+
+    def test_refresh_picks_up_new_entries(self, service, store_home, encrypt):
+        encrypt(store_home / "bank.gpg", "pin\n")
+        assert service.list_names() == ["bank", "email", "web/github"]
+
+    def test_cached_index_is_refreshed_on_load(self, config_path, store_home, encrypt):
+        cached = stores.PasswordStore(
+            "store", str(store_home), stores.index_path(config_path.parent, store_home)
+        )
+        cached.load()
+        cached.save_index()
+        encrypt(store_home / "bank.gpg", "pin\n")
+
+        service = daemon.Service(config.Config(config_path), config_path.parent)
+        try:
+            assert service.list_names() == ["bank", "email", "web/github"]
+        finally:
+            service.close()
+
+    def test_handle_rejects_unknown_command(self, service):
+        with pytest.raises(daemon.RequestError):
+            service.handle({"command": "rm"})
+
+    def test_handle_rejects_missing_argument(self, service):
+        with pytest.raises(daemon.RequestError):
+            service.handle({"command": "show"})
+
+    def test_several_stores_are_prefixed(self, config_path, tmp_path, encrypt):
+        encrypt(tmp_path / "team" / "deploy.gpg", "t0ken\n")
+        encrypt(tmp_path / "team" / "github.gpg", "t0ken\n")
+        encrypt(tmp_path / "team" / "email.gpg", "t0ken\n")
+        settings = json.loads(config_path.read_text())
+        settings[config.Config.STORES] = [
+            {"name": "mine", "path": settings.pop(config.Config.STORE_HOME)},
+            {"path": str(tmp_path / "team")},
+        ]
+        config_path.write_text(json.dumps(settings))
+        service = daemon.Service(config.Config(config_path), tmp_path)
+
+        try:
+            assert service.list_names() == [
+                "mine/email",
+                "mine/web/github",
+                "team/deploy",
+                "team/email",
+                "team/github",
+            ]
+            assert service.search("deploy") == ["team/deploy"]
+            assert service.search("email") == ["mine/email", "team/email"]
+            # Ranked on the match, not the order of the stores
+            assert service.search("github") == ["team/github", "mine/web/github"]
+            assert service.show("team/deploy") == "t0ken\n"
+            with pytest.raises(daemon.RequestError):
+                service.show("deploy")
+        finally:
+            service.close()
+
+    def test_stores_with_the_same_name_resolve_separately(
+        self, config_path, tmp_path, encrypt
+    ):
+        encrypt(tmp_path / "me" / ".password-store" / "email.gpg", "mine\n")
+        encrypt(tmp_path / "team" / ".password-store" / "email.gpg", "team\n")
+        settings = json.loads(config_path.read_text())
+        settings[config.Config.STORES] = [
+            {"path": str(tmp_path / "me" / ".password-store")},
+            {"path": str(tmp_path / "team" / ".password-store")},
+        ]
+        config_path.write_text(json.dumps(settings))
+        service = daemon.Service(config.Config(config_path), tmp_path)
+
+        try:
+            assert service.list_names() == [
+                ".password-store 2/email",
+                ".password-store/email",
+            ]
+            assert service.show(".password-store/email") == "mine\n"
+            assert service.show(".password-store 2/email") == "team\n"
+        finally:
+            service.close()
+
+    def test_show_rejects_paths_outside_store(self, service):
+        with pytest.raises(daemon.RequestError):
+            service.show("../store/email")
+
+
+class TestDaemon:
+    def test_socket_is_private(self, server, socket_path):
+        assert socket_path.stat().st_mode & 0o777 == 0o600
+        assert socket_path.parent.stat().st_mode & 0o777 == 0o700
+
+    def test_client_round_trip(self, server, socket_path):
+        with daemon.Client(socket_path) as client:
+            assert client.request("ping") == "pong"
+            assert client.request("list") == ["email", "web/github"]
+            assert client.request("show", name="email") == "s3cret\n"
+
+    def test_client_raises_request_errors(self, server, socket_path):
+        with daemon.Client(socket_path) as client:
+            with pytest.raises(daemon.RequestError, match="No such entry"):
+                client.request("show", name="missing")
+            assert client.request("ping") == "pong"
+
+    def test_replies_longer_than_a_request(self, server, socket_path, store_home):
+        names = [f"many/entry-with-a-fairly-long-name-{i:05}" for i in range(3000)]
+        for name in names:
+            (store_home / "many").mkdir(exist_ok=True)
+            (store_home / f"{name}.gpg").touch()
+
+        with daemon.Client(socket_path) as client:
+            assert client.request("list", prefix="many/") == names
+            assert client.request("ping") == "pong"
+
+    def test_oversized_request_is_rejected(self, server, socket_path):
+        with daemon.Client(socket_path) as client:
+            with pytest.raises(daemon.RequestError, match="too large"):
+                client.request("search", query="x" * daemon.MAX_REQUEST_SIZE)
+
+    def test_invalid_request_is_reported(self, server):
+        response = server.respond(b"not json")
+        assert response["ok"] is False
+
+    def test_stop_shuts_down_and_removes_socket(self, service, socket_path):
+        server = daemon.Daemon(service, socket_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        with daemon.Client(socket_path) as client:
+            client.request("stop")
+        thread.join(timeout=5)
+        server.server_close()
+
+        assert not thread.is_alive()
+        assert not socket_path.exists()
+
+    def test_running_daemon_is_not_replaced(self, server, service, socket_path):
+        with pytest.raises(OSError, match="already serving"):
+            daemon.Daemon(service, socket_path)
+
+        with daemon.Client(socket_path) as client:
+            assert client.request("list") == ["email", "web/github"]
+
+    def test_stale_socket_is_replaced(self, service, socket_path):
+        socket_path.parent.mkdir(parents=True)
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(os.fspath(socket_path))
+        stale.close()
+
+        server = daemon.Daemon(service, socket_path)
+        server.server_close()
+
+
+class TestMain:
+    def test_list_without_daemon_runs_in_process(
+        self, config_path, socket_path, capsys
+    ):
+        args = ["--config", str(config_path), "--socket", str(socket_path), "list"]
+        assert main(args) == 0
+        assert capsys.readouterr().out == "email\nweb/github\n"
+
+    def test_show_through_daemon(self, server, config_path, socket_path, capsys):
+        args = ["--config", str(config_path), "--socket", str(socket_path)]
+        assert main(args + ["show", "web/github"]) == 0
+        assert capsys.readouterr().out == "hunter2\nuser: octocat\n"
+
+    def test_unknown_entry_fails(self, config_path, socket_path, capsys):
+        args = ["--config", str(config_path), "--socket", str(socket_path)]
+        assert main(args + ["show", "missing"]) == 1
+        assert "No such entry" in capsys.readouterr().err
+
+    def test_second_daemon_fails(self, server, config_path, socket_path, capsys):
+        args = ["--config", str(config_path), "--socket", str(socket_path), "daemon"]
+        assert main(args) == 1
+        assert "already serving" in capsys.readouterr().err
+
+    def test_stop_without_daemon_fails(self, config_path, socket_path):
+        args = ["--config", str(config_path), "--socket", str(socket_path), "stop"]
+        assert main(args) == 1
+
+
+class TestReencrypt:
+    """Tests for re-encrypting entries that aren't encrypted to their .gpg-id"""
+
+    @pytest.fixture(autouse=True)
+    def gpg_id(self, store_home):
+        (store_home / ".gpg-id").write_text(GPG_RECIPIENT + "\n")
+
+    @pytest.fixture
+    def rotated(self):
+        """Pretend the .gpg-id key changed, so every entry needs re-encrypting"""
+        with mock.patch(
+            "sb_pass.gpg.Gpg.encryption_key_ids",
+            return_value=frozenset({"0123456789ABCDEF"}),
+        ):
+            yield
+
+    def test_plan_skips_entries_already_encrypted_to_gpg_id(self, service):
+        [(_, jobs)] = service.reencrypt_plan()
+
+        assert jobs == []
+
+    def test_dry_run_prints_entries(self, config_path, socket_path, rotated, capsys):
+        args = ["--config", str(config_path), "--socket", str(socket_path)]
+        assert main(args + ["reencrypt", "--dry-run"]) == 0
+        assert capsys.readouterr().out == "email\nweb/github\n"
+
+    def test_reencrypts_entries(self, config_path, socket_path, store_home, rotated):
+        before = (store_home / "email.gpg").read_bytes()
+        args = ["--config", str(config_path), "--socket", str(socket_path)]
+
+        assert main(args + ["reencrypt", "-j", "2"]) == 0
+
+        assert (store_home / "email.gpg").read_bytes() != before
+        service = daemon.Service(config.Config(config_path), config_path.parent)
+        assert service.show("email") == "s3cret\n"
+        service.close()
+
+    def test_nothing_to_do(self, config_path, socket_path, capsys):
+        args = ["--config", str(config_path), "--socket", str(socket_path)]
+        assert main(args + ["reencrypt"]) == 0
+        assert "already encrypted" in capsys.readouterr().err
+
+
+def test_default_socket_path_uses_runtime_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert daemon.default_socket_path().parent.parent == Path(tmp_path)
@@ -0,0 +1,218 @@
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from sb_pass import dispatch
+
+_PATH = Path("/store/web/github.gpg")
+
+
+class _Decrypter:
+    """Fake decrypt function that can be blocked and tracks concurrency"""
+
+    def __init__(self, result: str = "hunter2") -> None:
+        self.result = result
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Semaphore(0)
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, path: Path, passphrase: str | None) -> str:
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.started.release()
+        try:
+            self.release.wait(5)
+            if isinstance(self.result, Exception):
+                raise self.result
+            return self.result
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def decrypter():
+    decrypter = _Decrypter()
+    yield decrypter
+    decrypter.release.set()
+
+
+@pytest.fixture
+def dispatcher(decrypter):
+    dispatcher = dispatch.DecryptDispatcher(decrypter, max_workers=2, timeout=5)
+    yield dispatcher
+    dispatcher.shutdown()
+
+
+def _poll_until(dispatcher, results, count=1, timeout=5):
+    deadline = time.monotonic() + timeout
+    while len(results) < count and time.monotonic() < deadline:
+        dispatcher.poll()
+        time.sleep(0.01)
+    return results
+
+
+def test_result_is_delivered_from_poll(dispatcher):
+    results = []
+    dispatcher.submit(_PATH, "passphrase", results.append)
+
+    _poll_until(dispatcher, results)
+
+    assert results == [dispatch.DecryptResult(_PATH, dispatch.OK, "hunter2")]
+    assert dispatcher.pending == 0
+
+
+def test_callbacks_run_on_polling_thread(dispatcher):
+    threads = []
+    dispatcher.submit(_PATH, None, lambda _: threads.append(threading.get_ident()))
+
+    _poll_until(dispatcher, threads)
+
+    assert threads == [threading.get_ident()]
+
+
+def test_exceptions_are_failures(dispatcher, decrypter):
+    decrypter.result = RuntimeError("gpg exploded")
+    results = []
+    dispatcher.submit(_PATH, None, results.append)
+
+    _poll_until(dispatcher, results)
+
+    assert results[0].status == dispatch.FAILED
+    assert results[0].error == "gpg exploded"
+
+
+def test_locked_is_reported(dispatcher, decrypter):
+    decrypter.result = dispatch.Locked("locked")
+    results = []
+    dispatcher.submit(_PATH, None, results.append)
+
+    _poll_until(dispatcher, results)
+
+    assert results == [dispatch.DecryptResult(_PATH, dispatch.LOCKED, error="locked")]
+
+
+def test_empty_plaintext_is_a_failure(dispatcher, decrypter):
+    decrypter.result = ""
+    results = []
+    dispatcher.submit(_PATH, "wrong", results.append)
+
+    _poll_until(dispatcher, results)
+
+    assert results[0].status == dispatch.FAILED
+    assert results[0].plaintext is None
+
+
+def test_timeout(dispatcher, decrypter):
+    decrypter.release.clear()
+    dispatcher.timeout = 0.05
+    results = []
+    dispatcher.submit(_PATH, None, results.append)
+
+    _poll_until(dispatcher, results)
+    decrypter.release.set()
+    time.sleep(0.05)
+    dispatcher.poll()
+
+    assert [x.status for x in results] == [dispatch.TIMEOUT]
+
+
+def test_cancel_running_request_discards_result(dispatcher, decrypter):
+    decrypter.release.clear()
+    results = []
+    request = dispatcher.submit(_PATH, None, results.append)
+    assert decrypter.started.acquire(timeout=5)
+
+    dispatcher.cancel(request)
+    dispatcher.poll()
+    decrypter.release.set()
+    time.sleep(0.05)
+    dispatcher.poll()
+
+    assert [x.status for x in results] == [dispatch.CANCELLED]
+    assert request.finished
+
+
+def test_hung_decrypts_are_aborted_and_replaced():
+    hung = threading.Event()
+    threads = []
+
+    def decrypt(path, passphrase):
+        if path == _PATH:
+            threads.append(threading.get_ident())
+            hung.wait(5)
+        return "hunter2"
+
+    abort = mock.Mock()
+    dispatcher = dispatch.DecryptDispatcher(decrypt, max_workers=1, abort=abort)
+    try:
+        results = []
+        dispatcher.timeout = 0.05
+        dispatcher.submit(_PATH, None, results.append)
+        _poll_until(dispatcher, results)
+        dispatcher.timeout = 5
+        request = dispatcher.submit(_PATH, None, results.append)
+        while len(threads) < 2:
+            time.sleep(0.01)
+        dispatcher.cancel(request)
+        dispatcher.submit(Path("/store/other.gpg"), None, results.append)
+        _poll_until(dispatcher, results, count=3)
+    finally:
+        hung.set()
+        dispatcher.shutdown()
+
+    assert [x.status for x in results] == [
+        dispatch.TIMEOUT,
+        dispatch.CANCELLED,
+        dispatch.OK,
+    ]
+    assert abort.call_args_list == [mock.call(x) for x in threads]
+    assert len(set(threads)) == 2
+
+
+def test_cancel_all(dispatcher, decrypter):
+    decrypter.release.clear()
+    results = []
+    for _ in range(4):
+        dispatcher.submit(_PATH, None, results.append)
+
+    dispatcher.cancel_all()
+    dispatcher.poll()
+
+    assert [x.status for x in results] == [dispatch.CANCELLED] * 4
+    assert dispatcher.pending == 0
+
+
+def test_concurrent_decrypts_are_capped(dispatcher, decrypter):
+    decrypter.release.clear()
+    results = []
+    for _ in range(6):
+        dispatcher.submit(_PATH, None, results.append)
+
+    time.sleep(0.1)
+    assert decrypter.running == 2
+    decrypter.release.set()
+    _poll_until(dispatcher, results, count=6)
+
+    assert decrypter.max_running == 2
+    assert len(results) == 6
+
+
+def test_pending_requests_are_capped(decrypter):
+    decrypter.release.clear()
+    dispatcher = dispatch.DecryptDispatcher(decrypter, max_pending=2)
+    try:
+        dispatcher.submit(_PATH, None, lambda _: None)
+        dispatcher.submit(_PATH, None, lambda _: None)
+
+        with pytest.raises(dispatch.DispatchFull):
+            dispatcher.submit(_PATH, None, lambda _: None)
+    finally:
+        dispatcher.shutdown()
@@ -0,0 +1,79 @@
+import pytest
+
+from sb_pass.model.entry import PassEntry, first_line
+
+ENTRY = """correct horse battery staple
+user: octocat
+URL: https://github.com
+https://github.com/login
+otpauth://totp/GitHub:octocat?secret=JBSWY3DPEHPK3PXP
+Recovery codes:
+  1234-5678
+"""
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        ("hunter2\nuser: me\n", "hunter2"),
+        (b"hunter2\r\nuser: me\r\n", "hunter2"),
+        ("only line", "only line"),
+        (b"", ""),
+    ],
+)
+def test_first_line(data, expected):
+    assert first_line(data) == expected
+
+
+def test_password_keeps_spaces():
+    assert PassEntry(ENTRY).password == "correct horse battery staple"
+
+
+def test_password_does_not_decode_the_rest():
+    # Invalid UTF-8 after the first line is only a problem once fields are read
+    entry = PassEntry(b"hunter2\n\xff\xfe")
+
+    assert entry.password == "hunter2"
+    with pytest.raises(UnicodeDecodeError):
+        entry.fields
+
+
+def test_fields():
+    entry = PassEntry(ENTRY.encode())
+
+    assert entry.fields == {
+        "user": "octocat",
+        "URL": "https://github.com",
+        "Recovery codes": "",
+    }
+    assert entry.username == "octocat"
+    assert entry.url == "https://github.com"
+    assert entry.otpauth.startswith("otpauth://totp/GitHub")
+    assert entry.notes == "https://github.com/login\n  1234-5678"
+
+
+def test_get_ignores_field_case():
+    entry = PassEntry(ENTRY)
+
+    assert entry.get("url") == "https://github.com"
+    assert entry.get("password") == "correct horse battery staple"
+    assert entry.get("missing") is None
+
+
+def test_field_names():
+    assert PassEntry(ENTRY).field_names() == [
+        "password",
+        "user",
+        "URL",
+        "Recovery codes",
+        "otpauth",
+        "notes",
+    ]
+
+
+def test_password_only_entry():
+    entry = PassEntry("hunter2\n")
+
+    assert entry.field_names() == ["password"]
+    assert entry.get("notes") is None
+    assert entry.otpauth is None
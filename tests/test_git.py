@@ -0,0 +1,192 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from sb_pass.model import git, store
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+def _run_git(repo: Path, *args: str) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=repo,
+        check=True,
+        capture_output=True,
+    )
+
+
+def _commit(repo: Path, message: str = "Update") -> None:
+    _run_git(repo, "add", "-A")
+    _run_git(repo, "commit", "-q", "-m", message)
+
+
+@pytest.fixture
+def repo(tmp_path, touch):
+    _run_git(tmp_path, "init", "-q")
+    touch(tmp_path, ".gpg-id", "a.gpg", "web/github.gpg", "email/work.gpg")
+    _commit(tmp_path, "Initial")
+    return tmp_path
+
+
+@pytest.fixture
+def scanned(repo, settle):
+    settle(repo)
+    return store.scan_store(repo)
+
+
+def _summary(changes: list[store.StoreChange]) -> set[tuple[str, str, bool]]:
+    return {(x.parent.name, x.node.name, x.added) for x in changes}
+
+
+def test_is_repo(repo, tmp_path_factory):
+    assert git.is_repo(str(repo))
+    assert not git.is_repo(str(tmp_path_factory.mktemp("plain")))
+
+
+def test_head(repo, touch):
+    first = git.head(str(repo))
+    touch(repo, "b.gpg")
+    _commit(repo)
+
+    assert len(first) == 40
+    assert git.head(str(repo)) not in (None, first)
+
+
+def test_head_of_empty_repo_is_none(tmp_path):
+    _run_git(tmp_path, "init", "-q")
+
+    assert git.head(str(tmp_path)) is None
+
+
+def test_head_without_git_is_none(repo):
+    with mock.patch("subprocess.run", side_effect=FileNotFoundError("git")):
+        assert git.head(str(repo)) is None
+
+
+def test_changed_paths(repo, touch):
+    old = git.head(str(repo))
+    (repo / "web" / "github.gpg").unlink()
+    touch(repo, "web/gitlab.gpg", "bank/my checking.gpg")
+    _commit(repo)
+
+    paths = git.changed_paths(str(repo), old, git.head(str(repo)))
+
+    assert sorted(paths) == ["bank/my checking.gpg", "web/github.gpg", "web/gitlab.gpg"]
+
+
+def test_changed_paths_unknown_commit_is_none(repo):
+    assert git.changed_paths(str(repo), "0" * 40, git.head(str(repo))) is None
+
+
+def test_is_clean(repo, touch):
+    assert git.is_clean(str(repo))
+
+    touch(repo, "new.gpg")
+
+    assert not git.is_clean(str(repo))
+
+
+class TestRefreshStore:
+    """Tests for refreshing a store that is a git repository"""
+
+    def test_scan_records_head(self, repo, scanned):
+        assert scanned.revision == git.head(str(repo))
+
+    def test_scan_of_plain_directory_has_no_revision(self, tmp_path_factory, touch):
+        plain = tmp_path_factory.mktemp("plain")
+        touch(plain, "a.gpg")
+
+        assert store.scan_store(plain).revision is None
+
+    def test_revision_survives_the_index(self, repo, scanned, tmp_path_factory):
+        index_path = tmp_path_factory.mktemp("index") / "store_index.bin"
+        store.save_index(scanned, index_path)
+
+        assert store.load_index(index_path, repo).revision == scanned.revision
+
+    def test_new_commit_relists_only_changed_directories(self, repo, scanned, touch):
+        (repo / "web" / "github.gpg").unlink()
+        touch(repo, "web/gitlab.gpg", "bank/checking.gpg")
+        _commit(repo)
+
+        with mock.patch("sb_pass.model.store.os.scandir", wraps=os.scandir) as scandir:
+            changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {
+            ("web", "github", False),
+            ("web", "gitlab", True),
+            (repo.name, "bank", True),
+        }
+        assert sorted(x.args[0] for x in scandir.call_args_list) == [
+            str(repo),
+            str(repo / "bank"),
+            str(repo / "web"),
+        ]
+        assert scanned.revision == git.head(str(repo))
+
+    def test_new_commit_with_clean_tree_skips_the_walk(self, repo, scanned, touch):
+        touch(repo, "web/gitlab.gpg")
+        _commit(repo)
+
+        with mock.patch("sb_pass.model.store._read_changed_dirs") as walk:
+            changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {("web", "gitlab", True)}
+        walk.assert_not_called()
+
+    def test_removed_directory(self, repo, scanned):
+        shutil.rmtree(repo / "email")
+        _commit(repo)
+
+        changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {(repo.name, "email", False)}
+        assert [x.name for x in scanned.dirs] == ["web"]
+
+    def test_uncommitted_changes_use_mtimes(self, repo, scanned, touch):
+        touch(repo, "web/gitlab.gpg")
+
+        changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {("web", "gitlab", True)}
+
+    def test_new_commit_relists_entries_rewritten_in_place(self, repo, scanned, settle):
+        (repo / "web" / "github.gpg").write_text("rewritten")
+        _commit(repo)
+        settle(repo)
+
+        with mock.patch("sb_pass.model.store.os.scandir", wraps=os.scandir) as scandir:
+            changes = store.refresh_store(scanned)
+
+        assert changes == []
+        assert [x.args[0] for x in scandir.call_args_list] == [str(repo / "web")]
+
+    def test_new_commit_with_dirty_tree_uses_mtimes(self, repo, scanned, touch):
+        touch(repo, "web/gitlab.gpg")
+        _commit(repo)
+        touch(repo, "email/home.gpg", "bank/checking.gpg")
+        _run_git(repo, "add", "email/home.gpg")
+
+        changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {
+            ("web", "gitlab", True),
+            ("email", "home", True),
+            (repo.name, "bank", True),
+        }
+        assert scanned.revision == git.head(str(repo))
+
+    def test_unknown_revision_falls_back_to_mtimes(self, repo, scanned, touch):
+        scanned.revision = "0" * 40
+        touch(repo, "web/gitlab.gpg")
+        _commit(repo)
+
+        changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {("web", "gitlab", True)}
+        assert scanned.revision == git.head(str(repo))
@@ -1,9 +1,13 @@
+import subprocess
+import threading
+import time
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 from unittest import mock
 
 import pytest
 
 from sb_pass import gpg as _gpg
+from sb_pass.model import pgp
 
 _GPG_HOME = TemporaryDirectory(prefix="gpg_home_")
 _BINARY_PATH = NamedTemporaryFile(prefix="gpg_binary_")
@@ -11,7 +15,7 @@ _BINARY_PATH = NamedTemporaryFile(prefix="gpg_binary_")
 
 @pytest.fixture
 def mock_gpg():
-    mock_gpg = mock.patch("sb_pass.gpg.gnupg.GPG")
+    mock_gpg = mock.patch("sb_pass.gpg._GPG")
     yield mock_gpg.start()
     mock_gpg.stop()
 
@@ -74,3 +78,383 @@ def test_decrypt_key_with_passphrase_includes_in_kwargs(mock_gpg):
     gpg.decrypt_key(tmp_file.name, passphase="test")
 
     gpg._gpg.decrypt_file.assert_called_with(**expected)
+
+
+class TestDecryptWorker:
+    """Tests for decrypting through the worker process with a real gpg"""
+
+    @pytest.fixture
+    def secret(self, encrypt, tmp_path):
+        return encrypt(tmp_path / "secret.gpg", "hunter2\nuser: me\n")
+
+    @pytest.fixture
+    def gpg(self, gpg_home, gpg_binary):
+        gpg = _gpg.Gpg(gpg_home, gpg_binary, use_worker=True)
+        yield gpg
+        gpg.close()
+
+    def test_decrypts_in_worker(self, gpg, secret):
+        assert gpg.decrypt_key(secret) == "hunter2\nuser: me\n"
+        assert gpg._worker.is_alive()
+
+    def test_worker_is_reused(self, gpg, secret):
+        worker = gpg._worker
+
+        gpg.decrypt_key(secret)
+        gpg.decrypt_key(secret)
+
+        assert gpg._worker is worker
+
+    def test_falls_back_to_in_process_when_worker_dies(self, gpg, secret):
+        gpg._worker._process.kill()
+        gpg._worker._process.join()
+
+        assert gpg.decrypt_key(secret) == "hunter2\nuser: me\n"
+        assert gpg._worker is None
+
+    def test_new_settings_restart_worker(self, gpg, gpg_home, secret):
+        gpg._worker._process.kill()
+        gpg.decrypt_key(secret)
+
+        gpg.set_gpg_home_path(gpg_home)
+
+        assert gpg._worker.is_alive()
+
+    def test_failed_decrypt_returns_empty(self, gpg, tmp_path):
+        missing = tmp_path / "missing.gpg"
+        missing.write_bytes(b"not encrypted")
+
+        assert gpg.decrypt_key(missing) == ""
+
+
+class TestDecryptMany:
+    """Tests for decrypting batches of files with a real gpg"""
+
+    @pytest.fixture
+    def secrets(self, encrypt, tmp_path):
+        return {
+            encrypt(tmp_path / f"secret{i}.gpg", f"password{i}\n"): f"password{i}\n"
+            for i in range(6)
+        }
+
+    @pytest.fixture
+    def gpg(self, gpg_home, gpg_binary):
+        return _gpg.Gpg(gpg_home, gpg_binary)
+
+    def test_decrypts_every_path(self, gpg, secrets):
+        results = dict(gpg.decrypt_many(secrets, workers=3))
+
+        assert results == secrets
+
+    def test_failures_are_yielded_as_errors(self, gpg, secrets, tmp_path):
+        broken = tmp_path / "broken.gpg"
+        broken.write_bytes(b"not encrypted")
+
+        results = dict(gpg.decrypt_many([*secrets, broken], workers=2))
+
+        assert isinstance(results.pop(broken), _gpg.DecryptError)
+        assert results == secrets
+
+    def test_pending_decrypts_are_bounded(self, gpg, secrets):
+        started = []
+
+        def decrypt_one(path, passphrase=None):
+            started.append(path)
+            return secrets[path]
+
+        with mock.patch.object(gpg, "_decrypt_one", side_effect=decrypt_one):
+            results = gpg.decrypt_many(secrets, workers=2, max_pending=2)
+            next(results)
+            next(results)
+
+            # The first path on its own, then at most two more
+            assert len(started) <= 3
+            assert len(list(results)) == len(secrets) - 2
+
+    def test_no_paths(self, gpg):
+        assert list(gpg.decrypt_many([])) == []
+
+
+class TestAbort:
+    """Tests for killing a decrypt that gpg never finishes"""
+
+    @pytest.fixture
+    def hanging_binary(self, gpg_binary, tmp_path):
+        """Return a gpg that hangs when asked to decrypt"""
+        path = tmp_path / "gpg"
+        path.write_text(
+            "#!/bin/sh\n"
+            'for arg; do [ "$arg" = --decrypt ] && exec sleep 60; done\n'
+            f'exec {gpg_binary} "$@"\n'
+        )
+        path.chmod(0o755)
+        return str(path)
+
+    @pytest.fixture(params=[False, True], ids=["in_process", "worker"])
+    def gpg(self, request, gpg_home, hanging_binary):
+        gpg = _gpg.Gpg(gpg_home, hanging_binary, use_worker=request.param)
+        yield gpg
+        gpg.close()
+
+    def _start_decrypt(self, gpg, tmp_path):
+        secret = tmp_path / "secret.gpg"
+        secret.write_bytes(b"never read")
+        results = []
+
+        def decrypt():
+            try:
+                results.append(gpg.decrypt_key(secret))
+            except _gpg.WorkerError as exc:
+                results.append(exc)
+
+        thread = threading.Thread(target=decrypt, daemon=True)
+        thread.start()
+        return thread, results
+
+    def test_abort_kills_hung_decrypt(self, gpg, tmp_path):
+        thread, results = self._start_decrypt(gpg, tmp_path)
+
+        deadline = time.monotonic() + 5
+        while not gpg.abort(thread.ident) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        thread.join(5)
+
+        assert not thread.is_alive()
+        assert results in ([""], [mock.ANY])
+        if gpg._use_worker:
+            assert isinstance(results[0], _gpg.DecryptKilled)
+            assert gpg._worker is None
+
+    def test_abort_ignores_other_threads(self, gpg, tmp_path):
+        thread, _ = self._start_decrypt(gpg, tmp_path)
+        time.sleep(0.5)
+
+        assert not gpg.abort(threading.get_ident())
+        assert thread.is_alive()
+
+        gpg.abort(thread.ident)
+        thread.join(5)
+
+
+@pytest.fixture(scope="module")
+def locked_home(gpg_binary, tmp_path_factory):
+    """Return a GNUPGHOME whose key needs the passphrase "open sesame" """
+    home = tmp_path_factory.mktemp("locked_gnupg")
+    home.chmod(0o700)
+    subprocess.run(
+        [gpg_binary, "--homedir", home, "--batch", "--pinentry-mode", "loopback"]
+        + ["--passphrase", "open sesame", "--quick-gen-key", "locked@example.com"]
+        + ["future-default", "default", "never"],
+        check=True,
+        capture_output=True,
+    )
+    return str(home)
+
+
+@pytest.fixture
+def forget_passphrase(locked_home):
+    """Stop the agent after each test so the next starts with it locked"""
+    yield
+    subprocess.run(["gpgconf", "--homedir", locked_home, "--kill", "gpg-agent"])
+
+
+@pytest.fixture
+def locked_secret(gpg_binary, locked_home, tmp_path):
+    """Return an entry encrypted to the key in locked_home"""
+    path = tmp_path / "secret.gpg"
+    subprocess.run(
+        [gpg_binary, "--homedir", locked_home, "--batch", "--trust-model"]
+        + ["always", "-r", "locked@example.com", "-o", path, "-e"],
+        input=b"hunter2\n",
+        check=True,
+        capture_output=True,
+    )
+    return path
+
+
+@pytest.mark.usefixtures("forget_passphrase")
+class TestDecryptCached:
+    """Tests for decrypting only with a passphrase gpg-agent already has cached"""
+
+    @pytest.fixture(params=[False, True], ids=["in_process", "worker"])
+    def gpg(self, request, locked_home, gpg_binary):
+        gpg = _gpg.Gpg(locked_home, gpg_binary, use_worker=request.param)
+        yield gpg
+        gpg.close()
+
+    def test_locked_agent_returns_empty(self, gpg, locked_secret):
+        assert gpg.decrypt_cached(locked_secret) == ""
+
+    def test_decrypts_once_agent_is_unlocked(self, gpg, locked_secret):
+        assert gpg.decrypt_key(locked_secret, "open sesame") == "hunter2\n"
+
+        assert gpg.decrypt_cached(locked_secret) == "hunter2\n"
+
+
+@pytest.mark.usefixtures("forget_passphrase")
+class TestKeyState:
+    """Tests for asking gpg-agent whether a decrypt needs a passphrase"""
+
+    @pytest.fixture
+    def gpg(self, locked_home, gpg_binary):
+        return _gpg.Gpg(locked_home, gpg_binary)
+
+    def test_locked(self, gpg, locked_secret):
+        assert gpg.key_state(pgp.recipient_key_ids(locked_secret)) == _gpg.KEY_LOCKED
+
+    def test_unlocked_once_passphrase_is_cached(self, gpg, locked_secret):
+        gpg.decrypt_key(locked_secret, "open sesame")
+        key_ids = pgp.recipient_key_ids(locked_secret)
+
+        assert gpg.key_state(key_ids) == _gpg.KEY_UNLOCKED
+
+    def test_key_without_passphrase_is_unlocked(
+        self, gpg_home, gpg_binary, encrypt, tmp_path
+    ):
+        secret = encrypt(tmp_path / "unprotected.gpg", "hunter2\n")
+        gpg = _gpg.Gpg(gpg_home, gpg_binary)
+
+        assert gpg.key_state(pgp.recipient_key_ids(secret)) == _gpg.KEY_UNLOCKED
+
+    def test_missing_key(self, gpg):
+        assert gpg.key_state(["0123456789ABCDEF"]) == _gpg.KEY_MISSING
+
+    def test_key_ids_ignore_case(self, gpg, locked_secret):
+        key_ids = [x.lower() for x in pgp.recipient_key_ids(locked_secret)]
+
+        assert gpg.key_state(key_ids) == _gpg.KEY_LOCKED
+
+    @pytest.mark.parametrize("key_ids", [[], ["0123456789ABCDEF"]])
+    def test_hidden_recipients_are_unknown(self, gpg, key_ids):
+        assert gpg.key_state(key_ids, hidden=True) == _gpg.KEY_UNKNOWN
+
+    def test_hidden_recipients_with_known_key(self, gpg, locked_secret):
+        key_ids = pgp.recipient_key_ids(locked_secret)
+
+        assert gpg.key_state(key_ids, hidden=True) == _gpg.KEY_LOCKED
+
+    def test_keygrips_are_listed_once(self, gpg, locked_secret):
+        key_ids = pgp.recipient_key_ids(locked_secret)
+        gpg.key_state(key_ids)
+
+        with mock.patch.object(gpg, "_list_keygrips") as list_keygrips:
+            gpg.key_state(key_ids)
+
+        list_keygrips.assert_not_called()
+
+    def test_keygrips_are_listed_again_for_unknown_keys(self, gpg, locked_secret):
+        gpg.key_state(pgp.recipient_key_ids(locked_secret))
+
+        with mock.patch.object(gpg, "_list_keygrips", return_value={}) as list_keygrips:
+            gpg.key_state(["0123456789ABCDEF"])
+
+        list_keygrips.assert_called_once()
+
+    def test_failing_gpg_is_unknown(self, gpg):
+        gpg._gpg_binary_path = "/bin/false"
+
+        assert gpg.key_state(["0123456789ABCDEF"]) == _gpg.KEY_UNKNOWN
+
+    def test_without_connect_agent_is_unknown(self, gpg, locked_secret):
+        with mock.patch("sb_pass.gpg.os.path.isfile", return_value=False), mock.patch(
+            "sb_pass.gpg.shutil.which", return_value=None
+        ):
+            key_state = gpg.key_state(pgp.recipient_key_ids(locked_secret))
+
+        assert key_state == _gpg.KEY_UNKNOWN
+
+
+def test_list_secret_keys(gpg_home, gpg_binary):
+    keygrips = _gpg.list_secret_keys(gpg_binary, gpg_home)
+
+    assert len(keygrips) == 2
+    assert all(len(x) == 40 for x in keygrips.values())
+
+
+def test_list_secret_keys_failure_is_none(gpg_home):
+    assert _gpg.list_secret_keys("/bin/false", gpg_home) is None
+    assert _gpg.list_secret_keys("/no/such/gpg", gpg_home) is None
+
+
+@pytest.fixture(scope="module")
+def rotation_home(gpg_binary, tmp_path_factory):
+    """Return a GNUPGHOME with an old and a new key, neither with a passphrase"""
+    home = tmp_path_factory.mktemp("rotation_gnupg")
+    home.chmod(0o700)
+    for uid in ("old@example.com", "new@example.com"):
+        subprocess.run(
+            [gpg_binary, "--homedir", home, "--batch", "--passphrase", ""]
+            + ["--quick-gen-key", uid, "future-default", "default", "never"],
+            check=True,
+            capture_output=True,
+        )
+    yield str(home)
+    subprocess.run(["gpgconf", "--homedir", home, "--kill", "gpg-agent"])
+
+
+class TestReencrypt:
+    """Tests for encrypting files again to new recipients with a real gpg"""
+
+    @pytest.fixture
+    def gpg(self, rotation_home, gpg_binary):
+        return _gpg.Gpg(rotation_home, gpg_binary)
+
+    @pytest.fixture
+    def secrets(self, gpg_binary, rotation_home, tmp_path):
+        paths = []
+        for i in range(4):
+            path = tmp_path / f"secret{i}.gpg"
+            subprocess.run(
+                [gpg_binary, "--homedir", rotation_home, "--batch"]
+                + ["-r", "old@example.com", "-o", path, "-e"],
+                input=f"password{i}\n".encode(),
+                check=True,
+                capture_output=True,
+            )
+            path.chmod(0o600)
+            paths.append(path)
+        return paths
+
+    def test_encryption_key_ids(self, gpg):
+        old = gpg.encryption_key_ids("old@example.com")
+        new = gpg.encryption_key_ids("new@example.com")
+
+        assert len(old) == len(new) == 1
+        assert old != new
+
+    def test_encryption_key_ids_of_unknown_recipient(self, gpg):
+        assert gpg.encryption_key_ids("nobody@example.com") is None
+
+    def test_reencrypts_every_path(self, gpg, secrets):
+        recipients = ("new@example.com",)
+
+        results = dict(gpg.reencrypt_many([(x, recipients) for x in secrets]))
+
+        assert results == {(x, recipients): None for x in secrets}
+        new = gpg.encryption_key_ids("new@example.com")
+        for i, path in enumerate(secrets):
+            assert set(pgp.recipient_key_ids(path)) == new
+            assert gpg.decrypt_key(path) == f"password{i}\n"
+            assert path.stat().st_mode & 0o777 == 0o600
+        assert sorted(x.name for x in secrets[0].parent.iterdir()) == sorted(
+            x.name for x in secrets
+        )
+
+    def test_failures_leave_the_file_untouched(self, gpg, tmp_path):
+        broken = tmp_path / "broken.gpg"
+        broken.write_bytes(b"not encrypted")
+
+        [(_, error)] = gpg.reencrypt_many([(broken, ("new@example.com",))])
+
+        assert isinstance(error, _gpg.ReencryptError)
+        assert broken.read_bytes() == b"not encrypted"
+        assert list(tmp_path.iterdir()) == [broken]
+
+    def test_unknown_recipient_leaves_the_file_untouched(self, gpg, secrets):
+        before = secrets[0].read_bytes()
+
+        [(_, error)] = gpg.reencrypt_many([(secrets[0], ("nobody@example.com",))])
+
+        assert isinstance(error, _gpg.ReencryptError)
+        assert secrets[0].read_bytes() == before
+        assert len(list(secrets[0].parent.iterdir())) == len(secrets)
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from sb_pass.model import menu, store
+
+
+@pytest.fixture
+def root(store_home):
+    return store.scan_store(store_home)
+
+
+@pytest.fixture
+def model(root):
+    model = menu.MenuModel(max_materialized=2)
+    model.opened(root)
+    return model
+
+
+def _summary(ops: list[menu.MenuOp]) -> list[tuple]:
+    summary = []
+    for op in ops:
+        if isinstance(op, menu.Insert):
+            summary.append(("insert", op.node.name, op.before))
+        elif isinstance(op, menu.Remove):
+            summary.append(("remove", op.node.name))
+        else:
+            summary.append(("dematerialize", os.path.basename(op.menu)))
+    return summary
+
+
+def test_menu_children_lists_entries_before_dirs(root):
+    assert [x.name for x in menu.menu_children(root)] == ["a", "c", "web"]
+
+
+def test_added_entry_is_inserted_before_next_sibling(store_home, root, model, touch):
+    touch(store_home, "b.gpg", "d.gpg")
+
+    ops = model.apply(store.refresh_store(root))
+
+    assert sorted(_summary(ops)) == [("insert", "b", "c"), ("insert", "d", "web")]
+
+
+def test_added_dir_is_appended(store_home, root, model, touch):
+    touch(store_home, "zz/entry.gpg")
+
+    ops = model.apply(store.refresh_store(root))
+
+    assert _summary(ops) == [("insert", "zz", None)]
+
+
+def test_removed_entry(store_home, root, model):
+    (store_home / "a.gpg").unlink()
+
+    ops = model.apply(store.refresh_store(root))
+
+    assert _summary(ops) == [("remove", "a")]
+
+
+def test_queued_add_of_since_removed_entry_is_skipped(store_home, root, model, touch):
+    touch(store_home, "b.gpg")
+    added = store.refresh_store(root)
+    (store_home / "b.gpg").unlink()
+    removed = store.refresh_store(root)
+
+    assert model.apply(added) == []
+    assert model.apply(removed) == []
+    touch(store_home, "b.gpg")
+    assert _summary(model.apply(store.refresh_store(root))) == [("insert", "b", "c")]
+
+
+def test_changes_to_unopened_menus_are_ignored(store_home, root, model, touch):
+    touch(store_home, "web/bitbucket.gpg")
+
+    assert model.apply(store.refresh_store(root)) == []
+
+
+def test_removing_opened_dir_forgets_it(store_home, root, model):
+    model.opened(root.dirs[0])
+    for path in (store_home / "web").iterdir():
+        path.unlink()
+    (store_home / "web").rmdir()
+
+    ops = model.apply(store.refresh_store(root))
+
+    assert _summary(ops) == [("remove", "web")]
+    assert not model.is_materialized(str(store_home / "web"))
+
+
+def test_least_recently_opened_are_dematerialized(tmp_path, touch):
+    touch(tmp_path, "x/1.gpg", "y/1.gpg", "z/1.gpg")
+    root = store.scan_store(tmp_path)
+    model = menu.MenuModel(max_materialized=3)
+    model.opened(root)
+    model.opened(root.dirs[0])
+    model.opened(root.dirs[1])
+
+    ops = model.opened(root.dirs[2])
+
+    # The root is still open as an ancestor, so the oldest sibling goes
+    assert _summary(ops) == [("dematerialize", "x")]
+    assert model.is_materialized(root.path)
+    assert not model.is_materialized(root.dirs[0].path)
+
+
+def test_clear_dematerializes_every_menu(root, model):
+    model.opened(root.dirs[0])
+
+    ops = model.clear()
+
+    assert sorted(_summary(ops)) == [
+        ("dematerialize", os.path.basename(root.path)),
+        ("dematerialize", "web"),
+    ]
+    assert not model.is_materialized(root.path)
+    assert model.clear() == []
@@ -0,0 +1,115 @@
+import json
+import pstats
+
+import pytest
+
+from sb_pass import config, metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset()
+    yield
+    metrics.enable(False)
+    metrics.reset()
+
+
+@metrics.timed("work")
+def work(value):
+    return value * 2
+
+
+def test_disabled_records_nothing():
+    assert work(2) == 4
+    with metrics.span("block"):
+        pass
+    metrics.count("event")
+
+    assert metrics.snapshot() == {"spans": {}, "counters": {}}
+
+
+def test_timed_and_span_record_when_enabled():
+    metrics.enable()
+
+    work(1)
+    work(2)
+    with metrics.span("block"):
+        pass
+
+    spans = metrics.snapshot()["spans"]
+    assert spans["work"]["count"] == 2
+    assert spans["block"]["count"] == 1
+    assert set(spans["work"]) == {"count", "sum", "max", "p50", "p90", "p99"}
+
+
+def test_failures_are_timed():
+    metrics.enable()
+
+    with pytest.raises(ZeroDivisionError):
+        with metrics.span("fails"):
+            1 / 0
+
+    assert metrics.snapshot()["spans"]["fails"]["count"] == 1
+
+
+def test_percentiles():
+    for value in range(1, 101):
+        metrics.record("span", value / 1000)
+
+    summary = metrics.snapshot()["spans"]["span"]
+
+    assert summary["p50"] == pytest.approx(0.051)
+    assert summary["p99"] == pytest.approx(0.1)
+    assert summary["max"] == pytest.approx(0.1)
+
+
+def test_counters():
+    metrics.enable()
+
+    metrics.count("hits")
+    metrics.count("hits", 2)
+
+    assert metrics.snapshot()["counters"] == {"hits": 3}
+
+
+def test_settings_writes_are_timed(root):
+    conf = config.Config(root, save_delay=60)
+    conf.max_recent_items = 3
+    metrics.enable()
+
+    conf.flush()
+
+    assert metrics.snapshot()["spans"]["config.save"]["count"] == 1
+
+
+def test_export(tmp_path):
+    metrics.enable()
+    metrics.record("menu.reload", 0.25)
+    metrics.count("decrypt.ok")
+
+    metrics.export(tmp_path)
+
+    assert json.loads((tmp_path / "metrics.json").read_text()) == metrics.snapshot()
+    prom = (tmp_path / "metrics.prom").read_text()
+    assert 'sb_pass_span_seconds{span="menu.reload",quantile="0.5"} 0.250000000' in prom
+    assert 'sb_pass_span_seconds_count{span="menu.reload"} 1' in prom
+    assert 'sb_pass_events_total{event="decrypt.ok"} 1' in prom
+
+
+def test_profile(tmp_path):
+    path = tmp_path / "profile.pstats"
+
+    metrics.start_profile()
+    work(3)
+    metrics.stop_profile(path)
+
+    assert not metrics.profiling()
+    assert pstats.Stats(str(path)).total_calls > 0
+
+
+def test_configure_from_env(monkeypatch):
+    monkeypatch.setenv(metrics.METRICS_ENV, "1")
+
+    metrics.configure_from_env()
+
+    assert metrics.enabled()
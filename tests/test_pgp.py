@@ -0,0 +1,115 @@
+import subprocess
+
+import pytest
+
+from benchmarks.synthetic import GPG_RECIPIENT
+from sb_pass.model import pgp
+
+
+def _key_id(gpg_binary, gpg_home) -> str:
+    output = subprocess.run(
+        [gpg_binary, "--homedir", gpg_home, "--with-colons", "--list-secret-keys"],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    # The encryption subkey is the last one listed
+    return [x.split(":")[4] for x in output.splitlines() if x.startswith("ssb")][-1]
+
+
+def _pkesk_body(key_id: str, size: int = 30) -> bytes:
+    """Return a version 3 RSA PKESK body for key_id padded out to size"""
+    body = bytes([3]) + bytes.fromhex(key_id) + bytes([1])
+    return body + bytes(size - len(body))
+
+
+@pytest.fixture
+def gpg_args(gpg_binary, gpg_home):
+    return [gpg_binary, "--homedir", gpg_home, "--batch", "--yes", "--trust-model"]
+
+
+def test_recipient_key_ids(encrypt, gpg_binary, gpg_home, tmp_path):
+    path = encrypt(tmp_path / "secret.gpg", "hunter2\n")
+
+    assert pgp.recipient_key_ids(path) == [_key_id(gpg_binary, gpg_home)]
+
+
+def test_hidden_recipient(gpg_args, tmp_path):
+    path = tmp_path / "secret.gpg"
+    subprocess.run(
+        gpg_args
+        + ["always", "--throw-keyids", "-r", GPG_RECIPIENT]
+        + ["-o", path, "-e"],
+        input=b"hunter2\n",
+        check=True,
+        capture_output=True,
+    )
+
+    assert pgp.recipient_key_ids(path) == [pgp.WILDCARD_KEY_ID]
+
+
+def test_symmetric_only_is_unknown(gpg_args, tmp_path):
+    path = tmp_path / "secret.gpg"
+    subprocess.run(
+        gpg_args
+        + ["always", "--pinentry-mode", "loopback", "--passphrase", "x"]
+        + ["-o", path, "-c"],
+        input=b"hunter2\n",
+        check=True,
+        capture_output=True,
+    )
+
+    assert pgp.recipient_key_ids(path) is None
+
+
+def test_old_format_packets(tmp_path):
+    path = tmp_path / "secret.gpg"
+    path.write_bytes(
+        bytes([0x84, 30])
+        + _pkesk_body("0123456789abcdef")
+        + bytes([0x85, 0, 30])
+        + _pkesk_body("fedcba9876543210")
+        # Symmetrically encrypted integrity protected data
+        + bytes([0xD2, 3, 1, 2, 3])
+    )
+
+    assert pgp.recipient_key_ids(path) == ["0123456789ABCDEF", "FEDCBA9876543210"]
+
+
+def test_new_format_two_octet_length(tmp_path):
+    path = tmp_path / "secret.gpg"
+    body = _pkesk_body("0123456789abcdef", size=300)
+    # 300 octets as (0xc0 - 192) * 256 + 0x6c + 192
+    path.write_bytes(bytes([0xC1, 0xC0, 0x6C]) + body + bytes([0xD2, 1, 0]))
+
+    assert pgp.recipient_key_ids(path) == ["0123456789ABCDEF"]
+
+
+@pytest.mark.parametrize("overlap", range(1, 12))
+def test_packet_across_read_boundary(overlap, tmp_path):
+    path = tmp_path / "secret.gpg"
+    # A large first packet puts the second one's header overlap octets before the
+    # end of the first read
+    size = pgp.READ_SIZE - overlap - 3
+    first = _pkesk_body("0123456789abcdef", size=size)
+    header = bytes([0xC1, 192 + ((size - 192) >> 8), (size - 192) & 0xFF])
+    second = bytes([0xC1, 30]) + _pkesk_body("fedcba9876543210")
+    path.write_bytes(header + first + second + bytes([0xD2, 1, 0]))
+
+    assert pgp.recipient_key_ids(path) == ["0123456789ABCDEF", "FEDCBA9876543210"]
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"-----BEGIN PGP MESSAGE-----\n", b"", bytes([0x84, 30, 3, 1, 2])],
+    ids=["armored", "empty", "truncated"],
+)
+def test_unreadable_messages(data, tmp_path):
+    path = tmp_path / "secret.gpg"
+    path.write_bytes(data)
+
+    assert pgp.recipient_key_ids(path) is None
+
+
+def test_missing_file(tmp_path):
+    assert pgp.recipient_key_ids(tmp_path / "missing.gpg") is None
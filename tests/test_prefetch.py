@@ -0,0 +1,97 @@
+import pytest
+
+from sb_pass.prefetch import Prefetcher
+from sb_pass.secret_cache import SecretCache
+
+
+class FakeGpg:
+    """Decrypts to the file name until locked"""
+
+    def __init__(self) -> None:
+        self.locked = False
+        self.decrypted = []
+
+    def decrypt(self, path) -> str:
+        self.decrypted.append(path.stem)
+        return "" if self.locked else f"{path.stem}-secret\n"
+
+
+@pytest.fixture
+def entries(tmp_path):
+    paths = []
+    for name in ["a", "b", "c", "d"]:
+        path = tmp_path / f"{name}.gpg"
+        path.write_bytes(b"ciphertext")
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def gpg():
+    return FakeGpg()
+
+
+@pytest.fixture
+def cache():
+    return SecretCache(ttl=60, max_entries=3)
+
+
+def _prefetch(prefetcher: Prefetcher, paths) -> None:
+    prefetcher.start(paths)
+    if prefetcher._thread is not None:
+        prefetcher._thread.join(timeout=5)
+
+
+def test_disabled_by_default(gpg, cache, entries):
+    _prefetch(Prefetcher(gpg.decrypt, cache), entries)
+
+    assert gpg.decrypted == []
+
+
+def test_disabled_without_cache(gpg, entries):
+    _prefetch(Prefetcher(gpg.decrypt, SecretCache(), limit=2), entries)
+
+    assert gpg.decrypted == []
+
+
+def test_prefetches_first_paths_into_cache(gpg, cache, entries):
+    _prefetch(Prefetcher(gpg.decrypt, cache, limit=2), entries)
+
+    assert gpg.decrypted == ["a", "b"]
+    assert cache.get(entries[1]) == "b-secret\n"
+    assert entries[2] not in cache
+
+
+def test_limited_to_cache_size(gpg, cache, entries):
+    _prefetch(Prefetcher(gpg.decrypt, cache, limit=10), entries)
+
+    assert gpg.decrypted == ["a", "b", "c"]
+
+
+def test_cached_paths_are_skipped(gpg, cache, entries):
+    cache.put(entries[0], "already\n")
+
+    _prefetch(Prefetcher(gpg.decrypt, cache, limit=2), entries)
+
+    assert gpg.decrypted == ["b"]
+    assert cache.get(entries[0]) == "already\n"
+
+
+def test_locked_agent_stops_prefetching(gpg, cache, entries):
+    gpg.locked = True
+
+    _prefetch(Prefetcher(gpg.decrypt, cache, limit=3), entries)
+
+    assert gpg.decrypted == ["a"]
+    assert len(cache) == 0
+
+
+def test_stopped_run_does_not_cache(cache, entries):
+    def decrypt(path):
+        prefetcher.stop()
+        return "secret\n"
+
+    prefetcher = Prefetcher(decrypt, cache, limit=3)
+    _prefetch(prefetcher, entries)
+
+    assert len(cache) == 0
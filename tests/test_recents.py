@@ -0,0 +1,97 @@
+import json
+import time
+
+import pytest
+
+from sb_pass.model import recents
+from sb_pass.model.recents import Recents
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "recents.json"
+
+
+@pytest.fixture
+def lru(path):
+    lru = Recents(path, max_items=3, save_delay=60)
+    yield lru
+    lru.flush()
+
+
+def test_most_recent_first(lru):
+    for name in ["a", "b", "c"]:
+        lru.add(name)
+
+    assert list(lru) == ["c", "b", "a"]
+
+
+def test_readding_moves_to_front(lru):
+    for name in ["a", "b", "c", "a"]:
+        lru.add(name)
+
+    assert list(lru) == ["a", "c", "b"]
+
+
+def test_least_recent_evicted(lru):
+    for name in ["a", "b", "c", "d"]:
+        lru.add(name)
+
+    assert list(lru) == ["d", "c", "b"]
+
+
+def test_same_entry_name_in_different_directories(lru):
+    lru.add("a/github")
+    lru.add("b/github")
+
+    assert list(lru) == ["b/github", "a/github"]
+
+
+def test_lowering_max_items_trims(lru):
+    for name in ["a", "b", "c"]:
+        lru.add(name)
+
+    lru.max_items = 1
+
+    assert list(lru) == ["c"]
+
+
+def test_discard_directory(lru):
+    for name in ["web/github", "webmail", "web/gitlab"]:
+        lru.add(name)
+
+    lru.discard("web")
+
+    assert list(lru) == ["webmail"]
+
+
+def test_restored_after_restart(lru, path):
+    lru.add("a")
+    lru.add("b")
+    lru.flush()
+
+    assert list(Recents(path, max_items=3)) == ["b", "a"]
+
+
+def test_saves_are_batched(path):
+    lru = Recents(path, save_delay=0.05)
+    lru.add("a")
+    lru.add("b")
+
+    assert not path.exists()
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert json.loads(path.read_text())["recents"] == ["a", "b"]
+
+
+@pytest.mark.parametrize(
+    "contents",
+    ["not json", "[]", json.dumps({"version": recents.RECENTS_VERSION + 1})],
+    ids=["corrupt", "wrong type", "version"],
+)
+def test_invalid_file_is_ignored(path, contents):
+    path.write_text(contents)
+
+    assert len(Recents(path)) == 0
@@ -0,0 +1,159 @@
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from sb_pass.model import pgp, reencrypt, store
+
+OLD = "1111111111111111"
+NEW = "2222222222222222"
+BOB = "3333333333333333"
+KEY_IDS = {"me@example.com": frozenset({NEW}), "bob@example.com": frozenset({BOB})}
+
+
+def _write(root: Path, name: str, data: bytes) -> None:
+    path = root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+@pytest.fixture
+def store_home(tmp_path, encrypted_to):
+    _write(tmp_path, ".gpg-id", b"me@example.com\n")
+    _write(tmp_path, "old.gpg", encrypted_to(OLD))
+    _write(tmp_path, "current.gpg", encrypted_to(NEW))
+    _write(tmp_path, "hidden.gpg", encrypted_to(pgp.WILDCARD_KEY_ID))
+    _write(tmp_path, "unreadable.gpg", b"")
+    _write(tmp_path, "team/.gpg-id", b"me@example.com\nbob@example.com\n")
+    _write(tmp_path, "team/missing_bob.gpg", encrypted_to(NEW))
+    _write(tmp_path, "team/current.gpg", encrypted_to(BOB, NEW))
+    _write(tmp_path, "team/extra.gpg", encrypted_to(NEW, BOB, OLD))
+    _write(tmp_path, "team/web/old.gpg", encrypted_to(OLD))
+    return tmp_path
+
+
+class TestPlan:
+    """Tests for finding the entries that aren't encrypted to their .gpg-id"""
+
+    def test_finds_entries_with_other_recipients(self, store_home):
+        jobs = reencrypt.plan(store.scan_store(store_home), KEY_IDS.get)
+
+        assert [x.name for x in jobs] == [
+            "old",
+            "team/extra",
+            "team/missing_bob",
+            "team/web/old",
+        ]
+
+    def test_jobs_use_the_nearest_gpg_id(self, store_home):
+        jobs = {
+            x.name: x for x in reencrypt.plan(store.scan_store(store_home), KEY_IDS.get)
+        }
+
+        assert jobs["old"].gpg_ids == ("me@example.com",)
+        assert jobs["team/web/old"].gpg_ids == ("me@example.com", "bob@example.com")
+        assert jobs["team/web/old"].path == store_home / "team" / "web" / "old.gpg"
+
+    def test_each_gpg_id_is_resolved_once(self, store_home):
+        key_ids_for = mock.Mock(side_effect=KEY_IDS.get)
+
+        reencrypt.plan(store.scan_store(store_home), key_ids_for)
+
+        assert sorted(x.args[0] for x in key_ids_for.call_args_list) == [
+            "bob@example.com",
+            "me@example.com",
+        ]
+
+    def test_gpg_id_lines(self, store_home):
+        assert reencrypt.gpg_id_lines(store.scan_store(store_home)) == {
+            "me@example.com",
+            "bob@example.com",
+        }
+
+    def test_entries_of_unknown_keys_are_skipped(self, store_home):
+        key_ids = {"me@example.com": frozenset({NEW})}
+
+        jobs = reencrypt.plan(store.scan_store(store_home), key_ids.get)
+
+        assert [x.name for x in jobs] == ["old"]
+
+    def test_store_without_gpg_id(self, store_home):
+        (store_home / ".gpg-id").unlink()
+
+        jobs = reencrypt.plan(store.scan_store(store_home), KEY_IDS.get)
+
+        assert [x.name for x in jobs] == [
+            "team/extra",
+            "team/missing_bob",
+            "team/web/old",
+        ]
+
+    def test_reencrypted_entries_are_not_planned_again(self, store_home, encrypted_to):
+        root = store.scan_store(store_home)
+        _write(store_home, "old.gpg", encrypted_to(NEW))
+        store.refresh_store(root)
+
+        assert "old" not in [x.name for x in reencrypt.plan(root, KEY_IDS.get)]
+
+
+def _jobs(count: int) -> list[reencrypt.Job]:
+    return [
+        reencrypt.Job(f"e{i}", Path(f"/store/e{i}.gpg"), ("me@example.com",))
+        for i in range(count)
+    ]
+
+
+class TestRun:
+    """Tests for running re-encryption jobs and reporting progress"""
+
+    @pytest.fixture
+    def finished(self):
+        return []
+
+    @pytest.fixture
+    def reencrypt_many(self, finished):
+        def _reencrypt_many(jobs):
+            try:
+                for path, recipients in jobs:
+                    error = ValueError(path) if "fail" in path.name else None
+                    yield (path, recipients), error
+            finally:
+                finished.append(True)
+
+        return _reencrypt_many
+
+    def test_counts_results(self, reencrypt_many, finished):
+        jobs = _jobs(3) + [reencrypt.Job("fail", Path("fail.gpg"), ("me",))]
+
+        progress = reencrypt.run(jobs, reencrypt_many)
+
+        assert (progress.total, progress.done, progress.failed) == (4, 3, 1)
+        assert progress.finished is not None
+        assert finished == [True]
+
+    def test_reports_progress(self, reencrypt_many):
+        on_progress = mock.Mock()
+
+        with mock.patch.object(reencrypt, "PROGRESS_INTERVAL", 0):
+            reencrypt.run(_jobs(3), reencrypt_many, on_progress)
+
+        # After each job and once at the end
+        assert on_progress.call_count == 4
+        assert str(on_progress.call_args.args[0]).startswith(
+            "3/3 re-encrypted, 0 failed"
+        )
+
+    def test_stop_starts_no_more_jobs(self, reencrypt_many, finished):
+        stop = threading.Event()
+        stop.set()
+
+        progress = reencrypt.run(_jobs(5), reencrypt_many, stop=stop)
+
+        assert progress.done == 1
+        assert finished == [True]
+
+    def test_no_jobs(self, reencrypt_many):
+        progress = reencrypt.run([], reencrypt_many)
+
+        assert (progress.total, progress.done, progress.rate) == (0, 0, 0.0)
@@ -0,0 +1,102 @@
+import pytest
+
+from sb_pass.model.search import SearchIndex, merge_ranked
+
+_NAMES = [
+    "web/github",
+    "web/gitlab",
+    "work/github-enterprise",
+    "email/gmail",
+    "bank/checking",
+    "bank/savings",
+    "Personal/Netflix",
+]
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(_NAMES)
+
+
+def test_len_and_contains(index):
+    assert len(index) == len(_NAMES)
+    assert "web/github" in index
+    assert "web/missing" not in index
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("github", ["web/github", "work/github-enterprise"]),
+        ("bank", ["bank/savings", "bank/checking"]),
+        ("git web", ["web/github", "web/gitlab"]),
+        ("NETFLIX", ["Personal/Netflix"]),
+        ("b/git", ["web/github", "web/gitlab"]),
+    ],
+)
+def test_substring_matches(index, query, expected):
+    assert index.search(query) == expected
+
+
+def test_exact_entry_names_rank_first(index):
+    assert index.search("github")[0] == "web/github"
+
+
+def test_short_terms_match_component_starts(index):
+    assert index.search("gm") == ["email/gmail"]
+    assert index.search("ma") == []
+
+
+def test_fuzzy_matches_tolerate_typos(index):
+    assert index.search("githbu")[:2] == ["web/github", "work/github-enterprise"]
+
+
+def test_no_matches(index):
+    assert index.search("zzzz") == []
+    assert index.search("   ") == []
+
+
+def test_limit(index):
+    assert index.search("g", limit=2) == ["web/github", "web/gitlab"]
+
+
+def test_update_adds_and_removes_names(index):
+    index.update(added=["web/bitbucket"], removed=["web/github"])
+
+    assert index.search("bitbucket") == ["web/bitbucket"]
+    assert index.search("github") == ["work/github-enterprise"]
+    assert "web/github" not in index
+
+
+def test_readding_removed_name(index):
+    index.update(removed=["web/github"])
+    index.update(added=["web/github"])
+
+    assert index.search("github") == ["web/github", "work/github-enterprise"]
+
+
+def test_compacts_after_many_removals(index):
+    index.update(removed=_NAMES[:4])
+
+    assert len(index._names) == len(_NAMES) - 4
+    assert sorted(index) == sorted(_NAMES[4:])
+    assert index.search("bank") == ["bank/savings", "bank/checking"]
+
+
+def test_merge_ranked_orders_across_indexes():
+    first = SearchIndex(["web/github", "web/gitlab"])
+    second = SearchIndex(["github", "git/tools"])
+
+    results = [first.ranked_search("github"), second.ranked_search("github")]
+
+    assert merge_ranked(results, 2) == ["github", "web/github"]
+
+
+def test_merge_ranked_drops_fuzzy_matches_if_any_match():
+    first = SearchIndex(["web/github"])
+    second = SearchIndex(["web/githug"])
+
+    results = [first.ranked_search("github"), second.ranked_search("github")]
+
+    assert second.ranked_search("github")
+    assert merge_ranked(results, 20) == ["web/github"]
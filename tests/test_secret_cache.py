@@ -0,0 +1,130 @@
+import os
+
+import pytest
+
+from sb_pass.secret_cache import SecretCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def cache(clock):
+    return SecretCache(ttl=30, max_entries=2, clock=clock)
+
+
+@pytest.fixture
+def entry(tmp_path):
+    path = tmp_path / "web" / "github.gpg"
+    path.parent.mkdir()
+    path.write_bytes(b"ciphertext")
+    return path
+
+
+def test_disabled_by_default(entry):
+    cache = SecretCache()
+
+    cache.put(entry, "hunter2")
+
+    assert not cache.enabled
+    assert cache.get(entry) is None
+
+
+def test_round_trip(cache, entry):
+    cache.put(entry, "hunter2\n")
+
+    assert cache.get(entry) == "hunter2\n"
+
+
+def test_contains(cache, clock, entry):
+    cache.put(entry, "hunter2")
+
+    assert entry in cache
+    clock.now += 30
+    assert entry not in cache
+
+
+def test_expired_secrets_are_zeroed(cache, clock, entry):
+    cache.put(entry, "hunter2")
+    buffer = cache._secrets[str(entry)].plaintext
+
+    clock.now += 30
+
+    assert cache.get(entry) is None
+    assert buffer == bytearray(7)
+    assert len(cache) == 0
+
+
+def test_changed_file_is_a_miss(cache, entry):
+    cache.put(entry, "hunter2")
+    entry.write_bytes(b"new ciphertext")
+
+    assert cache.get(entry) is None
+
+
+def test_replaced_file_is_a_miss(cache, entry):
+    cache.put(entry, "hunter2")
+    stat = entry.stat()
+    replacement = entry.with_name("tmp.gpg")
+    replacement.write_bytes(b"ciphertext")
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, entry)
+
+    assert cache.get(entry) is None
+
+
+def test_least_recently_used_is_evicted(cache, tmp_path):
+    paths = [tmp_path / f"{x}.gpg" for x in "abc"]
+    for path in paths:
+        path.touch()
+    cache.put(paths[0], "a")
+    cache.put(paths[1], "b")
+    cache.get(paths[0])
+
+    cache.put(paths[2], "c")
+
+    assert [cache.get(x) for x in paths] == ["a", None, "c"]
+
+
+def test_invalidate_directory(cache, entry, tmp_path):
+    other = tmp_path / "webmail.gpg"
+    other.touch()
+    cache.put(entry, "hunter2")
+    cache.put(other, "letmein")
+
+    cache.invalidate(entry.parent)
+
+    assert cache.get(entry) is None
+    assert cache.get(other) == "letmein"
+
+
+def test_expire(cache, clock, entry, tmp_path):
+    other = tmp_path / "other.gpg"
+    other.touch()
+    cache.put(entry, "hunter2")
+    clock.now += 20
+    cache.put(other, "letmein")
+    clock.now += 15
+
+    assert cache.expire() == 1
+    assert len(cache) == 1
+
+
+def test_clear_zeroes_every_secret(cache, entry):
+    cache.put(entry, "hunter2")
+    buffer = cache._secrets[str(entry)].plaintext
+
+    cache.clear()
+
+    assert buffer == bytearray(7)
+    assert len(cache) == 0
@@ -0,0 +1,39 @@
+"""Guard the app's startup cost, building its menu with rumps stubbed out"""
+import pytest
+
+from benchmarks.bench_startup import run_startup
+from benchmarks.synthetic import create_store
+
+# Generous so a slow CI machine doesn't fail, but far below a noticeable delay
+MAX_IMPORT_MS = 1000
+MAX_MENU_MS = 1000
+# Only needed once a password is decrypted
+DEFERRED_MODULES = ["gnupg", "pyperclip", "gpg", "multiprocessing", "ctypes.util"]
+
+
+@pytest.fixture(scope="module")
+def startup(tmp_path_factory):
+    home = tmp_path_factory.mktemp("home")
+    create_store(home / ".password-store", 1000)
+    return run_startup(home)
+
+
+@pytest.mark.parametrize("module", DEFERRED_MODULES)
+def test_module_not_imported_at_startup(startup, module):
+    result, import_times = startup
+
+    assert module not in result["modules"]
+    assert module not in import_times
+
+
+def test_gpg_binary_not_searched_for_at_startup(startup):
+    result, _ = startup
+
+    assert not result["probed_gpg"]
+
+
+def test_startup_time(startup):
+    result, _ = startup
+
+    assert result["import_ms"] < MAX_IMPORT_MS
+    assert result["menu_ms"] < MAX_MENU_MS
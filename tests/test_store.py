@@ -0,0 +1,382 @@
+import os
+import subprocess
+import zlib
+from unittest import mock
+
+import pytest
+
+from sb_pass.model import store
+
+
+@pytest.fixture
+def store_home(tmp_path, touch):
+    touch(
+        tmp_path,
+        "b.gpg",
+        "a.gpg",
+        "notes.txt",
+        "web/github.gpg",
+        "web/gitlab.gpg",
+        "email/work.gpg",
+        ".git/config",
+        ".hidden/secret.gpg",
+    )
+    return tmp_path
+
+
+def test_scan_store_keeps_only_gpg_files_and_visible_dirs(store_home):
+    root = store.scan_store(store_home)
+
+    assert [x.name for x in root.entries] == ["a", "b"]
+    assert [x.name for x in root.dirs] == ["email", "web"]
+    assert len(root) == 5
+
+
+def test_scan_store_entries_have_full_paths(store_home):
+    root = store.scan_store(store_home)
+
+    web = root.dirs[1]
+    assert web.path == str(store_home / "web")
+    assert [x.path for x in web.entries] == [
+        str(store_home / "web" / "github.gpg"),
+        str(store_home / "web" / "gitlab.gpg"),
+    ]
+
+
+def test_scan_store_shares_repeated_names(tmp_path, touch):
+    touch(tmp_path, "a/github.gpg", "b/github.gpg")
+
+    root = store.scan_store(tmp_path)
+
+    assert root.dirs[0].entries[0].name is root.dirs[1].entries[0].name
+
+
+def test_scan_store_sorts_on_file_name(tmp_path, touch):
+    """Entries are sorted on their file name like the previous Path sort"""
+    touch(tmp_path, "a.gpg", "a-b.gpg", "a.b.gpg")
+
+    root = store.scan_store(tmp_path)
+
+    assert [x.name for x in root.entries] == ["a-b", "a.b", "a"]
+
+
+def test_scan_store_ignores_directories_named_like_entries(tmp_path, touch):
+    (tmp_path / "dir.gpg").mkdir()
+    touch(tmp_path, "dir.gpg/inner.gpg")
+
+    root = store.scan_store(tmp_path)
+
+    assert root.entries == []
+    assert [x.name for x in root.dirs] == ["dir.gpg"]
+
+
+def test_scan_store_missing_root_is_empty(tmp_path):
+    root = store.scan_store(tmp_path / "missing")
+
+    assert root.entries == []
+    assert root.dirs == []
+
+
+def test_find_entry(store_home):
+    root = store.scan_store(store_home)
+
+    assert store.find_entry(root, "web/github") is root.dirs[1].entries[0]
+    assert store.find_entry(root, "a") is root.entries[0]
+    assert store.find_entry(root, "web") is None
+    assert store.find_entry(root, "missing/github") is None
+
+
+@pytest.fixture
+def scanned(store_home, settle):
+    settle(store_home)
+    return store.scan_store(store_home)
+
+
+def _summary(changes: list[store.StoreChange]) -> set[tuple[str, str, bool]]:
+    return {(x.parent.name, x.node.name, x.added) for x in changes}
+
+
+class TestRefreshStore:
+    """Tests for incrementally refreshing a scanned store"""
+
+    def test_no_changes(self, scanned):
+        assert store.refresh_store(scanned) == []
+
+    def test_added_and_removed_entries(self, store_home, scanned, touch):
+        (store_home / "web" / "github.gpg").unlink()
+        touch(store_home, "web/bitbucket.gpg", "c.gpg")
+
+        changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {
+            ("web", "github", False),
+            ("web", "bitbucket", True),
+            (store_home.name, "c", True),
+        }
+        assert [x.name for x in scanned.entries] == ["a", "b", "c"]
+        assert [x.name for x in scanned.dirs[1].entries] == ["bitbucket", "gitlab"]
+
+    def test_added_and_removed_directories(self, store_home, scanned, touch):
+        touch(store_home, "bank/checking.gpg")
+        (store_home / "email" / "work.gpg").unlink()
+        (store_home / "email").rmdir()
+
+        changes = store.refresh_store(scanned)
+
+        assert _summary(changes) == {
+            (store_home.name, "bank", True),
+            (store_home.name, "email", False),
+        }
+        assert [x.name for x in scanned.dirs] == ["bank", "web"]
+        assert [x.name for x in scanned.dirs[0].entries] == ["checking"]
+
+    def test_unchanged_directories_are_not_listed(self, store_home, scanned, touch):
+        touch(store_home, "web/bitbucket.gpg")
+
+        with mock.patch("sb_pass.model.store.os.scandir", wraps=os.scandir) as scandir:
+            store.refresh_store(scanned)
+
+        assert [x.args[0] for x in scandir.call_args_list] == [str(store_home / "web")]
+
+    def test_replaced_entries_relist_their_directory(self, store_home, scanned):
+        # As git checkout and pull do, rather than rewriting the file in place
+        (store_home / "web" / "github.gpg").unlink()
+        (store_home / "web" / "github.gpg").write_text("pulled")
+
+        with mock.patch("sb_pass.model.store.os.scandir", wraps=os.scandir) as scandir:
+            assert store.refresh_store(scanned) == []
+
+        assert [x.args[0] for x in scandir.call_args_list] == [str(store_home / "web")]
+
+    def test_unchanged_directories_keep_their_nodes(self, store_home, scanned, touch):
+        web = scanned.dirs[1]
+        touch(store_home, "new.gpg")
+
+        store.refresh_store(scanned)
+
+        assert scanned.dirs[1] is web
+
+    def test_recently_modified_directories_are_relisted(self, store_home):
+        root = store.scan_store(store_home)
+
+        with mock.patch("sb_pass.model.store.os.scandir", wraps=os.scandir) as scandir:
+            store.refresh_store(root)
+
+        assert scandir.call_count == 3
+
+
+class TestStoreIndex:
+    """Tests for saving and loading the index"""
+
+    @pytest.fixture
+    def index_path(self, tmp_path_factory):
+        return tmp_path_factory.mktemp("index") / "store_index.bin"
+
+    def test_round_trip(self, store_home, scanned, index_path):
+        store.save_index(scanned, index_path)
+
+        assert store.load_index(index_path, store_home) == scanned
+
+    def test_loaded_entries_have_full_paths(self, store_home, scanned, index_path):
+        store.save_index(scanned, index_path)
+
+        loaded = store.load_index(index_path, store_home)
+
+        assert loaded.dirs[1].entries[0].path == str(store_home / "web" / "github.gpg")
+
+    def test_loaded_index_is_refreshed_incrementally(
+        self,
+        store_home,
+        scanned,
+        index_path,
+        touch,
+    ):
+        store.save_index(scanned, index_path)
+        touch(store_home, "web/bitbucket.gpg")
+        loaded = store.load_index(index_path, store_home)
+
+        with mock.patch("sb_pass.model.store.os.scandir", wraps=os.scandir) as scandir:
+            changes = store.refresh_store(loaded)
+
+        assert _summary(changes) == {("web", "bitbucket", True)}
+        assert scandir.call_count == 1
+
+    def test_missing_index(self, store_home, index_path):
+        assert store.load_index(index_path, store_home) is None
+
+    def test_index_for_another_store(self, store_home, scanned, index_path):
+        store.save_index(scanned, index_path)
+
+        assert store.load_index(index_path, store_home / "web") is None
+
+    @pytest.mark.parametrize(
+        "corrupt",
+        [
+            lambda data: b"",
+            lambda data: data[:10],
+            lambda data: b"XXXX" + data[4:],
+            lambda data: data[:4]
+            + (store.INDEX_VERSION + 1).to_bytes(2, "big")
+            + data[6:],
+            lambda data: data[:-1] + bytes([data[-1] ^ 0xFF]),
+        ],
+        ids=["empty", "truncated", "magic", "version", "checksum"],
+    )
+    def test_corrupt_index_is_ignored(self, store_home, scanned, index_path, corrupt):
+        store.save_index(scanned, index_path)
+        index_path.write_bytes(corrupt(index_path.read_bytes()))
+
+        assert store.load_index(index_path, store_home) is None
+
+    def test_invalid_tree_is_ignored(self, store_home, index_path):
+        payload = zlib.compress(b'{"root": "/", "tree": ["a", "b", [], []]}')
+        header = store._INDEX_HEADER.pack(
+            store._INDEX_MAGIC, store.INDEX_VERSION, zlib.crc32(payload)
+        )
+        index_path.write_bytes(header + payload)
+
+        assert store.load_index(index_path, "/") is None
+
+
+def test_entry_names(store_home, scanned):
+    assert sorted(store.entry_names(scanned)) == [
+        "a",
+        "b",
+        "email/work",
+        "web/github",
+        "web/gitlab",
+    ]
+
+
+def test_entry_names_of_node(scanned):
+    web = scanned.dirs[1]
+
+    assert sorted(store.entry_names(scanned, web)) == ["web/github", "web/gitlab"]
+    assert list(store.entry_names(scanned, web.entries[0])) == ["web/github"]
+
+
+def test_entry_name_and_path_round_trip(store_home):
+    path = str(store_home / "web" / "github.gpg")
+
+    assert store.entry_name(store_home, path) == os.path.join("web", "github")
+    assert store.entry_path(store_home, store.entry_name(store_home, path)) == path
+
+
+class TestRecipients:
+    """Tests for the recipients and .gpg-id files recorded in the index"""
+
+    @pytest.fixture
+    def recipient_home(self, tmp_path, encrypted_to, settle, touch):
+        touch(tmp_path, "web/github.gpg", "web/gitlab.gpg", "web/work/jira.gpg")
+        (tmp_path / ".gpg-id").write_text("ME@example.com\n")
+        (tmp_path / "web" / "work" / ".gpg-id").write_text(
+            "# the team\nAAAAAAAAAAAAAAAA\nBBBBBBBBBBBBBBBB  # Bob\n\n"
+        )
+        (tmp_path / "web" / "github.gpg").write_bytes(encrypted_to("0123456789ABCDEF"))
+        (tmp_path / "web" / "gitlab.gpg").write_bytes(encrypted_to("0123456789ABCDEF"))
+        (tmp_path / "web" / "work" / "jira.gpg").write_bytes(
+            encrypted_to("AAAAAAAAAAAAAAAA", "BBBBBBBBBBBBBBBB")
+        )
+        settle(tmp_path)
+        return tmp_path
+
+    def test_scan_reads_recipients(self, recipient_home):
+        root = store.scan_store(recipient_home)
+
+        web = root.dirs[0]
+        assert web.entries[0].recipients == ("0123456789ABCDEF",)
+        assert web.entries[0].recipients is web.entries[1].recipients
+        assert web.dirs[0].entries[0].recipients == (
+            "AAAAAAAAAAAAAAAA",
+            "BBBBBBBBBBBBBBBB",
+        )
+
+    def test_unreadable_recipients_are_none(self, scanned):
+        assert scanned.entries[0].recipients is None
+
+    def test_gpg_ids_from_nearest_gpg_id_file(self, recipient_home):
+        root = store.scan_store(recipient_home)
+        web = root.dirs[0]
+
+        assert root.gpg_ids == ("ME@example.com",)
+        assert web.gpg_ids is None
+        assert store.gpg_ids(root, web.entries[0]) == ("ME@example.com",)
+        assert store.gpg_ids(root, web.dirs[0].entries[0]) == (
+            "AAAAAAAAAAAAAAAA",
+            "BBBBBBBBBBBBBBBB",
+        )
+        assert store.gpg_ids(root, root) == ("ME@example.com",)
+
+    def test_index_round_trip(self, recipient_home, tmp_path_factory):
+        index_path = tmp_path_factory.mktemp("index") / "store_index.bin"
+        root = store.scan_store(recipient_home)
+
+        store.save_index(root, index_path)
+        loaded = store.load_index(index_path, recipient_home)
+
+        assert loaded == root
+        assert loaded.dirs[0].dirs[0].gpg_ids == root.dirs[0].dirs[0].gpg_ids
+        assert (
+            loaded.dirs[0].entries[0].recipients is root.dirs[0].entries[0].recipients
+        )
+
+    def test_refresh_reads_reencrypted_entries(self, recipient_home, encrypted_to):
+        root = store.scan_store(recipient_home)
+        github = root.dirs[0].entries[0]
+        # pass init encrypts to a temporary file and moves it over the entry
+        tmp = recipient_home / "web" / "github.gpg.tmp"
+        tmp.write_bytes(encrypted_to("FEDCBA9876543210"))
+        tmp.replace(recipient_home / "web" / "github.gpg")
+
+        assert store.refresh_store(root) == []
+        assert root.dirs[0].entries[0] is github
+        assert github.recipients == ("FEDCBA9876543210",)
+
+    def test_refresh_reads_gpg_id_rewritten_in_place(self, recipient_home):
+        root = store.scan_store(recipient_home)
+        # As pass init does, which leaves the directory's mtime alone
+        (recipient_home / ".gpg-id").write_text("alice@example.com\n")
+        (recipient_home / "web" / "work" / ".gpg-id").write_text("bob@example.com\n")
+
+        store.refresh_store(root)
+
+        assert root.gpg_ids == ("alice@example.com",)
+        assert root.dirs[0].dirs[0].gpg_ids == ("bob@example.com",)
+
+    def test_unchanged_gpg_id_is_not_read_again(self, recipient_home):
+        root = store.scan_store(recipient_home)
+
+        with mock.patch("sb_pass.model.store.os.scandir") as scandir:
+            assert store.refresh_store(root) == []
+
+        scandir.assert_not_called()
+
+    def test_can_decrypt(self, recipient_home):
+        root = store.scan_store(recipient_home)
+        github, jira = root.dirs[0].entries[0], root.dirs[0].dirs[0].entries[0]
+
+        assert store.can_decrypt(github, {"0123456789ABCDEF"})
+        assert not store.can_decrypt(jira, {"0123456789ABCDEF"})
+        assert store.can_decrypt(jira, {"BBBBBBBBBBBBBBBB"})
+
+    def test_passphrase_only_entries_can_be_decrypted(
+        self, gpg_binary, gpg_home, tmp_path
+    ):
+        subprocess.run(
+            [gpg_binary, "--homedir", gpg_home, "--batch", "--pinentry-mode"]
+            + ["loopback", "--passphrase", "x", "-o", tmp_path / "a.gpg", "-c"],
+            input=b"hunter2\n",
+            check=True,
+            capture_output=True,
+        )
+        entry = store.scan_store(tmp_path).entries[0]
+
+        assert entry.recipients is None
+        assert store.can_decrypt(entry, {"0123456789ABCDEF"})
+
+    def test_can_decrypt_unknown_or_hidden_recipients(self, scanned):
+        entry = scanned.entries[0]
+
+        assert store.can_decrypt(entry, set())
+        entry.recipients = ("0" * 16,)
+        assert store.can_decrypt(entry, set())
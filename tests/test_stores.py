@@ -0,0 +1,132 @@
+from unittest import mock
+
+import pytest
+
+from sb_pass.model import store, stores
+
+
+@pytest.fixture
+def password_store(tmp_path, store_home):
+    return stores.PasswordStore(
+        "personal", str(store_home), stores.index_path(tmp_path, str(store_home))
+    )
+
+
+def test_index_path_differs_per_store(tmp_path):
+    first = stores.index_path(tmp_path, "/stores/a")
+
+    assert first != stores.index_path(tmp_path, "/stores/b")
+    assert first == stores.index_path(tmp_path, "/stores/a/")
+    assert first.parent == tmp_path
+
+
+def test_not_loaded(password_store):
+    assert password_store.root is None
+    assert password_store.refresh() == []
+    assert password_store.search("git") == []
+
+
+def test_load_scans_then_uses_cached_index(password_store, store_home):
+    assert not password_store.load()
+    password_store.save_index()
+
+    cached = stores.PasswordStore(
+        "personal", str(store_home), password_store.index_path
+    )
+
+    assert cached.load()
+    assert sorted(store.entry_names(cached.root)) == [
+        "a",
+        "c",
+        "web/github",
+        "web/gitlab",
+    ]
+
+
+def test_contains_looks_up_the_tree(password_store):
+    assert "web/github" not in password_store
+    password_store.load()
+
+    assert "web/github" in password_store
+    assert "a" in password_store
+    assert "web" not in password_store
+    assert "web/missing" not in password_store
+    assert "../personal/a" not in password_store
+    # Answered without building the search index
+    assert password_store.search_index is None
+
+
+def test_refresh_updates_search_index(password_store, store_home, touch):
+    password_store.load()
+    password_store.build_search_index()
+    touch(store_home, "web/bitbucket.gpg")
+
+    changes = password_store.refresh()
+
+    assert [x.node.name for x in changes] == ["bitbucket"]
+    assert password_store.search("bitbucket") == ["web/bitbucket"]
+
+
+def test_refresh_queues_changes(password_store, store_home, touch):
+    password_store.load()
+    touch(store_home, "web/bitbucket.gpg")
+
+    changes = password_store.refresh(queue_changes=True)
+
+    assert password_store.drain_pending() == [changes]
+    assert password_store.refresh(queue_changes=True) == []
+    assert password_store.drain_pending() == []
+
+
+def test_refresh_reads_store_without_lock(password_store, store_home, touch):
+    password_store.load()
+    touch(store_home, "web/bitbucket.gpg")
+    locked = []
+
+    def read_update(root):
+        locked.append(password_store.lock.locked())
+        return update(root)
+
+    update = store.read_update
+    with mock.patch.object(store, "read_update", side_effect=read_update):
+        password_store.refresh()
+
+    assert locked == [False]
+
+
+def test_drain_pending(password_store):
+    password_store.pending.put(None)
+    password_store.pending.put([])
+
+    assert password_store.drain_pending() == [None, []]
+    assert password_store.drain_pending() == []
+
+
+def test_store_for_path_prefers_innermost(tmp_path):
+    outer = stores.PasswordStore("outer", "/stores", tmp_path / "a.bin")
+    inner = stores.PasswordStore("inner", "/stores/team", tmp_path / "b.bin")
+
+    assert stores.store_for_path([outer, inner], "/stores/team/x.gpg") is inner
+    assert stores.store_for_path([outer, inner], "/stores/x.gpg") is outer
+    assert stores.store_for_path([outer, inner], "/storesx/x.gpg") is None
+
+
+def test_can_decrypt_until_secret_keys_are_known(password_store):
+    password_store.load()
+    entry = password_store.root.entries[0]
+    entry.recipients = ("0123456789ABCDEF",)
+
+    assert password_store.can_decrypt(entry)
+    password_store.set_secret_key_ids(frozenset({"FEDCBA9876543210"}))
+    assert not password_store.can_decrypt(entry)
+    password_store.set_secret_key_ids(frozenset({"0123456789ABCDEF"}))
+    assert password_store.can_decrypt(entry)
+
+
+def test_secret_keys_changed(password_store):
+    password_store.set_secret_key_ids(frozenset({"0123456789ABCDEF"}))
+    assert password_store.secret_keys_changed
+
+    password_store.secret_keys_changed = False
+    password_store.set_secret_key_ids(frozenset({"0123456789ABCDEF"}))
+    assert not password_store.secret_keys_changed
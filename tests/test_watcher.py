@@ -0,0 +1,155 @@
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from sb_pass import watcher
+from sb_pass.model import store
+
+_BACKENDS = [watcher.PollingBackend]
+if sys.platform.startswith("linux"):
+    _BACKENDS.append(watcher.InotifyBackend)
+
+
+def _names(root: store.StoreDir) -> set[str]:
+    names = {x.name for x in root.entries}
+    for subdir in root.dirs:
+        names |= {f"{subdir.name}/{x}" for x in _names(subdir)}
+    return names
+
+
+class _Recorder:
+    """Refresh a scanned store whenever the watcher calls back"""
+
+    def __init__(self, root: Path) -> None:
+        self.tree = store.scan_store(root)
+        self.calls = 0
+        self._changed = threading.Event()
+
+    def __call__(self) -> None:
+        store.refresh_store(self.tree)
+        self.calls += 1
+        self._changed.set()
+
+    def wait(self, timeout: float = 5) -> bool:
+        changed = self._changed.wait(timeout)
+        self._changed.clear()
+        return changed
+
+
+@pytest.fixture
+def store_home(tmp_path):
+    (tmp_path / "web").mkdir()
+    (tmp_path / "web" / "github.gpg").touch()
+    (tmp_path / "a.gpg").touch()
+    return tmp_path
+
+
+@pytest.fixture(params=_BACKENDS, ids=lambda x: x.__name__)
+def watched(request, store_home):
+    recorder = _Recorder(store_home)
+    store_watcher = watcher.StoreWatcher(
+        str(store_home), recorder, request.param, interval=0.05, debounce=0.2
+    )
+    store_watcher.start()
+    assert store_watcher.wait_started(timeout=5)
+    yield recorder
+    store_watcher.stop()
+
+
+def test_created_entries_are_added(store_home, watched):
+    (store_home / "b.gpg").touch()
+
+    assert watched.wait()
+    assert _names(watched.tree) == {"a", "b", "web/github"}
+
+
+def test_renamed_entries_are_updated(store_home, watched):
+    (store_home / "web" / "github.gpg").rename(store_home / "web" / "gitlab.gpg")
+
+    assert watched.wait()
+    assert _names(watched.tree) == {"a", "web/gitlab"}
+
+
+def test_deleted_entries_are_removed(store_home, watched):
+    (store_home / "a.gpg").unlink()
+
+    assert watched.wait()
+    assert _names(watched.tree) == {"web/github"}
+
+
+def test_entries_in_new_directories_are_watched(store_home, watched):
+    (store_home / "bank").mkdir()
+    assert watched.wait()
+
+    (store_home / "bank" / "checking.gpg").touch()
+
+    assert watched.wait()
+    assert _names(watched.tree) == {"a", "bank/checking", "web/github"}
+
+
+def test_bursts_are_coalesced(store_home, watched):
+    for i in range(100):
+        (store_home / "web" / f"entry{i}.gpg").touch()
+
+    assert watched.wait()
+    assert not watched.wait(timeout=0.5)
+    assert watched.calls == 1
+    assert len(_names(watched.tree)) == 102
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Requires inotify")
+def test_non_gpg_files_are_ignored(tmp_path):
+    backend = watcher.InotifyBackend(str(tmp_path))
+    try:
+        (tmp_path / "notes.txt").touch()
+        (tmp_path / ".hidden").mkdir()
+
+        assert not backend.wait(0.1)
+    finally:
+        backend.close()
+
+
+@pytest.mark.parametrize("backend_type", _BACKENDS, ids=lambda x: x.__name__)
+def test_gpg_id_changes_are_seen(tmp_path, backend_type):
+    backend = backend_type(str(tmp_path))
+    try:
+        (tmp_path / ".gpg-id").write_text("me@example.com\n")
+
+        assert backend.wait(0.1)
+    finally:
+        backend.close()
+
+
+@pytest.mark.parametrize("backend_type", _BACKENDS, ids=lambda x: x.__name__)
+def test_gpg_id_rewritten_in_place_is_seen(tmp_path, backend_type):
+    gpg_id = tmp_path / ".gpg-id"
+    gpg_id.write_text("me@example.com\n")
+    os.utime(gpg_id, ns=(1_000_000_000, 1_000_000_000))
+    backend = backend_type(str(tmp_path))
+    try:
+        assert not backend.wait(0.1)
+        with open(gpg_id, "r+") as fout:
+            fout.write("you")
+
+        assert backend.wait(0.1)
+    finally:
+        backend.close()
+
+
+def test_backends_must_implement_wait():
+    class Backend(watcher.WatchBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Backend()
+
+
+def test_polling_backend_detects_changes_within_the_same_mtime_tick(tmp_path):
+    backend = watcher.PollingBackend(str(tmp_path))
+    (tmp_path / "a.gpg").touch()
+
+    assert backend.wait(0)
+    assert not backend.wait(0)